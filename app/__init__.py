@@ -3,6 +3,8 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from config import Config
+from app.cache import cache
+from app.routing import RoutingSession
 
 from sqlalchemy import MetaData
 
@@ -15,7 +17,7 @@ convention = {
 }
 
 metadata = MetaData(naming_convention=convention)
-db = SQLAlchemy(metadata=metadata)
+db = SQLAlchemy(metadata=metadata, session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 migrate = Migrate()
 
@@ -23,9 +25,16 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
+    # Engine profile: pool sizing before the engine is created, SQLite pragmas after.
+    # Read replicas get engines with the same pool settings and pragmas; GET requests read from them.
+    from app import engine, routing
+    engine.configure(app)
     db.init_app(app)
+    engine.init_app(app)
+    routing.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
+    cache.init_app(app)
 
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
@@ -36,11 +45,74 @@ def create_app(config_class=Config):
     from app.blueprints.librarian import librarian_bp
     from app.blueprints.user import user_bp
     from app.blueprints.main import main_bp
+    from app.blueprints.covers import covers_bp
 
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(librarian_bp, url_prefix='/librarian')
     app.register_blueprint(user_bp, url_prefix='/user')
     app.register_blueprint(main_bp) # Root routes
+    app.register_blueprint(covers_bp, url_prefix='/covers')
+
+    # Full-text search index (also hooks Book table creation)
+    from app.search import search_cli
+    app.cli.add_command(search_cli)
+
+    from app.analytics import sales_cli
+    app.cli.add_command(sales_cli)
+
+    # Dashboard counters (also hooks session flushes)
+    from app.stats import stats_cli
+    app.cli.add_command(stats_cli)
+
+    # Loan maintenance jobs (overdue marking, fines)
+    from app.loans import loans_cli
+    app.cli.add_command(loans_cli)
+
+    # Bulk catalogue import
+    from app.importer import catalog_cli
+    app.cli.add_command(catalog_cli)
+
+    # Streaming table exports
+    from app.export import export_cli
+    app.cli.add_command(export_cli)
+
+    # Wallet ledger (accounts, snapshots, verification)
+    from app.wallet import wallet_cli
+    app.cli.add_command(wallet_cli)
+
+    # Review rating aggregates
+    from app.ratings import reviews_cli
+    app.cli.add_command(reviews_cli)
+
+    # Offline similar-books table
+    from app.neighbors import neighbors_cli
+    app.cli.add_command(neighbors_cli)
+
+    # Offline personal recommendations
+    from app.recommendations import recommendations_cli
+    app.cli.add_command(recommendations_cli)
+
+    # Local cover images (also hooks Book flushes); templates link them with cover_url()
+    from app.covers import covers_cli, cover_url
+    app.cli.add_command(covers_cli)
+    app.add_template_global(cover_url)
+
+    # Static assets: fingerprinted URLs, precompressed files, compressed HTML
+    from app import assets
+    assets.init_app(app)
+    app.cli.add_command(assets.assets_cli)
+
+    # Read replica health
+    from app.routing import replicas_cli
+    app.cli.add_command(replicas_cli)
+
+    # Per-request SQL profiler (Server-Timing, /admin/perf, slow-query log)
+    from app import profiler
+    profiler.init_app(app)
+
+    # N+1 detector (debug mode / DETECT_LAZY_LOADS)
+    from app import eager
+    eager.init_app(app)
 
     return app
@@ -0,0 +1,113 @@
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from app.models import Book, SalesRollup, Transaction, User
+
+# Sales analytics read from SalesRollup, one row per (day, category, seller)
+# bucket. buy_book adds to the matching bucket in the same DB transaction as
+# the sale, so reports cost O(buckets) instead of O(sales).
+
+sales_cli = AppGroup('sales', help='Sales analytics maintenance.')
+
+BREAKDOWNS = ('day', 'week', 'category', 'seller')
+
+
+def _upsert(values, increments):
+    """INSERT ... ON CONFLICT (bucket) DO UPDATE adding `increments` to the existing row."""
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert(SalesRollup).values(**values, **increments)
+    return stmt.on_conflict_do_update(
+        index_elements=['day', 'category', 'seller_id'],
+        set_={k: getattr(SalesRollup, k) + getattr(stmt.excluded, k) for k in increments},
+    )
+
+
+def record_sale(book, amount, when=None):
+    """Add one sale to its rollup bucket. Runs inside the caller's transaction."""
+    when = when or datetime.utcnow()
+    db.session.execute(_upsert(
+        {'day': when.date(), 'category': book.category or '', 'seller_id': book.seller_id or 0},
+        {'sales_count': 1, 'revenue': amount},
+    ))
+
+
+def _completed_sales():
+    return (Transaction.transaction_type == 'purchase', Transaction.status == 'completed')
+
+
+def _day(column):
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return db.func.date(column)
+    return db.cast(column, db.Date)
+
+
+def _week(column):
+    # Monday of the column's week
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return db.func.date(column, 'weekday 0', '-6 days')
+    return db.cast(db.func.date_trunc('week', column), db.Date)
+
+
+def rebuild_rollup():
+    """Recompute every bucket from the transaction table with one INSERT ... SELECT."""
+    day = _day(Transaction.issued_date)
+    category = db.func.coalesce(Book.category, '')
+    seller = db.func.coalesce(Book.seller_id, 0)
+    source = (db.select(day, category, seller, db.func.count(Transaction.id), db.func.sum(Transaction.amount))
+              .join(Book, Book.id == Transaction.book_id)
+              .where(*_completed_sales())
+              .group_by(day, category, seller))
+    db.session.execute(db.delete(SalesRollup))
+    db.session.execute(db.insert(SalesRollup).from_select(
+        ['day', 'category', 'seller_id', 'sales_count', 'revenue'], source))
+    db.session.commit()
+
+
+def total_revenue():
+    return db.session.scalar(db.select(db.func.coalesce(db.func.sum(SalesRollup.revenue), 0.0)))
+
+
+def sales_breakdown(by, start=None, end=None):
+    """Sales count and revenue grouped by day, week, category or seller, within [start, end]."""
+    if by == 'day':
+        key = SalesRollup.day
+    elif by == 'week':
+        key = _week(SalesRollup.day)
+    elif by == 'category':
+        key = SalesRollup.category
+    elif by == 'seller':
+        key = SalesRollup.seller_id
+    else:
+        raise ValueError(f'Unknown breakdown: {by!r}')
+
+    stmt = db.select(key.label('bucket'),
+                     db.func.sum(SalesRollup.sales_count).label('sales'),
+                     db.func.sum(SalesRollup.revenue).label('revenue'))
+    if by == 'seller':
+        stmt = stmt.add_columns(User.username).outerjoin(User, User.id == SalesRollup.seller_id).group_by(key, User.username)
+    else:
+        stmt = stmt.group_by(key)
+    if start:
+        stmt = stmt.where(SalesRollup.day >= start)
+    if end:
+        stmt = stmt.where(SalesRollup.day <= end)
+
+    rows = []
+    for row in db.session.execute(stmt.order_by(key)):
+        entry = {'bucket': str(row.bucket), 'sales': int(row.sales), 'revenue': round(row.revenue, 2)}
+        if by == 'seller':
+            entry['seller'] = row.username or 'Library'
+        rows.append(entry)
+    return rows
+
+
+@sales_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the sales rollup table from completed purchases."""
+    rebuild_rollup()
+    click.echo(f'Sales rollup rebuilt: {SalesRollup.query.count()} buckets.')
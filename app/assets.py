@@ -0,0 +1,261 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+import urllib.parse
+import urllib.request
+
+import click
+from flask import current_app, request, send_file
+from flask.cli import AppGroup
+
+# Static asset pipeline.
+#
+# At startup every file under app/static gets a content hash, and
+# url_for('static', filename='css/style.css') turns into
+# /static/css/style.<hash>.css. Hashed URLs are served with
+# `Cache-Control: public, max-age=1 year, immutable`, so browsers never
+# revalidate them; editing a file changes its URL. CSS url(...) references are
+# rewritten to the hashed names too. Compressible files are precompressed
+# once into ASSET_BUILD_DIR (gzip, plus brotli when the optional brotli
+# package is installed) and the best encoding the client accepts is sent.
+# Plain /static/ URLs still work, with Flask's default revalidation, and are
+# what url_for() returns in debug mode, where files change under the server.
+#
+# HTML and JSON responses are compressed on the fly (COMPRESS_RESPONSES).
+#
+# Third-party CSS/JS is vendored under static/vendor/ rather than loaded from
+# CDNs; `flask assets vendor` refreshes it and self-hosts the web fonts.
+
+assets_cli = AppGroup('assets', help='Fingerprinted, precompressed static assets.')
+
+IMMUTABLE_MAX_AGE = 365 * 86400
+# Per-response compression runs on every page view: cheaper settings than the precompressed assets
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'font/ttf')
+DYNAMIC_MIMETYPES = ('text/html', 'application/json')
+URL_IN_CSS = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+# Upstream sources of the vendored files (`flask assets vendor`)
+VENDOR = {
+    'vendor/bootstrap/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.min.js',
+    'vendor/bootstrap/popper.min.js': 'https://cdn.jsdelivr.net/npm/@popperjs/core@2.11.8/dist/umd/popper.min.js',
+}
+FONTS_CSS = 'vendor/fonts/fonts.css'
+FONTS_URL = ('https://fonts.googleapis.com/css2?family=Playfair+Display:wght@700'
+             '&family=Inter:wght@400;500;600&display=swap')
+# Google Fonts picks the font format from the User-Agent; this one gets woff2
+FONTS_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+try:
+    import brotli
+except ImportError: # optional: gzip only
+    brotli = None
+
+
+class Asset:
+    def __init__(self, name, hashed, path, mimetype, digest):
+        self.name = name # 'css/style.css'
+        self.hashed = hashed # 'css/style.0123456789ab.css'
+        self.path = path # file to send: the original, or the rewritten copy in the build dir
+        self.mimetype = mimetype
+        self.digest = digest
+        self.encoded = {} # 'br' / 'gzip' -> precompressed file
+
+
+def _compressible(mimetype):
+    return mimetype is not None and mimetype.startswith(COMPRESSIBLE)
+
+
+def _hashed_name(name, digest):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{digest[:12]}{ext}'
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def _rewrite_css(css, name, assets):
+    """Point relative url(...) references of `name` at the hashed names of their targets."""
+    folder = os.path.dirname(name)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        url, _, fragment = url.partition('#')
+        target = url.partition('?')[0] # the hash replaces cache-busting query strings
+        asset = assets.get(os.path.normpath(os.path.join(folder, target)).replace(os.sep, '/'))
+        if asset is None:
+            return match.group(0)
+        hashed = os.path.relpath(asset.hashed, folder or '.').replace(os.sep, '/')
+        return f'url({quote}{hashed}{"#" + fragment if fragment else ""}{quote})'
+    return URL_IN_CSS.sub(replace, css)
+
+
+def build(static_folder, build_dir):
+    """Hash, rewrite and precompress every static file. Returns {name: Asset}."""
+    assets = {}
+    names = []
+    for root, _, files in os.walk(static_folder):
+        for filename in files:
+            path = os.path.join(root, filename)
+            names.append(os.path.relpath(path, static_folder).replace(os.sep, '/'))
+    # CSS last, so the files it references already have their hashed names
+    names.sort(key=lambda name: (name.endswith('.css'), name))
+    for name in names:
+        path = os.path.join(static_folder, name)
+        mimetype = mimetypes.guess_type(name)[0]
+        if name.endswith('.css'):
+            with open(path, encoding='utf-8') as f:
+                css = _rewrite_css(f.read(), name, assets).encode('utf-8')
+            digest = hashlib.sha256(css).hexdigest()
+            hashed = _hashed_name(name, digest)
+            path = os.path.join(build_dir, hashed)
+            if not os.path.exists(path):
+                _write_atomic(path, css)
+        else:
+            digest = _file_digest(path)
+            hashed = _hashed_name(name, digest)
+        asset = assets[name] = Asset(name, hashed, path, mimetype, digest)
+        if _compressible(mimetype):
+            _precompress(asset, build_dir)
+    return assets
+
+
+def _precompress(asset, build_dir):
+    # Named after the hashed file, so a restart with unchanged content reuses them
+    encoders = {'gzip': ('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))}
+    if brotli is not None:
+        encoders['br'] = ('.br', lambda data: brotli.compress(data, quality=11))
+    data = None
+    for encoding, (ext, compress) in encoders.items():
+        path = os.path.join(build_dir, asset.hashed + ext)
+        if not os.path.exists(path):
+            if data is None:
+                with open(asset.path, 'rb') as f:
+                    data = f.read()
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue # already compressed (or tiny): send as is
+            _write_atomic(path, compressed)
+        asset.encoded[encoding] = path
+
+
+def _manifest():
+    return current_app.extensions['assets']
+
+
+def has_asset(name):
+    """Whether static/<name> exists (template global), e.g. to prefer self-hosted fonts."""
+    return name in _manifest()['by_name'] or os.path.exists(os.path.join(current_app.static_folder, name))
+
+
+def _fingerprint_url(endpoint, values):
+    # Checked per call: run.py turns debug on after create_app(), and edited files must show up
+    if endpoint == 'static' and 'filename' in values and not current_app.debug:
+        asset = _manifest()['by_name'].get(values['filename'])
+        if asset is not None:
+            values['filename'] = asset.hashed
+
+
+def serve_static(filename):
+    asset = _manifest()['by_hash'].get(filename)
+    if asset is None:
+        return current_app.send_static_file(filename)
+    encoding = next((e for e in ('br', 'gzip') if e in asset.encoded and e in request.accept_encodings), None)
+    response = send_file(asset.encoded[encoding] if encoding else asset.path, mimetype=asset.mimetype,
+                         etag=f'{asset.digest[:24]}-{encoding or "identity"}', max_age=IMMUTABLE_MAX_AGE,
+                         conditional=True)
+    response.cache_control.immutable = True
+    if encoding:
+        response.content_encoding = encoding
+    if asset.encoded:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def compress_response(response):
+    config = current_app.config
+    if (not config.get('COMPRESS_RESPONSES', True) or response.direct_passthrough or response.is_streamed
+            or response.content_encoding or response.mimetype not in DYNAMIC_MIMETYPES
+            or response.status_code < 200 or response.status_code in (204, 304)):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < config.get('COMPRESS_MIN_BYTES', 500):
+        return response
+    if brotli is not None and 'br' in request.accept_encodings:
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.content_encoding = 'br'
+    elif 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+        response.content_encoding = 'gzip'
+    return response
+
+
+def _build_dir(app):
+    return app.config.get('ASSET_BUILD_DIR') or os.path.join(app.instance_path, 'assets')
+
+
+def init_app(app):
+    assets = build(app.static_folder, _build_dir(app)) if app.config.get('ASSET_FINGERPRINTS', True) else {}
+    app.extensions['assets'] = {'by_name': assets, 'by_hash': {a.hashed: a for a in assets.values()}}
+    app.add_template_global(has_asset)
+    if assets:
+        app.url_defaults(_fingerprint_url)
+        app.view_functions['static'] = serve_static
+    app.after_request(compress_response)
+
+
+@assets_cli.command('build')
+def build_command():
+    """Fingerprint and precompress static files ahead of the first request."""
+    assets = build(current_app.static_folder, _build_dir(current_app))
+    for asset in sorted(assets.values(), key=lambda a: a.name):
+        sizes = ', '.join(f'{encoding} {os.path.getsize(path):,}' for encoding, path in sorted(asset.encoded.items()))
+        click.echo(f'{asset.hashed:<55} {os.path.getsize(asset.path):>9,} bytes{"  (" + sizes + ")" if sizes else ""}')
+    if brotli is None:
+        click.echo('brotli is not installed: gzip variants only (pip install brotli).')
+
+
+def _download(url, user_agent='smart-library-assets/1.0'):
+    with urllib.request.urlopen(urllib.request.Request(url, headers={'User-Agent': user_agent}), timeout=30) as r:
+        return r.read()
+
+
+@assets_cli.command('vendor')
+@click.option('--force', is_flag=True, help='Download files that are already vendored again.')
+def vendor_command(force):
+    """Download the vendored CSS/JS and self-host the web fonts under static/vendor/."""
+    static = current_app.static_folder
+    for name, url in VENDOR.items():
+        if force or not os.path.exists(os.path.join(static, name)):
+            _write_atomic(os.path.join(static, name), _download(url))
+            click.echo(f'{name} <- {url}')
+    if force or not os.path.exists(os.path.join(static, FONTS_CSS)):
+        css = _download(FONTS_URL, FONTS_USER_AGENT).decode('utf-8')
+        folder = os.path.dirname(FONTS_CSS)
+
+        def localize(match):
+            url = match.group(2)
+            filename = os.path.basename(urllib.parse.urlparse(url).path)
+            _write_atomic(os.path.join(static, folder, filename), _download(url, FONTS_USER_AGENT))
+            return f'url({filename})'
+        _write_atomic(os.path.join(static, FONTS_CSS), URL_IN_CSS.sub(localize, css).encode('utf-8'))
+        click.echo(f'{FONTS_CSS} <- {FONTS_URL}')
+    click.echo('Vendored assets up to date; restart the app (or run `flask assets build`) to fingerprint them.')
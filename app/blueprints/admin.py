@@ -1,7 +1,14 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from datetime import date
+from flask import Blueprint, Response, render_template, request, flash, redirect, url_for, jsonify, abort, stream_with_context
 from flask_login import login_required
-from app.decorators import admin_required
-from app.models import User, Book, Transaction
+from app.decorators import admin_required, uses_primary
+from app.eager import TRANSACTION_WITH_BOOK_AND_USER
+from app.models import User, Book, Transaction, invalidate_user
+from app.pagination import keyset_paginate
+from app.analytics import BREAKDOWNS, sales_breakdown, total_revenue
+from app.export import DATASETS, FORMATS, ExportUnavailable, stream_export
+from app.stats import get_stats
+from app import profiler
 from app import db
 
 admin_bp = Blueprint('admin', __name__)
@@ -10,25 +17,27 @@ admin_bp = Blueprint('admin', __name__)
 @login_required
 @admin_required
 def dashboard():
+    counters = get_stats()
     stats = {
-        'total_books': Book.query.count(),
-        'total_users': User.query.filter(User.role != 'admin').count(),
-        'issued_books': Transaction.query.filter_by(status='issued').count(),
-        'overdue_books': Transaction.query.filter_by(status='overdue').count()
+        'total_books': counters['total_books'],
+        'total_users': counters['total_users'],
+        'issued_books': counters['issued_transactions'],
+        'overdue_books': counters['overdue_transactions']
     }
-    recent_transactions = Transaction.query.order_by(Transaction.issued_date.desc()).limit(5).all()
+    recent_transactions = Transaction.query.options(*TRANSACTION_WITH_BOOK_AND_USER).order_by(Transaction.issued_date.desc()).limit(5).all()
     return render_template('admin/dashboard.html', stats=stats, transactions=recent_transactions)
 
 @admin_bp.route('/users')
 @login_required
 @admin_required
 def manage_users():
-    users = User.query.all()
+    users = keyset_paginate(db.select(User), [User.id])
     return render_template('admin/manage_users.html', users=users)
 
 @admin_bp.route('/users/promote/<int:user_id>')
 @login_required
 @admin_required
+@uses_primary
 def promote_user(user_id):
     user = User.query.get_or_404(user_id)
     if user.role == 'user':
@@ -39,12 +48,61 @@ def promote_user(user_id):
         user.role = 'user'
         db.session.commit()
         flash(f'User {user.username} demoted to User.', 'info')
+    # Role checks read the cached login snapshot, so drop it right away
+    invalidate_user(user.id)
     return redirect(url_for('admin.manage_users'))
 @admin_bp.route('/sales')
 @login_required
 @admin_required
 def sales_report():
-    # Fetch all completed purchase transactions
-    sales = Transaction.query.filter_by(transaction_type='purchase', status='completed').order_by(Transaction.issued_date.desc()).all()
-    total_revenue = sum(sale.amount for sale in sales)
-    return render_template('admin/sales_report.html', sales=sales, total_revenue=total_revenue)
+    # Completed purchase transactions, newest first, one page at a time
+    sales_query = (db.select(Transaction)
+                   .where(Transaction.transaction_type == 'purchase', Transaction.status == 'completed')
+                   .options(*TRANSACTION_WITH_BOOK_AND_USER))
+    sales = keyset_paginate(sales_query, [Transaction.issued_date, Transaction.id], descending=True)
+    return render_template('admin/sales_report.html', sales=sales, total_revenue=total_revenue())
+
+@admin_bp.route('/sales/analytics')
+@login_required
+@admin_required
+def sales_analytics():
+    # Aggregated from the sales rollup: ?by=day|week|category|seller&start=YYYY-MM-DD&end=YYYY-MM-DD
+    by = request.args.get('by', 'day')
+    if by not in BREAKDOWNS:
+        abort(400)
+    start = request.args.get('start', type=date.fromisoformat)
+    end = request.args.get('end', type=date.fromisoformat)
+    return jsonify(by=by, total_revenue=round(total_revenue(), 2), buckets=sales_breakdown(by, start, end))
+
+@admin_bp.route('/export/<dataset>.<fmt>')
+@login_required
+@admin_required
+def export(dataset, fmt):
+    # Streamed chunk by chunk: ?start=YYYY-MM-DD&end=YYYY-MM-DD
+    if dataset not in DATASETS or fmt not in FORMATS:
+        abort(404)
+    start = request.args.get('start', type=date.fromisoformat)
+    end = request.args.get('end', type=date.fromisoformat)
+    try:
+        chunks = stream_export(dataset, fmt, start, end)
+    except ExportUnavailable:
+        abort(501)
+    filename = f'{dataset}-{date.today().isoformat()}.{fmt}'
+    return Response(stream_with_context(chunks), mimetype=FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@admin_bp.route('/perf')
+@login_required
+@admin_required
+def perf():
+    # Rolling per-endpoint timings collected by app.profiler in this worker
+    return render_template('admin/perf.html', endpoints=profiler.endpoint_summaries(),
+                           threshold=profiler.slow_query_threshold())
+
+@admin_bp.route('/perf/reset')
+@login_required
+@admin_required
+def reset_perf():
+    profiler.reset_stats()
+    flash('Performance stats cleared.', 'info')
+    return redirect(url_for('admin.perf'))
@@ -0,0 +1,42 @@
+import os
+from flask import Blueprint, abort, current_app, redirect, request, send_file
+from app.models import Cover
+from app import covers, db
+
+covers_bp = Blueprint('covers', __name__)
+
+@covers_bp.route('/<key>/<size>')
+def image(key, size):
+    if size not in covers.SIZES:
+        abort(404)
+    digest = covers.ready_digest(key)
+    if digest is None:
+        return _not_ready(key)
+    fmt = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+    path = covers.cover_path(digest, f'{size}.{fmt}')
+    if not os.path.exists(path):
+        # COVER_DIR was wiped (or is not shared with the worker that rendered it): render again
+        covers.reset(key)
+        return _not_ready(key)
+    # Variants are stored under the original's digest, so the ETag never needs a file read
+    response = send_file(path, mimetype=covers.FORMATS[fmt][0],
+                         etag=f'{digest[:24]}-{size}-{fmt}', max_age=current_app.config['COVER_MAX_AGE'],
+                         conditional=True)
+    response.vary.add('Accept')
+    return response
+
+def _not_ready(key):
+    cover = db.session.get(Cover, key)
+    if cover is None:
+        abort(404)
+    if cover.status == covers.PENDING:
+        covers.schedule(key)
+    if cover.source.startswith(covers.UPLOAD_PREFIX):
+        # Uploaded but not resized yet: the original, briefly cacheable
+        digest = cover.source[len(covers.UPLOAD_PREFIX):]
+        return send_file(covers.cover_path(digest, 'original'), mimetype=covers.original_mimetype(digest),
+                         max_age=60)
+    # Not fetched yet (or the fetch failed): the source, as before the cover service
+    response = redirect(cover.source)
+    response.cache_control.max_age = 60
+    return response
@@ -1,9 +1,12 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app
 from flask_login import login_required
-from app.decorators import librarian_required
+from app.decorators import librarian_required, read_only, uses_primary
 from app.models import Book, Transaction, Reservation, User
 from app.forms import BookForm
-from app import db
+from app.eager import RESERVATION_WITH_BOOK_AND_USER, RESERVATION_WITH_USER, TRANSACTION_WITH_BOOK
+from app.pagination import keyset_paginate
+from app.stats import get_stats
+from app import db, inventory, reservations
 from datetime import datetime, timedelta
 
 librarian_bp = Blueprint('librarian', __name__)
@@ -12,16 +15,15 @@ librarian_bp = Blueprint('librarian', __name__)
 @login_required
 @librarian_required
 def dashboard():
-    books_count = Book.query.count()
-    low_stock = Book.query.filter(Book.available_count < 2).count()
-    pending_reservations = Reservation.query.filter_by(status='pending').count() + Reservation.query.filter_by(status='approved').count()
-    return render_template('librarian/dashboard.html', books_count=books_count, low_stock=low_stock, pending_reservations=pending_reservations)
+    stats = get_stats()
+    pending_reservations = stats['pending_reservations'] + stats['approved_reservations']
+    return render_template('librarian/dashboard.html', books_count=stats['total_books'], low_stock=stats['low_stock_books'], pending_reservations=pending_reservations)
 
 @librarian_bp.route('/books')
 @login_required
 @librarian_required
 def manage_books():
-    books = Book.query.all()
+    books = keyset_paginate(db.select(Book), [Book.id])
     return render_template('librarian/manage_books.html', books=books)
 
 @librarian_bp.route('/books/add', methods=['GET', 'POST'])
@@ -68,6 +70,7 @@ def edit_book(book_id):
 @librarian_bp.route('/books/delete/<int:book_id>')
 @login_required
 @librarian_required
+@uses_primary
 def delete_book(book_id):
     book = Book.query.get_or_404(book_id)
     db.session.delete(book)
@@ -81,54 +84,97 @@ def delete_book(book_id):
 @login_required
 @librarian_required
 def manage_reservations():
-    reservations = Reservation.query.filter(Reservation.status.in_(['pending', 'approved'])).all()
-    return render_template('librarian/reservations.html', reservations=reservations)
+    # Open reservations, oldest first, one page at a time
+    open_reservations = (db.select(Reservation)
+                         .where(Reservation.status.in_([reservations.WAITING, reservations.READY]))
+                         .options(*RESERVATION_WITH_BOOK_AND_USER))
+    page = keyset_paginate(open_reservations, reservations.QUEUE_ORDER)
+    return render_template('librarian/reservations.html', reservations=page)
+
+@librarian_bp.route('/reservations/book/<int:book_id>')
+@login_required
+@librarian_required
+def book_queue(book_id):
+    # One title's waiting list in FIFO order, paged over the queue index
+    book = Book.query.get_or_404(book_id)
+    queue = keyset_paginate(reservations.queue_query(book.id).options(*RESERVATION_WITH_USER),
+                            reservations.QUEUE_ORDER)
+    ready = Reservation.query.options(*RESERVATION_WITH_USER).filter_by(book_id=book.id, status=reservations.READY).all()
+    return render_template('librarian/book_queue.html', book=book, queue=queue, ready=ready,
+                           queue_length=reservations.queue_length(book.id))
 
 @librarian_bp.route('/issue/<int:reservation_id>')
 @login_required
 @librarian_required
+@uses_primary
 def issue_book(reservation_id):
     reservation = Reservation.query.get_or_404(reservation_id)
-    book = reservation.book
-    
-    if book.available_count < 1:
+    if reservation.status not in reservations.OPEN:
+        flash('This reservation is already closed.', 'info')
+        return redirect(url_for('librarian.manage_reservations'))
+
+    def issue():
+        # A held copy is already off the shelf; otherwise a conditional UPDATE takes one,
+        # so two librarians cannot hand out the last copy twice
+        if not reservation.copy_held and not inventory.take_copy(reservation.book_id):
+            return None
+        if not reservations.close(reservation, 'fulfilled'):
+            db.session.rollback()
+            return False # issued or cancelled meanwhile
+        # Create Transaction
+        # Rule: 14 days loan period
+        due_date = datetime.utcnow() + timedelta(days=14)
+        transaction = Transaction(
+            user_id=reservation.user_id,
+            book_id=reservation.book_id,
+            due_date=due_date,
+            status='issued'
+        )
+
+        db.session.add(transaction)
+        db.session.commit()
+        return due_date
+
+    due_date = inventory.with_retry(issue)
+    if due_date is None:
         flash('Cannot issue book. Out of stock.', 'danger')
         return redirect(url_for('librarian.manage_reservations'))
-        
-    # Create Transaction
-    # Rule: 14 days loan period
-    due_date = datetime.utcnow() + timedelta(days=14)
-    transaction = Transaction(
-        user_id=reservation.user_id,
-        book_id=reservation.book_id,
-        due_date=due_date,
-        status='issued'
-    )
-    
-    # Update Book stock
-    book.available_count -= 1
-    
-    # Update Reservation
-    reservation.status = 'fulfilled'
-    
-    db.session.add(transaction)
-    db.session.commit()
+    if due_date is False:
+        flash('This reservation is already closed.', 'info')
+        return redirect(url_for('librarian.manage_reservations'))
     flash(f'Book issued to {reservation.user.username}. Due date: {due_date.strftime("%Y-%m-%d")}', 'success')
     return redirect(url_for('librarian.manage_reservations'))
 
 @librarian_bp.route('/cancel_reservation/<int:reservation_id>')
 @login_required
 @librarian_required
+@uses_primary
 def cancel_reservation(reservation_id):
     reservation = Reservation.query.get_or_404(reservation_id)
-    reservation.status = 'cancelled'
-    db.session.commit()
+
+    def cancel():
+        held = reservation.copy_held
+        if not reservations.close(reservation, 'cancelled'):
+            return False, None
+        # The copy it held goes to the next waiter, or back on the shelf
+        promoted = reservations.release_copy(reservation.book_id) if held else None
+        promoted_user = promoted.user.username if promoted else None
+        db.session.commit()
+        return True, promoted_user
+
+    cancelled, promoted_user = inventory.with_retry(cancel)
+    if not cancelled:
+        flash('This reservation is already closed.', 'info')
+        return redirect(url_for('librarian.manage_reservations'))
     flash('Reservation cancelled.', 'info')
+    if promoted_user:
+        flash(f'Copy held for {promoted_user}, next in the reservation queue.', 'info')
     return redirect(url_for('librarian.manage_reservations'))
 
 @librarian_bp.route('/return', methods=['GET', 'POST'])
 @login_required
 @librarian_required
+@read_only
 def return_book():
     if request.method == 'POST':
         isbn = request.form.get('isbn')
@@ -142,7 +188,8 @@ def return_book():
             return redirect(url_for('librarian.return_book'))
             
         # Find transactions for this user
-        transactions = Transaction.query.filter_by(user_id=user.id, status='issued').all()
+        transactions = Transaction.query.options(*TRANSACTION_WITH_BOOK).filter(
+            Transaction.user_id == user.id, Transaction.status.in_(['issued', 'overdue'])).all()
         return render_template('librarian/return_book.html', transactions=transactions, user=user)
         
     return render_template('librarian/return_book.html', transactions=None)
@@ -150,21 +197,35 @@ def return_book():
 @librarian_bp.route('/return_confirm/<int:transaction_id>')
 @login_required
 @librarian_required
+@uses_primary
 def confirm_return(transaction_id):
     transaction = Transaction.query.get_or_404(transaction_id)
-    transaction.return_date = datetime.utcnow()
-    transaction.status = 'returned'
-    
-    # Calculate Fine (Simple logic: $1 per day overdue)
-    if transaction.return_date > transaction.due_date:
-        overdue_days = (transaction.return_date - transaction.due_date).days
-        transaction.fine_amount = overdue_days * 1.0
+    if transaction.status not in ('issued', 'overdue'):
+        flash('This loan has already been returned.', 'info')
+        return redirect(url_for('librarian.return_book'))
+
+    def close_loan():
+        transaction.return_date = datetime.utcnow()
+        transaction.status = 'returned'
+
+        # Calculate Fine (Simple logic: FINE_PER_DAY, $1 by default, per day overdue)
+        overdue_days = 0
+        if transaction.return_date > transaction.due_date:
+            overdue_days = (transaction.return_date - transaction.due_date).days
+            transaction.fine_amount = overdue_days * current_app.config['FINE_PER_DAY']
+
+        # Hold the copy for the next waiter, or put it back on the shelf, in the same transaction
+        promoted = reservations.release_copy(transaction.book_id)
+        promoted_user = promoted.user.username if promoted else None
+
+        db.session.commit()
+        return overdue_days, promoted_user
+
+    overdue_days, promoted_user = inventory.with_retry(close_loan)
+    if overdue_days:
         flash(f'Book returned. Overdue by {overdue_days} days. Fine: ${transaction.fine_amount}', 'warning')
     else:
         flash('Book returned on time.', 'success')
-        
-    # Update stock
-    transaction.book.available_count += 1
-    
-    db.session.commit()
+    if promoted_user:
+        flash(f'Copy held for {promoted_user}, next in the reservation queue.', 'info')
     return redirect(url_for('librarian.return_book'))
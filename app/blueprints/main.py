@@ -1,25 +1,20 @@
 from flask import Blueprint, render_template
-from app.models import Book
-from app import db
-import random
+from flask_login import current_user
+from app.catalog import homepage_collections
+from app.recommendations import recommended_books
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
 def index():
-    # Fetch Collections
-    new_releases = Book.query.order_by(Book.created_at.desc()).limit(10).all()
-    top_rated = Book.query.order_by(Book.average_rating.desc()).limit(10).all()
+    # Fetch Collections (cached until the catalogue version changes, stock and ratings for CATALOG_LIVE_TTL)
+    collections = homepage_collections()
     
-    # Recommended (Random for now, or algorithm later)
-    all_books = Book.query.all()
-    recommended = random.sample(all_books, min(len(all_books), 10)) if all_books else []
-    
-    # Categories
-    categories = [r[0] for r in db.session.query(Book.category).distinct().all()]
+    # Recommended (strategy picked by the RECOMMENDER config, personal by default)
+    recommended = recommended_books(current_user if current_user.is_authenticated else None, 10)
     
     return render_template('index.html', 
-                           new_releases=new_releases, 
-                           top_rated=top_rated, 
+                           new_releases=collections['new_releases'], 
+                           top_rated=collections['top_rated'], 
                            recommended=recommended, 
-                           categories=categories)
+                           categories=collections['categories'])
@@ -1,18 +1,27 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+from flask import Blueprint, render_template, request, flash, redirect, url_for, abort
 from flask_login import login_required, current_user
-from app.models import Book, Transaction, Reservation
-from app import db
+from sqlalchemy.exc import IntegrityError
+from app.models import Book, Transaction, Reservation, Review
+from app.search import search_query
+from app.catalog import category_shelves
+from app.analytics import record_sale
+from app.eager import BOOK_WITH_SELLER, TRANSACTION_WITH_BOOK, RESERVATION_WITH_BOOK, REVIEW_WITH_AUTHOR
+from app.pagination import keyset_paginate
+from app import covers, db, inventory, neighbors, ratings, reservations, wallet
 from datetime import datetime
 
 user_bp = Blueprint('user', __name__)
 
+REVIEWS_PER_PAGE = 10
+
 @user_bp.route('/dashboard')
 @login_required
 def dashboard():
     # Current Loans
-    current_loans = Transaction.query.filter_by(user_id=current_user.id, status='issued').all()
+    current_loans = Transaction.query.options(*TRANSACTION_WITH_BOOK).filter(
+        Transaction.user_id == current_user.id, Transaction.status.in_(['issued', 'overdue'])).all()
     # Reservations
-    reservations = Reservation.query.filter_by(user_id=current_user.id).all()
+    reservations = Reservation.query.options(*RESERVATION_WITH_BOOK).filter_by(user_id=current_user.id).all()
     # History (Returned)
     history_count = Transaction.query.filter_by(user_id=current_user.id, status='returned').count()
     
@@ -28,43 +37,98 @@ def search_books():
     category_filter = request.args.get('category', '')
     
     if query or category_filter:
-        # If searching, show standard grid results
-        books_query = Book.query
-        if query:
-            books_query = books_query.filter(Book.title.contains(query) | Book.author.contains(query))
-        if category_filter:
-            books_query = books_query.filter(Book.category == category_filter)
-        results = books_query.all()
+        # If searching, show ranked full-text results one page at a time
+        page = request.args.get('page', 1, type=int)
+        results = db.paginate(search_query(query, category_filter), page=page, per_page=24, max_per_page=100)
         return render_template('user/search.html', results=results, is_search=True, categories=[])
     else:
         # Default view: Group by Category (BookMyShow style)
-        categories = [r[0] for r in db.session.query(Book.category).distinct().all()]
-        ordered_books = {}
-        for cat in categories:
-            # Fetch up to 10 books per category for the carousel
-            books = Book.query.filter_by(category=cat).limit(10).all()
-            if books:
-                ordered_books[cat] = books
+        # Up to 10 books per category for the carousels, one cached query for all of them
+        ordered_books = category_shelves()
+        categories = list(ordered_books)
         
         return render_template('user/search.html', ordered_books=ordered_books, is_search=False, categories=categories)
 
 @user_bp.route('/book/<int:book_id>')
 @login_required
 def book_details(book_id):
-    book = Book.query.get_or_404(book_id)
-    # Similar Books (Same Category, exclude current)
-    similar_books = Book.query.filter(Book.category == book.category, Book.id != book.id).limit(6).all()
+    book = Book.query.options(*BOOK_WITH_SELLER).get_or_404(book_id)
+    # Similar Books: precomputed neighbours (flask neighbors build), else same category
+    similar_books = neighbors.similar_books(book)
+    if not similar_books:
+        similar_books = Book.query.filter(Book.category == book.category, Book.id != book.id).limit(6).all()
     if not similar_books:
         # Fallback to random if no similar
         similar_books = Book.query.filter(Book.id != book.id).limit(6).all()
         
-    return render_template('user/book_details.html', book=book, similar_books=similar_books)
+    # Reviews, newest first, one page at a time
+    reviews = keyset_paginate(db.select(Review).where(Review.book_id == book.id).options(*REVIEW_WITH_AUTHOR),
+                              [Review.created_at, Review.id], descending=True,
+                              per_page=request.args.get('per_page', REVIEWS_PER_PAGE, type=int))
+    my_review = Review.query.filter_by(user_id=current_user.id, book_id=book.id).first()
+    return render_template('user/book_details.html', book=book, similar_books=similar_books,
+                           reviews=reviews, my_review=my_review)
+
+@user_bp.route('/book/<int:book_id>/review', methods=['POST'])
+@login_required
+def review_book(book_id):
+    book = Book.query.get_or_404(book_id)
+    rating = request.form.get('rating', type=int)
+    if rating is None or not ratings.MIN_RATING <= rating <= ratings.MAX_RATING:
+        flash('Please pick a rating from 1 to 5.', 'danger')
+        return redirect(url_for('user.book_details', book_id=book.id))
+    comment = (request.form.get('comment') or '').strip() or None
+
+    # Review row and book aggregates change in one transaction
+    review = Review.query.filter_by(user_id=current_user.id, book_id=book.id).first()
+    if review:
+        if ratings.update_review(review, rating, comment):
+            message, category = 'Your review has been updated.', 'success'
+        else:
+            message, category = 'Your review was changed in the meantime, please try again.', 'warning'
+    else:
+        db.session.add(Review(user_id=current_user.id, book_id=book.id, rating=rating, comment=comment))
+        ratings.add_rating(book.id, rating)
+        message, category = 'Thanks for your review!', 'success'
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A parallel request from the same reader got there first (uq_review_user_book)
+        db.session.rollback()
+        message, category = 'You have already reviewed this book.', 'warning'
+    flash(message, category)
+    return redirect(url_for('user.book_details', book_id=book.id))
+
+@user_bp.route('/review/<int:review_id>/delete', methods=['POST'])
+@login_required
+def delete_review(review_id):
+    review = Review.query.get_or_404(review_id)
+    if review.user_id != current_user.id and current_user.role not in ('librarian', 'admin'):
+        abort(403)
+    book_id = review.book_id
+    if ratings.delete_review(review):
+        db.session.commit()
+        flash('Review deleted.', 'info')
+    else:
+        flash('This review was already deleted.', 'info')
+    return redirect(url_for('user.book_details', book_id=book_id))
 
 @user_bp.route('/book/<int:book_id>/reserve', methods=['POST'])
 @login_required
 def reserve_book(book_id):
     book = Book.query.get_or_404(book_id)
-    if book.available_count < 1:
+
+    def reserve_for_pickup():
+        # A copy is set aside right away only when nobody is waiting (first come, first served)
+        if reservations.has_waiters(book.id) or not reservations.reserve_from_shelf(book.id, current_user.id):
+            return False
+        db.session.commit()
+        return True
+
+    if inventory.with_retry(reserve_for_pickup):
+        flash('Book reserved for pickup!', 'success')
+    else:
+        # Nothing on the shelf, or others are already waiting: join the queue
         # Check if already reserved
         existing_res = Reservation.query.filter_by(user_id=current_user.id, book_id=book.id, status='pending').first()
         if existing_res:
@@ -74,19 +138,17 @@ def reserve_book(book_id):
             db.session.add(res)
             db.session.commit()
             flash('Reservation placed successfully! You will be notified when available.', 'success')
-    else:
-        # If available, user can technically reserve it for pickup
-        res = Reservation(user_id=current_user.id, book_id=book.id, status='approved') # Approved immediately for pickup
-        db.session.add(res)
-        db.session.commit()
-        flash('Book reserved for pickup!', 'success')
-        
+    return redirect(url_for('user.book_details', book_id=book.id))
+
 @user_bp.route('/book/<int:book_id>/buy', methods=['POST'])
 @login_required
 def buy_book(book_id):
     book = Book.query.get_or_404(book_id)
-    if book.quantity > 0:
-        # Create Sales Transaction
+
+    def purchase():
+        # Stock and seller wallet move with atomic UPDATEs, safe against concurrent buyers
+        if not inventory.take_copy(book.id, sold=True):
+            return False
         sale = Transaction(
             user_id=current_user.id,
             book_id=book.id,
@@ -96,18 +158,17 @@ def buy_book(book_id):
             due_date=None, # No due date for sales
             return_date=datetime.utcnow() # Sold date
         )
-        
-        # Decrement stock
-        book.quantity -= 1
-        book.available_count -= 1
-        
-        # Credit Seller Wallet if applicable
-        if book.seller_id:
-            seller = book.seller
-            seller.wallet_balance += book.price
-        
         db.session.add(sale)
+
+        # Credit Seller Wallet if applicable (ledger entry + atomic balance increment)
+        if book.seller_id:
+            wallet.credit(book.seller_id, book.price, transaction=sale)
+
+        record_sale(book, book.price)
         db.session.commit()
+        return True
+
+    if inventory.with_retry(purchase):
         flash(f'Successfully purchased "{book.title}" for ${book.price}!', 'success')
     else:
         flash('Sorry, this book is out of stock.', 'danger')
@@ -125,8 +186,15 @@ def sell_book():
         category = request.form.get('category')
         description = request.form.get('description')
         
-        # Simple placeholder cover for user uploads or use ISBN
+        # Uploaded photo, else the Open Library cover for the ISBN
         cover_image = f"https://covers.openlibrary.org/b/isbn/{isbn}-L.jpg" if isbn else None
+        upload = request.files.get('cover')
+        if upload and upload.filename:
+            try:
+                cover_image = covers.accept_upload(upload)
+            except ValueError as e:
+                flash(str(e), 'danger')
+                return render_template('user/sell_book.html')
         
         book = Book(
             title=title,
@@ -137,14 +205,16 @@ def sell_book():
             description=description,
             cover_image=cover_image,
             seller_id=current_user.id,
-            total_quantity=1, # Users sell 1 copy usually
-            quantity=1,
+            quantity=1, # Users sell 1 copy usually
             available_count=1,
             pages=100, # Default
             average_rating=0
         )
         db.session.add(book)
         db.session.commit()
+        if cover_image:
+            # Resize in the background now rather than on the first page view
+            covers.schedule(covers.cover_key(cover_image))
         flash('Book listed for sale successfully!', 'success')
         return redirect(url_for('user.my_listings'))
         
@@ -0,0 +1,159 @@
+import time
+from array import array
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import cache
+from app.models import Book
+
+# Catalogue-derived data (homepage collections, category shelves) is cached
+# under keys that embed the catalogue version. Committing a Book insert, delete
+# or metadata edit moves the version on, so every derived entry is invalidated
+# at once, in every worker when the cache backend is shared. The id array only
+# depends on which books exist and has its own version, moved by Book inserts
+# and deletes alone.
+#
+# Stock and ratings change with every loan, sale and review. Bumping the
+# version for those would drop the homepage on nearly every request under
+# write load, so they move no version: the collections showing them are kept
+# for CATALOG_LIVE_TTL seconds only and pick the new values up on rebuild.
+VERSION_KEY = 'catalog:version'
+IDS_VERSION_KEY = 'catalog:ids:version'
+SHELF_SIZE = 10
+LIVE_COLUMNS = frozenset({'quantity', 'available_count', 'average_rating', 'rating_count', 'rating_sum'})
+CONTENT_COLUMNS = [attr.key for attr in inspect(Book).column_attrs if attr.key not in LIVE_COLUMNS]
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        version = _bump(key)
+    return version
+
+
+def _bump(key):
+    # Time-based rather than a counter, so a lost/evicted version never reuses an old value
+    version = time.time_ns()
+    cache.set(key, version, ttl=0)
+    return version
+
+
+def catalog_version():
+    return _version(VERSION_KEY)
+
+
+def bump_catalog_version():
+    return _bump(VERSION_KEY)
+
+
+def _key(name):
+    return f'catalog:{catalog_version()}:{name}'
+
+
+def _live_ttl():
+    return current_app.config.get('CATALOG_LIVE_TTL', 30)
+
+
+def _card(book):
+    # Plain snapshot of what the carousel templates render, safe to keep across requests
+    return {
+        'id': book.id,
+        'title': book.title,
+        'author': book.author,
+        'category': book.category,
+        'cover_image': book.cover_image,
+        'available_count': book.available_count,
+        'average_rating': book.average_rating,
+    }
+
+
+def category_shelves(limit=SHELF_SIZE):
+    """Top `limit` books of every category, built with a single ROW_NUMBER() query."""
+    key = _key(f'category_shelves:{limit}')
+    shelves = cache.get(key)
+    if shelves is not None:
+        return shelves
+
+    ranked = db.select(
+        Book.id,
+        db.func.row_number().over(partition_by=Book.category, order_by=Book.id).label('rn')
+    ).subquery()
+    stmt = (db.select(Book)
+            .join(ranked, ranked.c.id == Book.id)
+            .where(ranked.c.rn <= limit)
+            .order_by(Book.category, ranked.c.rn))
+
+    shelves = {}
+    for book in db.session.scalars(stmt):
+        shelves.setdefault(book.category, []).append(_card(book))
+    cache.set(key, shelves, ttl=_live_ttl())
+    return shelves
+
+
+def homepage_collections(limit=SHELF_SIZE):
+    """New releases, top rated and the category list shown on main.index."""
+    key = _key(f'homepage:{limit}')
+    collections = cache.get(key)
+    if collections is not None:
+        return collections
+
+    collections = {
+        'new_releases': [_card(b) for b in db.session.scalars(
+            db.select(Book).order_by(Book.created_at.desc()).limit(limit))],
+        'top_rated': [_card(b) for b in db.session.scalars(
+            db.select(Book).order_by(Book.average_rating.desc()).limit(limit))],
+        'categories': list(db.session.scalars(db.select(Book.category).distinct())),
+    }
+    cache.set(key, collections, ttl=_live_ttl())
+    return collections
+
+
+def book_ids():
+    """Compact array of every Book id, loaded once and kept until a book is added or deleted."""
+    key = f'catalog:ids:{_version(IDS_VERSION_KEY)}:book_ids'
+    ids = cache.get(key)
+    if ids is None:
+        ids = array('q', db.session.scalars(db.select(Book.id).order_by(Book.id)))
+        cache.set(key, ids)
+    return ids
+
+
+def invalidate_catalog(ids=True):
+    """Drop every cached catalogue entry; with ids=False the id array is kept (no book added or deleted)."""
+    bump_catalog_version()
+    if ids:
+        _bump(IDS_VERSION_KEY)
+
+
+# --- Invalidation: committed Book inserts, deletes and metadata updates bump the catalogue
+# version, inserts and deletes the id array version too. Stock/rating updates bump nothing. ---
+
+def _content_changed(book):
+    attrs = inspect(book).attrs
+    return any(attrs[key].history.has_changes() for key in CONTENT_COLUMNS)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_book_writes(session, flush_context):
+    if any(isinstance(obj, Book) for obj in chain(session.new, session.deleted)):
+        session.info['catalog_ids_changed'] = True
+        session.info['catalog_changed'] = True
+    elif any(isinstance(obj, Book) and _content_changed(obj) for obj in session.dirty):
+        session.info['catalog_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    ids_changed = session.info.pop('catalog_ids_changed', False)
+    if session.info.pop('catalog_changed', False):
+        invalidate_catalog(ids=ids_changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('catalog_changed', None)
+    session.info.pop('catalog_ids_changed', None)
@@ -0,0 +1,270 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import chain
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import TTLCache
+from app.models import Book, Cover
+
+# Local cover images.
+#
+# Book.cover_image keeps the source (an http(s) URL, or upload:<digest> for a
+# file sent with the sell form). Templates link covers through cover_url(),
+# which only hashes the source into a /covers/<key>/<size> URL, so rendering a
+# page costs no queries. Every source gets a Cover row when a book using it is
+# flushed (or imported); a background thread pool in each worker, or
+# `flask covers work`, fetches the original once, renders the SIZES variants
+# as WebP and JPEG with Pillow, and stores everything under COVER_DIR named by
+# the sha256 of the original bytes:
+#
+#   <COVER_DIR>/<digest[:2]>/<digest>/original
+#   <COVER_DIR>/<digest[:2]>/<digest>/<size>.webp / <size>.jpeg
+#
+# Until a cover is ready its URL redirects to the source, like before.
+
+logger = logging.getLogger('smart_library.covers')
+
+covers_cli = AppGroup('covers', help='Local cover images and thumbnails.')
+
+# Bounding boxes (w, h): about 2x the CSS size of a carousel tile / the details page cover
+SIZES = {'card': (440, 640), 'large': (700, 1000)}
+FORMATS = {
+    'webp': ('image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+UPLOAD_PREFIX = 'upload:'
+PENDING, READY, FAILED = 'pending', 'ready', 'failed'
+
+# key -> digest of ready covers, per worker: a page can show dozens of covers, kept out of
+# the shared cache so they never push catalogue entries out
+_digests = TTLCache(maxsize=8192, ttl=3600)
+_executor = None
+_scheduled = set()
+_lock = threading.Lock()
+
+
+def cover_key(source):
+    return hashlib.sha256(source.encode()).hexdigest()[:32]
+
+
+def cover_url(source, size='card'):
+    """URL of the local `size` variant of a Book.cover_image value (template global)."""
+    if not source:
+        return None
+    return url_for('covers.image', key=cover_key(source), size=size)
+
+
+def cover_dir():
+    return current_app.config.get('COVER_DIR') or os.path.join(current_app.instance_path, 'covers')
+
+
+def cover_path(digest, name):
+    return os.path.join(cover_dir(), digest[:2], digest, name)
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _store_original(data):
+    digest = hashlib.sha256(data).hexdigest()
+    path = cover_path(digest, 'original')
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    return digest
+
+
+def register(connection, sources):
+    """Queue a Cover row for every source not seen before (INSERT ... ON CONFLICT DO NOTHING)."""
+    rows = [{'key': cover_key(source), 'source': source, 'status': PENDING} for source in set(sources) if source]
+    if rows:
+        insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+        connection.execute(insert(Cover).on_conflict_do_nothing(index_elements=['key']), rows)
+    return len(rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def _register_book_covers(session, flush_context):
+    sources = [book.cover_image for book in chain(session.new, session.dirty)
+               if isinstance(book, Book) and book.cover_image
+               and (book in session.new or inspect(book).attrs.cover_image.history.has_changes())]
+    if sources:
+        register(session.connection(), sources)
+
+
+def accept_upload(file):
+    """Keep an uploaded cover (werkzeug FileStorage). Returns its Book.cover_image value."""
+    limit = current_app.config.get('COVER_MAX_BYTES', 10 * 2**20)
+    data = file.stream.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f'Cover images are limited to {limit // 2**20} MB.')
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise ValueError('The cover is not an image Pillow can read.')
+    return UPLOAD_PREFIX + _store_original(data)
+
+
+def fetch(source):
+    """Download an http(s) cover, at most COVER_MAX_BYTES."""
+    if not source.startswith(('http://', 'https://')):
+        raise ValueError(f'unsupported cover source {source[:50]!r}')
+    limit = current_app.config.get('COVER_MAX_BYTES', 10 * 2**20)
+    request = urllib.request.Request(source, headers={'User-Agent': 'smart-library-covers/1.0'})
+    with urllib.request.urlopen(request, timeout=current_app.config.get('COVER_FETCH_TIMEOUT', 10)) as response:
+        data = response.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f'cover larger than {limit:,} bytes')
+    return data
+
+
+def render_variants(data):
+    """{'<size>.<format>': bytes} for every size and format, each fitted inside its box."""
+    variants = {}
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG: let the decoder downscale while reading when the original is much larger
+        image.draft('RGB', max(SIZES.values()))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    for size, box in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail(box, Image.LANCZOS)
+        for fmt, (_, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, fmt.upper(), **options)
+            variants[f'{size}.{fmt}'] = buffer.getvalue()
+    return variants
+
+
+def process_cover(key):
+    """Fetch (or read the upload of) one cover and write its variants. Returns the new status."""
+    cover = db.session.get(Cover, key)
+    if cover is None:
+        return None
+    try:
+        if cover.source.startswith(UPLOAD_PREFIX):
+            digest = cover.source[len(UPLOAD_PREFIX):]
+            with open(cover_path(digest, 'original'), 'rb') as f:
+                data = f.read()
+        else:
+            data = fetch(cover.source)
+            digest = _store_original(data)
+        # Content-addressed: a digest another source already rendered is reused as is
+        names = [f'{size}.{fmt}' for size in SIZES for fmt in FORMATS]
+        if not all(os.path.exists(cover_path(digest, name)) for name in names):
+            for name, variant in render_variants(data).items():
+                _write_atomic(cover_path(digest, name), variant)
+        cover.digest, cover.status, cover.error = digest, READY, None
+    except Exception as e: # network errors, HTTP errors, images Pillow rejects
+        cover.status, cover.error = FAILED, f'{type(e).__name__}: {e}'[:200]
+        logger.warning('Cover %s (%s) failed: %s', key, cover.source, cover.error)
+    cover.updated_at = datetime.utcnow()
+    db.session.commit()
+    if cover.status == READY:
+        _digests.set(key, cover.digest)
+    return cover.status
+
+
+def ready_digest(key):
+    """Digest of a ready cover, cached per worker; None while it is not ready."""
+    digest = _digests.get(key)
+    if digest is None:
+        cover = db.session.get(Cover, key)
+        if cover is not None and cover.status == READY:
+            digest = cover.digest
+            _digests.set(key, digest)
+    return digest
+
+
+def reset(key):
+    """Mark a cover pending again, e.g. when its files are missing."""
+    _digests.delete(key)
+    cover = db.session.get(Cover, key)
+    if cover is not None:
+        cover.status, cover.updated_at = PENDING, datetime.utcnow()
+        db.session.commit()
+
+
+def original_mimetype(digest):
+    with Image.open(cover_path(digest, 'original')) as image:
+        return image.get_format_mimetype()
+
+
+def schedule(key):
+    """Process a cover on this worker's background threads (no-op with COVER_WORKER_THREADS=0)."""
+    global _executor
+    app = current_app._get_current_object()
+    threads = app.config.get('COVER_WORKER_THREADS', 1)
+    if not threads:
+        return
+    with _lock:
+        if key in _scheduled:
+            return
+        _scheduled.add(key)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(threads, thread_name_prefix='covers')
+    _executor.submit(_run, app, key)
+
+
+def _run(app, key):
+    try:
+        with app.app_context():
+            process_cover(key)
+    except Exception:
+        logger.exception('Cover worker crashed on %s', key)
+    finally:
+        with _lock:
+            _scheduled.discard(key)
+
+
+def register_all():
+    """Queue covers for every book source (backfill for books that predate the cover table)."""
+    sources = db.session.scalars(db.select(Book.cover_image).where(Book.cover_image.isnot(None)).distinct())
+    count = register(db.session.connection(), sources)
+    db.session.commit()
+    return count
+
+
+@covers_cli.command('warm')
+def warm_command():
+    """Queue a Cover row for every book cover source."""
+    register_all()
+    pending = db.session.scalar(db.select(db.func.count()).select_from(Cover).where(Cover.status == PENDING))
+    click.echo(f'{pending:,} covers pending; run `flask covers work` to render them.')
+
+
+@covers_cli.command('work')
+@click.option('--retry-failed', is_flag=True, help='Also retry covers that failed before.')
+@click.option('--limit', type=int, help='Stop after this many covers.')
+def work_command(retry_failed, limit):
+    """Render pending covers in this process."""
+    statuses = [PENDING, FAILED] if retry_failed else [PENDING]
+    stmt = db.select(Cover.key).where(Cover.status.in_(statuses)).order_by(Cover.updated_at)
+    keys = db.session.scalars(stmt.limit(limit)).all()
+    done = {READY: 0, FAILED: 0}
+    for n, key in enumerate(keys, 1):
+        status = process_cover(key)
+        if status is not None: # None: the row went away since the listing
+            done[status] += 1
+        if n % 100 == 0:
+            click.echo(f'{n:,}/{len(keys):,} processed')
+    click.echo(f'{done[READY]:,} covers ready, {done[FAILED]:,} failed.')
@@ -2,6 +2,9 @@ from functools import wraps
 from flask import abort
 from flask_login import current_user
 
+# current_user is the cached UserSnapshot from app.models.load_user, so these role
+# checks normally cost no database round trip.
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -17,3 +20,16 @@ def librarian_required(f):
             abort(403)
         return f(*args, **kwargs)
     return decorated_function
+
+# Read-replica routing (app/routing.py) sends GET requests to a replica and everything
+# else to the primary; these markers override that for one view.
+
+def read_only(f):
+    """Let a non-GET view read from a replica (it must not write)."""
+    f.db_route = 'replica'
+    return f
+
+def uses_primary(f):
+    """Keep a GET view on the primary (it writes, or reads rows it is about to change)."""
+    f.db_route = 'primary'
+    return f
@@ -0,0 +1,78 @@
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.orm import Session, configure_mappers, joinedload
+
+from app.models import Book, Reservation, Review, Transaction
+from app.profiler import request_query_count
+
+# --- Eager-loading policy ---
+# Views that render rows together with their related user/book use these
+# option sets, so each list costs one query instead of 1 + N lazy loads.
+
+configure_mappers() # backrefs (Transaction.book, Book.seller, ...) exist only once mappers are configured
+
+BOOK_WITH_SELLER = (joinedload(Book.seller),)
+TRANSACTION_WITH_BOOK = (joinedload(Transaction.book),)
+TRANSACTION_WITH_BOOK_AND_USER = (joinedload(Transaction.book), joinedload(Transaction.user))
+RESERVATION_WITH_BOOK = (joinedload(Reservation.book),)
+RESERVATION_WITH_USER = (joinedload(Reservation.user),)
+RESERVATION_WITH_BOOK_AND_USER = (joinedload(Reservation.book), joinedload(Reservation.user))
+REVIEW_WITH_AUTHOR = (joinedload(Review.author),)
+
+
+# --- N+1 detector ---
+# With DETECT_LAZY_LOADS set to 'warn' (the default in debug mode) or 'raise',
+# every request reports its query count (from app.profiler, which counts even
+# with SQL_PROFILER off) and any relationship lazy load fired while a template
+# renders is logged, or raised as an error in tests.
+
+class LazyLoadInTemplate(Exception):
+    pass
+
+
+def _mode():
+    mode = current_app.config.get('DETECT_LAZY_LOADS')
+    if mode is None and current_app.debug:
+        return 'warn'
+    return mode
+
+
+def _active():
+    return has_request_context() and bool(_mode())
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _check_lazy_load(state):
+    if not state.is_relationship_load or not _active() or not g.get('rendering_template'):
+        return
+    parent = state.lazy_loaded_from
+    path = state.loader_strategy_path
+    target = f'{parent.class_.__name__}.{path[-1].key}' if parent is not None and path else 'relationship'
+    message = f'Lazy load of {target} while rendering {g.rendering_template} in {request.endpoint}'
+    if _mode() == 'raise':
+        raise LazyLoadInTemplate(message)
+    current_app.logger.warning(message)
+
+
+def _before_render(sender, template, context, **extra):
+    if _active():
+        g.rendering_template = template.name or '<string>'
+
+
+def _after_render(sender, template, context, **extra):
+    if _active():
+        g.rendering_template = None
+
+
+def init_app(app):
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.after_request
+    def _report_query_count(response):
+        if _active():
+            count = request_query_count()
+            response.headers['X-Query-Count'] = str(count)
+            if count > app.config.get('QUERY_COUNT_WARN', 20):
+                app.logger.warning(f'{request.endpoint} ran {count} queries')
+        return response
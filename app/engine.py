@@ -0,0 +1,100 @@
+from sqlalchemy import event, make_url
+
+# Database engine profiles, picked with DB_PROFILE.
+#
+#   basic       SQLAlchemy defaults, nothing tuned (baseline for benchmarks)
+#   pooled      connection pool sized to one Gunicorn worker's threads, with
+#               pre-ping and recycle so connections dropped by the server or
+#               a proxy are replaced instead of failing a request
+#   sqlite-wal  the same pool plus WAL journaling and connection pragmas, so
+#               readers and the single writer stop blocking each other
+#   auto        sqlite-wal for SQLite files, pooled for everything else
+#
+# Each worker process gets its own pool: the server sees at most
+# workers * (pool size + overflow) connections (WEB_CONCURRENCY and
+# GUNICORN_THREADS, see gunicorn.conf.py).
+
+PROFILES = ('auto', 'basic', 'pooled', 'sqlite-wal')
+
+
+def _is_file_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def resolve_profile(name, uri):
+    url = make_url(uri)
+    if name not in PROFILES:
+        raise ValueError(f'Unknown DB_PROFILE: {name!r}')
+    if url.get_backend_name() == 'sqlite' and not _is_file_sqlite(url):
+        return 'basic' # in-memory SQLite uses a static single-connection pool
+    if name == 'auto':
+        return 'sqlite-wal' if _is_file_sqlite(url) else 'pooled'
+    if name == 'sqlite-wal' and not _is_file_sqlite(url):
+        raise ValueError("DB_PROFILE='sqlite-wal' needs a SQLite database file")
+    return name
+
+
+def engine_options(profile, config):
+    """create_engine() keyword arguments for `profile`."""
+    if profile == 'basic':
+        return {}
+    threads = config.get('GUNICORN_THREADS', 1)
+    options = {
+        # One connection per request thread, plus headroom for requests that
+        # briefly hold two (streamed responses, engine.begin() next to the session)
+        'pool_size': config.get('DB_POOL_SIZE') or threads,
+        'max_overflow': config.get('DB_MAX_OVERFLOW') if config.get('DB_MAX_OVERFLOW') is not None else max(threads, 2),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+    }
+    if profile == 'pooled':
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = config.get('DB_POOL_RECYCLE', 1800)
+    return options
+
+
+def sqlite_pragmas(config):
+    return {
+        'journal_mode': 'WAL',
+        'busy_timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'synchronous': 'NORMAL', # with WAL: never corrupts, a power cut can only lose the last commits
+        'mmap_size': config.get('SQLITE_MMAP_SIZE', 256 * 2**20),
+    }
+
+
+def configure(app):
+    """Resolve DB_PROFILE into SQLALCHEMY_ENGINE_OPTIONS. Must run before db.init_app(app)."""
+    profile = resolve_profile(app.config.get('DB_PROFILE', 'auto'), app.config['SQLALCHEMY_DATABASE_URI'])
+    # Options set explicitly in the config class win over the profile
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**engine_options(profile, app.config),
+                                               **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+    app.config['DB_PROFILE_ACTIVE'] = profile
+
+
+def _attach_pragmas(target, pragmas):
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    event.listen(target, 'connect', _set_pragmas)
+
+
+def init_app(app):
+    """Attach per-connection setup for the active profile. Runs after db.init_app(app)."""
+    from app import db
+
+    if app.config.get('DB_PROFILE_ACTIVE') != 'sqlite-wal':
+        return
+    with app.app_context():
+        _attach_pragmas(db.engine, sqlite_pragmas(app.config))
+
+
+def init_replica(app, target):
+    """Per-connection setup for a read replica engine (see app/routing.py)."""
+    if app.config.get('DB_PROFILE_ACTIVE') != 'sqlite-wal' or not _is_file_sqlite(target.url):
+        return
+    # The journal mode belongs to whatever writes the file: a read-only connection cannot switch it
+    pragmas = sqlite_pragmas(app.config)
+    del pragmas['journal_mode']
+    _attach_pragmas(target, pragmas)
@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+import sys
+from datetime import date, datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+
+from app import db
+from app.models import Book, Reservation, Transaction
+
+# Streaming data export.
+#
+# Rows are read with `yield_per` (a server-side cursor on PostgreSQL) and
+# written out one chunk at a time, so an export of any size only ever holds
+# CHUNK_ROWS rows in memory. Used by the admin export endpoint and by
+# `flask export <dataset>`. Parquet needs the optional pyarrow package.
+
+export_cli = AppGroup('export', help='Stream table exports as CSV / JSONL / Parquet.')
+
+CHUNK_ROWS = 2000
+
+# dataset -> (model, column the date range filters on)
+DATASETS = {
+    'transactions': (Transaction, Transaction.issued_date),
+    'books': (Book, Book.created_at),
+    'reservations': (Reservation, Reservation.created_at),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+def export_query(dataset, start=None, end=None):
+    """SELECT of every column of `dataset`, optionally limited to [start, end] (dates, inclusive)."""
+    model, date_column = DATASETS[dataset]
+    stmt = db.select(*model.__table__.columns).order_by(model.id)
+    if start:
+        stmt = stmt.where(date_column >= start)
+    if end:
+        stmt = stmt.where(date_column < end + timedelta(days=1))
+    return stmt
+
+
+def _rows(dataset, start, end):
+    """(column names, iterator of row chunks) streamed from the database."""
+    result = db.session.execute(export_query(dataset, start, end).execution_options(yield_per=CHUNK_ROWS))
+    return list(result.keys()), result.partitions()
+
+
+def _text(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _csv(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _jsonl(columns, chunks):
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, map(_text, row)))) + '\n' for row in chunk)
+
+
+class _Drain(io.RawIOBase):
+    # Write-only sink: the Parquet writer appends, the generator takes what is there
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position # the writer records column chunk offsets
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def take(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def _arrow_type(pa, column):
+    python_type = column.type.python_type
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is datetime:
+        return pa.timestamp('us')
+    return pa.string()
+
+
+def _parquet(columns, chunks, table):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(name, _arrow_type(pa, table.c[name])) for name in columns])
+    sink = _Drain()
+    # One row group per chunk; the footer is written on close
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in chunk], schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+def stream_export(dataset, fmt, start=None, end=None):
+    """Generator of CSV/JSONL text or Parquet bytes for `dataset`."""
+    if fmt == 'parquet':
+        try:
+            import pyarrow.parquet # noqa: F401
+        except ImportError as e:
+            raise ExportUnavailable('Parquet export requires the optional pyarrow package') from e
+    columns, chunks = _rows(dataset, start, end)
+    if fmt == 'csv':
+        return _csv(columns, chunks)
+    if fmt == 'jsonl':
+        return _jsonl(columns, chunks)
+    return _parquet(columns, chunks, DATASETS[dataset][0].__table__)
+
+
+def _export_command(dataset):
+    @click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv', show_default=True)
+    @click.option('--start', type=click.DateTime(['%Y-%m-%d']), help='First day to include.')
+    @click.option('--end', type=click.DateTime(['%Y-%m-%d']), help='Last day to include.')
+    @click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True), help='Defaults to stdout.')
+    def command(fmt, start, end, output):
+        try:
+            chunks = stream_export(dataset, fmt, start and start.date(), end and end.date())
+        except ExportUnavailable as e:
+            raise click.ClickException(str(e)) from e
+        binary = fmt == 'parquet'
+        if output:
+            out = open(output, 'wb') if binary else open(output, 'w', newline='')
+        else:
+            out = sys.stdout.buffer if binary else sys.stdout
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if output:
+                out.close()
+
+    date_column = DATASETS[dataset][1].key
+    command.__doc__ = f'Stream the {dataset} table (date range on {date_column}).'
+    return export_cli.command(dataset)(command)
+
+
+for _dataset in DATASETS:
+    _export_command(_dataset)
@@ -0,0 +1,232 @@
+import csv
+import json
+import os
+import re
+import time
+from datetime import datetime
+from itertools import islice
+from multiprocessing import Pool
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import covers, db
+from app.catalog import invalidate_catalog
+from app.models import Book
+from app.stats import rebuild_stats
+
+# Bulk catalogue import.
+#
+# Records are streamed from the file (CSV, JSON Lines, or MARC21 with the
+# optional `pymarc` package), validated, deduplicated on ISBN and written in
+# batches of `INSERT ... ON CONFLICT (isbn) DO UPDATE`, so memory stays flat
+# whatever the file size. Validation can run in a process pool (--workers).
+
+catalog_cli = AppGroup('catalog', help='Catalogue import tools.')
+
+DEFAULT_BATCH = 1000
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.mrc': 'marc', '.marc': 'marc'}
+
+# Source field -> Book column
+ALIASES = {'year': 'publication_year', 'cover': 'cover_image', 'stock': 'quantity', 'rating': 'average_rating'}
+TEXT_FIELDS = {'title': 200, 'author': 100, 'category': 50, 'language': 30, 'publisher': 100, 'cover_image': 200}
+INT_FIELDS = ('publication_year', 'pages', 'quantity')
+FLOAT_FIELDS = ('price', 'average_rating')
+# Catalogue metadata overwritten when an ISBN already exists and the record has a value for it
+# (stock is adjusted separately)
+UPDATED_FIELDS = ('title', 'author', 'category', 'language', 'publication_year', 'publisher',
+                  'description', 'cover_image', 'price', 'pages')
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def normalize_isbn(value):
+    isbn = re.sub(r'[^0-9Xx]', '', str(value or '')).upper()
+    if len(isbn) not in (10, 13):
+        raise InvalidRecord(f'bad ISBN {value!r}')
+    return isbn
+
+
+def _text(value):
+    return str(value).strip() if value is not None else ''
+
+
+def normalize(record):
+    """Validate one raw record (dict of strings) into Book column values.
+
+    Fields the record leaves out are None, so an update keeps the stored value.
+    """
+    if not isinstance(record, dict):
+        raise InvalidRecord(f'expected an object, got {type(record).__name__}')
+    record = {ALIASES.get(str(k).strip().lower(), str(k).strip().lower()): v for k, v in record.items() if k}
+    row = {'isbn': normalize_isbn(record.get('isbn'))}
+    for field, size in TEXT_FIELDS.items():
+        row[field] = _text(record.get(field))[:size] or None
+    if not row['title'] or not row['author']:
+        raise InvalidRecord(f'{row["isbn"]}: title and author are required')
+    row['description'] = _text(record.get('description')) or None
+    try:
+        for field in INT_FIELDS:
+            value = record.get(field)
+            row[field] = int(value) if value not in (None, '') else None
+        for field in FLOAT_FIELDS:
+            value = record.get(field)
+            row[field] = float(value) if value not in (None, '') else None
+    except (TypeError, ValueError) as e:
+        raise InvalidRecord(f'{row["isbn"]}: {e}') from e
+    if row['quantity'] is not None and row['quantity'] < 0:
+        raise InvalidRecord(f'{row["isbn"]}: negative stock {row["quantity"]}')
+    row['available_count'] = row['quantity']
+    row['average_rating'] = row['average_rating'] or 0.0 # only used for new books
+    return row
+
+
+def _normalize_chunk(chunk):
+    """Pool worker: (valid rows, error messages) for a list of raw records."""
+    rows, errors = [], []
+    for raw in chunk:
+        try:
+            rows.append(normalize(json.loads(raw) if isinstance(raw, str) else raw))
+        except InvalidRecord as e:
+            errors.append(str(e))
+        except json.JSONDecodeError as e:
+            errors.append(f'invalid JSON: {e}')
+    return rows, errors
+
+
+def _marc_records(f):
+    try:
+        from pymarc import MARCReader
+    except ImportError as e:
+        raise click.ClickException('MARC import requires the optional pymarc package') from e
+    for record in MARCReader(f, to_unicode=True, force_utf8=True):
+        if record is None:
+            continue
+        def first(tag, code):
+            fields = record.get_fields(tag)
+            values = fields[0].get_subfields(code) if fields else []
+            return values[0].strip(' /:;,.') if values else None
+        yield {
+            'isbn': first('020', 'a'), 'title': first('245', 'a'), 'author': first('100', 'a'),
+            'publisher': first('260', 'b') or first('264', 'b'), 'year': re.sub(r'\D', '', first('260', 'c') or '')[:4],
+            'description': first('520', 'a'), 'category': first('650', 'a'),
+        }
+
+
+def raw_records(path, fmt):
+    """Stream raw records: JSONL lines stay unparsed strings so the pool can decode them."""
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            yield from csv.DictReader(f)
+    elif fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield line
+    elif fmt == 'marc':
+        with open(path, 'rb') as f:
+            yield from _marc_records(f)
+    else:
+        raise click.ClickException(f'Unknown format: {fmt}')
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def upsert_books(rows):
+    """Write one batch with INSERT ... ON CONFLICT (isbn) DO UPDATE. Rows are deduplicated on ISBN."""
+    rows = list({row['isbn']: row for row in rows}.values())
+    if not rows:
+        return 0
+    insert = postgresql.insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    # Core table insert: the ORM bulk path would replace None with the column defaults
+    stmt = insert(Book.__table__)
+    # A field the record leaves out (NULL) keeps the stored value
+    update = {field: db.func.coalesce(getattr(stmt.excluded, field), getattr(Book, field)) for field in UPDATED_FIELDS}
+    # Same rule as librarian.edit_book: a new quantity shifts available_count by the difference
+    quantity = db.func.coalesce(stmt.excluded.quantity, Book.quantity)
+    update['quantity'] = quantity
+    update['available_count'] = Book.available_count + quantity - Book.quantity
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['isbn'], set_=update), rows)
+    # New books get the model defaults for what the record left out
+    db.session.execute(
+        db.update(Book)
+        .where(Book.isbn.in_([row['isbn'] for row in rows]),
+               db.or_(Book.quantity.is_(None), Book.price.is_(None)))
+        .values(quantity=db.func.coalesce(Book.quantity, 1), available_count=db.func.coalesce(Book.available_count, 1),
+                price=db.func.coalesce(Book.price, 0.0))
+        .execution_options(synchronize_session=False)
+    )
+    covers.register(db.session.connection(), [row.get('cover_image') for row in rows])
+    db.session.commit()
+    return len(rows)
+
+
+def import_catalog(path, fmt=None, batch_size=DEFAULT_BATCH, workers=0, on_progress=None, on_error=None):
+    """Import a catalogue file. Returns a dict of counters."""
+    fmt = fmt or FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise click.ClickException('Cannot tell the file format, pass --format')
+    totals = {'read': 0, 'written': 0, 'invalid': 0}
+    start = time.perf_counter()
+
+    chunks = _chunks(raw_records(path, fmt), batch_size)
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap(_normalize_chunk, chunks) if pool else map(_normalize_chunk, chunks)
+        for rows, errors in results:
+            totals['read'] += len(rows) + len(errors)
+            totals['invalid'] += len(errors)
+            if on_error:
+                for message in errors:
+                    on_error(message)
+            totals['written'] += upsert_books(rows)
+            if on_progress:
+                on_progress(totals, time.perf_counter() - start)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    # Bulk statements skip the ORM flush hooks: refresh the derived data once at the end
+    rebuild_stats()
+    invalidate_catalog()
+    totals['seconds'] = time.perf_counter() - start
+    return totals
+
+
+@catalog_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl', 'marc']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=DEFAULT_BATCH, show_default=True, help='Rows per INSERT ... ON CONFLICT batch.')
+@click.option('--workers', default=0, show_default=True, help='Processes used to parse/validate (0 = inline).')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False, writable=True), help='Write rejected records here.')
+def import_command(path, fmt, batch_size, workers, errors_path):
+    """Stream a CSV / JSONL / MARC catalogue file into the book table."""
+    errors_file = open(errors_path, 'w', encoding='utf-8') if errors_path else None
+    last_report = [0.0]
+
+    def progress(totals, elapsed):
+        if elapsed - last_report[0] >= 2:
+            last_report[0] = elapsed
+            click.echo(f'{totals["read"]:,} read, {totals["written"]:,} written, {totals["invalid"]:,} invalid '
+                       f'({totals["read"] / elapsed:,.0f} records/s)')
+
+    def error(message):
+        if errors_file:
+            errors_file.write(message + '\n')
+
+    try:
+        totals = import_catalog(path, fmt, batch_size, workers, progress, error)
+    finally:
+        if errors_file:
+            errors_file.close()
+    rate = totals['read'] / totals['seconds'] if totals['seconds'] else 0.0
+    click.echo(f'Done at {datetime.now():%H:%M:%S}: {totals["read"]:,} records, {totals["written"]:,} upserted, '
+               f'{totals["invalid"]:,} rejected in {totals["seconds"]:.1f}s ({rate:,.0f} records/s)')
@@ -0,0 +1,88 @@
+import random
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.util import identity_key
+
+from app import db, stats
+from app.models import Book
+
+# Stock writes that stay correct under concurrent workers (wallets: app.wallet).
+#
+# Each change is one conditional UPDATE (`... WHERE available_count > 0`), so
+# the database serialises writers on the row itself instead of Python doing
+# read-modify-write on a possibly stale copy. On PostgreSQL the UPDATE takes the row lock and
+# re-checks its WHERE clause after a concurrent commit; on SQLite writers
+# queue on the database lock. with_retry() replays a unit of work when the
+# database reports a lock timeout, serialization failure or deadlock.
+
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.02 # seconds, doubled (with jitter) on every attempt
+
+_CONFLICT_PGCODES = ('40001', '40P01') # serialization_failure, deadlock_detected
+
+
+def _is_conflict(error):
+    orig = getattr(error, 'orig', None)
+    return getattr(orig, 'pgcode', None) in _CONFLICT_PGCODES or 'database is locked' in str(orig)
+
+
+def with_retry(work, attempts=RETRY_ATTEMPTS):
+    """Run `work()` (which commits), rolling back and retrying on write conflicts."""
+    for attempt in range(attempts):
+        try:
+            return work()
+        except OperationalError as e:
+            db.session.rollback()
+            if not _is_conflict(e) or attempt == attempts - 1:
+                raise
+            time.sleep(RETRY_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def _expire(model, pk, attributes):
+    # Objects already loaded in this session must not keep the pre-UPDATE values
+    obj = db.session.identity_map.get(identity_key(model, pk))
+    if obj is not None:
+        db.session.expire(obj, attributes)
+
+
+def _book_changed(available_before, available_after):
+    # Bulk UPDATEs skip the flush hooks: keep the low-stock counter in step. The catalogue
+    # cache is left alone, stock shown on cached shelves refreshes within CATALOG_LIVE_TTL.
+    was_low = available_before < stats.LOW_STOCK_THRESHOLD
+    is_low = available_after < stats.LOW_STOCK_THRESHOLD
+    if was_low != is_low:
+        stats.adjust('low_stock_books', 1 if is_low else -1)
+
+
+def take_copy(book_id, sold=False):
+    """Atomically remove one available copy (and one owned copy when `sold`). False if none is left."""
+    values = {'available_count': Book.available_count - 1}
+    if sold:
+        values['quantity'] = Book.quantity - 1
+    available = db.session.scalar(
+        db.update(Book)
+        .where(Book.id == book_id, Book.available_count > 0)
+        .values(**values)
+        .returning(Book.available_count)
+        .execution_options(synchronize_session=False)
+    )
+    if available is None:
+        return False
+    _book_changed(available + 1, available)
+    _expire(Book, book_id, ['available_count', 'quantity'])
+    return True
+
+
+def return_copy(book_id):
+    """Atomically put one copy back on the shelf."""
+    available = db.session.scalar(
+        db.update(Book)
+        .where(Book.id == book_id)
+        .values(available_count=Book.available_count + 1)
+        .returning(Book.available_count)
+        .execution_options(synchronize_session=False)
+    )
+    _book_changed(available - 1, available)
+    _expire(Book, book_id, ['available_count'])
+
@@ -1,11 +1,62 @@
+import time
 from datetime import datetime
+from decimal import Decimal
+from flask import current_app
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
+from app.cache import TTLCache, cache
+
+# Snapshots live in this worker; the per-user version they are keyed on lives in the app
+# cache, so with a shared backend (sqlite/redis) a change is seen by every worker at once.
+# With the per-worker memory backend other workers catch up within USER_CACHE_TTL.
+_snapshots = TTLCache(maxsize=4096)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Flask-Login already keeps current_user for the rest of the request; across requests
+    # a short-lived snapshot saves the per-request User lookup.
+    user_id = int(user_id)
+    key = f'user:{user_id}:{_user_version(user_id)}'
+    snapshot = _snapshots.get(key)
+    if snapshot is None:
+        user = db.session.get(User, user_id, options=[joinedload(User.wallet)])
+        if user is None:
+            return None
+        snapshot = UserSnapshot(user)
+        _snapshots.set(key, snapshot, ttl=current_app.config.get('USER_CACHE_TTL', 30))
+    return snapshot
+
+def _user_version(user_id):
+    version = cache.get(f'user:{user_id}:version')
+    return version if version is not None else invalidate_user(user_id)
+
+def invalidate_user(user_id):
+    # Moving the per-user version on orphans every cached snapshot, including one written
+    # by a request that read the row just before the change. Time-based, like the catalogue
+    # versions, so an evicted version never brings an old snapshot back.
+    version = time.time_ns()
+    cache.set(f'user:{user_id}:version', version, ttl=0)
+    return version
+
+class UserSnapshot(UserMixin):
+    # Read-only copy of the User columns used by templates and role checks on every request.
+    # Use .model() when the full ORM object is needed.
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.role = user.role
+        self.full_name = user.full_name
+        self.wallet_balance = user.wallet_balance
+
+    def model(self):
+        return db.session.get(User, self.id)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -18,9 +69,12 @@ class User(UserMixin, db.Model):
     # Profile fields
     full_name = db.Column(db.String(100))
     contact_number = db.Column(db.String(20))
-    wallet_balance = db.Column(db.Float, default=0.0)
+    # Superseded by WalletAccount (integer cents); read once as the opening balance by the
+    # wallet ledger migration (or `flask wallet init` on databases built with create_all)
+    legacy_wallet_balance = db.Column('wallet_balance', db.Float, default=0.0)
 
     # Relationships
+    wallet = db.relationship('WalletAccount', uselist=False)
     transactions = db.relationship('Transaction', backref='user', lazy='dynamic')
     reservations = db.relationship('Reservation', backref='user', lazy='dynamic')
     reviews = db.relationship('Review', backref='author', lazy='dynamic')
@@ -32,6 +86,11 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    @property
+    def wallet_balance(self):
+        # Decimal dollars from the cached ledger balance
+        return (Decimal(self.wallet.balance_cents if self.wallet else 0) / 100).quantize(Decimal('0.01'))
+
     def __repr__(self):
         return f'<User {self.username}>'
 
@@ -54,6 +113,8 @@ class Book(db.Model):
     pages = db.Column(db.Integer)
     average_rating = db.Column(db.Float, default=0.0)
     rating_count = db.Column(db.Integer, default=0)
+    # Sum of the review ratings (app.ratings); average_rating is derived from it on every write
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # User Seller Field
     seller_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True) # Null if library owned
@@ -82,6 +143,18 @@ class Transaction(db.Model):
     transaction_type = db.Column(db.String(20), default='borrow') # borrow, purchase
     amount = db.Column(db.Float, default=0.0) # Cost of purchase
 
+    # Indexes for the status-filtered queries (also in migrations/versions)
+    __table_args__ = (
+        db.Index('ix_transaction_user_status', 'user_id', 'status'),
+        db.Index('ix_transaction_book_status', 'book_id', 'status'),
+        db.Index('ix_transaction_status_issued', 'status', 'issued_date'),
+        db.Index('ix_transaction_type_status_issued', 'transaction_type', 'status', 'issued_date', 'id'),
+        db.Index('ix_transaction_issued_date', 'issued_date'),
+        # Active loans by due date (overdue scans); only 'issued' rows are indexed
+        db.Index('ix_transaction_active_due', 'due_date',
+                 sqlite_where=db.text("status = 'issued'"), postgresql_where=db.text("status = 'issued'")),
+    )
+
     def __repr__(self):
         return f'<Transaction {self.id} - {self.status}>'
 
@@ -91,6 +164,15 @@ class Reservation(db.Model):
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     status = db.Column(db.String(20), default='pending') # pending, approved, cancelled, fulfilled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # A copy is set aside for this reservation, off the shelf (app.reservations); issuing it takes no stock
+    copy_held = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    __table_args__ = (
+        db.Index('ix_reservation_status_created', 'status', 'created_at'),
+        db.Index('ix_reservation_user_book_status', 'user_id', 'book_id', 'status'),
+        # Per-book FIFO queue (app.reservations); also serves (book_id, status) lookups
+        db.Index('ix_reservation_queue', 'book_id', 'status', 'created_at', 'id'),
+    )
 
     def __repr__(self):
         return f'<Reservation {self.id}>'
@@ -102,3 +184,120 @@ class Review(db.Model):
     rating = db.Column(db.Integer) # 1-5
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # One review per reader and book; the book's list is paged newest first
+        db.Index('uq_review_user_book', 'user_id', 'book_id', unique=True),
+        db.Index('ix_review_book_created', 'book_id', 'created_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<Review {self.book_id} {self.rating}>'
+
+class SalesRollup(db.Model):
+    # Pre-aggregated sales per (day, category, seller), maintained by app.analytics.record_sale
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    category = db.Column(db.String(50), nullable=False, default='') # '' when the book has none
+    seller_id = db.Column(db.Integer, nullable=False, default=0) # 0 for library-owned books
+    sales_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'category', 'seller_id', name='uq_sales_rollup_bucket'),
+    )
+
+    def __repr__(self):
+        return f'<SalesRollup {self.day} {self.category} {self.seller_id}>'
+
+class BookNeighbor(db.Model):
+    # "Similar books" precomputed by app.neighbors; book_details reads one primary-key range.
+    # No foreign keys: the table is rebuilt offline and a deleted book just drops out of the join.
+    __tablename__ = 'book_neighbors'
+    book_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    neighbor_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<BookNeighbor {self.book_id} #{self.rank} {self.neighbor_id}>'
+
+class UserRecommendation(db.Model):
+    # Personal top-N precomputed by `flask recommendations train`; read by the 'personal' recommender.
+    # No foreign keys, like book_neighbors: rebuilt offline, stale rows drop out of the join.
+    __tablename__ = 'user_recommendations'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    book_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<UserRecommendation {self.user_id} #{self.rank} {self.book_id}>'
+
+class Cover(db.Model):
+    # Local copy of a cover image (app.covers). `digest` is the sha256 of the original and names
+    # the directory holding its resized variants. No foreign key: books sharing a source share a row.
+    key = db.Column(db.String(32), primary_key=True) # sha256(source)[:32], carried in /covers/ URLs
+    source = db.Column(db.String(500), nullable=False) # http(s) URL, or upload:<digest>
+    digest = db.Column(db.String(64))
+    status = db.Column(db.String(10), nullable=False, default='pending') # pending, ready, failed
+    error = db.Column(db.String(200))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Cover {self.key} {self.status}>'
+
+class LibraryStat(db.Model):
+    # Dashboard counters kept up to date by app.stats on every flush
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<LibraryStat {self.name}={self.value}>'
+
+class WalletEntry(db.Model):
+    # Append-only wallet ledger: credits are positive, debits negative, all in cents
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    amount_cents = db.Column(db.BigInteger, nullable=False)
+    kind = db.Column(db.String(20), nullable=False) # opening, sale, payout, adjustment
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    transaction = db.relationship('Transaction')
+
+    __table_args__ = (
+        db.Index('ix_wallet_entry_user_id', 'user_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<WalletEntry {self.user_id} {self.amount_cents:+d}>'
+
+class WalletAccount(db.Model):
+    # Cached balance, moved with atomic increments, plus the last compaction snapshot:
+    # balance == snapshot_cents + sum(entries with id > snapshot_entry_id)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    balance_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    snapshot_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    snapshot_entry_id = db.Column(db.Integer, nullable=False, default=0)
+    snapshot_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<WalletAccount {self.user_id} {self.balance_cents}>'
+
+# Drop cached snapshots of users whose row changed (role, wallet, profile) once the write commits
+@event.listens_for(Session, 'after_flush')
+def _track_user_writes(session, flush_context):
+    changed = [obj.id for obj in session.dirty if isinstance(obj, User) and session.is_modified(obj)]
+    changed += [obj.id for obj in session.deleted if isinstance(obj, User)]
+    if changed:
+        session.info.setdefault('changed_users', set()).update(changed)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users_on_commit(session):
+    for user_id in session.info.pop('changed_users', ()):
+        invalidate_user(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_user_writes(session):
+    session.info.pop('changed_users', None)
@@ -0,0 +1,265 @@
+import re
+import resource
+import time
+import tracemalloc
+
+import click
+from flask.cli import AppGroup
+
+from app import db
+from app.models import Book, BookNeighbor, Transaction
+
+# Offline "similar books" builder.
+#
+# Two sparse item-item similarities are computed with vectorised NumPy:
+# co-occurrence in readers' borrow/purchase history, and shared title /
+# author / description / category terms (IDF-weighted). Both are cosine
+# scores over "baskets" (a reader's books, a term's books), blended, and the
+# top k neighbours of every book are written to book_neighbors, which
+# book_details reads with a single primary-key range scan.
+# NumPy is only needed by this job: `pip install -r requirements-jobs.txt` where it runs.
+
+neighbors_cli = AppGroup('neighbors', help='Similar-books table.')
+
+DEFAULT_K = 6
+TEXT_WEIGHT = 0.3 # share of the blended score coming from text similarity
+MAX_BASKET = 200 # larger baskets (power readers, very common terms) say little and cost O(n^2)
+PAIRS_PER_BATCH = 2_000_000 # pairs generated per vectorised step
+PAIRS_PER_SHARD = 10_000_000 # pairs merged at once; bounds peak memory
+LOAD_CHUNK = 100_000
+
+TOKEN = re.compile(r'[a-z0-9]{3,}')
+STOPWORDS = frozenset('the and for with from that this about book books must read fantastic'.split())
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise click.ClickException('Building book neighbours requires NumPy (pip install -r requirements-jobs.txt)') from e
+    return numpy
+
+
+def _merge(np, keys, weights):
+    """Sum the weights of equal keys."""
+    keys = np.concatenate(keys)
+    weights = np.concatenate(weights)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=weights)
+
+
+def _empty(np):
+    return np.empty(0, dtype=np.int64), np.empty(0)
+
+
+def group_baskets(np, baskets, items, n_items, basket_weights=None, max_basket=MAX_BASKET):
+    """Deduplicate (basket, item) memberships and group them by basket.
+
+    Returns (items, starts, sizes, weights, norms): the items of basket b are
+    items[starts[b]:starts[b] + sizes[b]] in ascending order, `weights` is the
+    squared basket weight (1 unless `basket_weights` is given, e.g. IDF) and
+    `norms` the cosine norm of every item. Baskets that cannot form a pair or
+    hold more than `max_basket` items are left out of the grouping but still
+    count towards the norms.
+    """
+    order = np.lexsort((items, baskets))
+    baskets, items = baskets[order], items[order]
+    fresh = np.ones(len(baskets), dtype=bool)
+    fresh[1:] = (baskets[1:] != baskets[:-1]) | (items[1:] != items[:-1])
+    baskets, items = baskets[fresh], items[fresh]
+
+    starts = np.flatnonzero(np.r_[True, baskets[1:] != baskets[:-1]]) if len(baskets) else baskets
+    sizes = np.diff(np.r_[starts, len(baskets)])
+    if basket_weights is None:
+        weights = np.ones(len(starts))
+    else:
+        weights = basket_weights[baskets[starts]] ** 2
+    norms = np.sqrt(np.bincount(items, weights=np.repeat(weights, sizes), minlength=n_items))
+    pairable = (sizes >= 2) & (sizes <= max_basket)
+    return items, starts[pairable], sizes[pairable], weights[pairable], norms
+
+
+def _directed_pairs(np, grouped, shard, shards):
+    """Yield (src, dst, weight) chunks of co-membership pairs whose src falls in `shard`."""
+    items, starts, sizes, weights, _ = grouped
+    for size in np.unique(sizes):
+        first, second = np.triu_indices(size, 1)
+        src_at, dst_at = np.r_[first, second], np.r_[second, first]
+        rows = np.flatnonzero(sizes == size)
+        step = max(1, PAIRS_PER_BATCH // len(src_at))
+        for lo in range(0, len(rows), step):
+            batch = rows[lo:lo + step]
+            members = items[starts[batch, None] + np.arange(size)]
+            src = members[:, src_at].ravel()
+            dst = members[:, dst_at].ravel()
+            mine = src % shards == shard
+            yield src[mine], dst[mine], np.repeat(weights[batch], len(src_at))[mine]
+
+
+def _shard_scores(np, grouped, n_items, shard, shards):
+    """Cosine scores of one signal for the pairs in `shard`, keyed src * n_items + dst."""
+    chunks = list(_directed_pairs(np, grouped, shard, shards))
+    if not chunks:
+        return _empty(np)
+    keys, dot = _merge(np, [src * n_items + dst for src, dst, _ in chunks], [w for *_, w in chunks])
+    # Baskets weighted 0 (a term every book has) add pairs but no similarity
+    keys, dot = keys[dot > 0], dot[dot > 0]
+    norms = grouped[4]
+    return keys, dot / (norms[keys // n_items] * norms[keys % n_items])
+
+
+def top_k(np, src, dst, score, k):
+    """Keep the k best neighbours of every src. Returns (src, dst, score, rank)."""
+    order = np.lexsort((dst, -score, src))
+    src, dst, score = src[order], dst[order], score[order]
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]])
+    rank = np.arange(len(src)) - np.repeat(starts, np.diff(np.r_[starts, len(src)]))
+    keep = rank < k
+    return src[keep], dst[keep], score[keep], rank[keep]
+
+
+def compute_neighbors(np, n_items, interactions, terms, k=DEFAULT_K, text_weight=TEXT_WEIGHT,
+                      max_basket=MAX_BASKET):
+    """Blend co-occurrence and term similarity and take the top k per item.
+
+    `interactions` is (reader, item) and `terms` is (term, item), both as pairs
+    of int arrays over dense item indexes 0..n_items-1. Pairs are enumerated
+    in shards of source items so peak memory stays around PAIRS_PER_SHARD
+    pairs whatever the catalogue size. Returns (src, dst, score, rank).
+    """
+    signals = []
+    readers, items = interactions
+    if len(readers):
+        signals.append((group_baskets(np, readers, items, n_items, max_basket=max_basket), 1 - text_weight))
+    term_ids, items = terms
+    if len(term_ids):
+        idf = np.log(n_items / np.maximum(np.bincount(term_ids), 1))
+        signals.append((group_baskets(np, term_ids, items, n_items, idf, max_basket), text_weight))
+
+    total = sum(int((grouped[2] * (grouped[2] - 1)).sum()) for grouped, _ in signals)
+    shards = max(1, -(-total // PAIRS_PER_SHARD))
+    results = []
+    for shard in range(shards):
+        keys, scores = [], []
+        for grouped, weight in signals:
+            shard_keys, score = _shard_scores(np, grouped, n_items, shard, shards)
+            keys.append(shard_keys)
+            scores.append(weight * score)
+        if keys:
+            keys, score = _merge(np, keys, scores)
+            results.append(top_k(np, keys // n_items, keys % n_items, score, k))
+    if not results:
+        src, score = _empty(np)
+        return src, src, score, src
+    return tuple(np.concatenate(column) for column in zip(*results))
+
+
+def _load_interactions(np, book_ids):
+    readers, books = [], []
+    result = db.session.execute(
+        db.select(Transaction.user_id, Transaction.book_id).execution_options(yield_per=LOAD_CHUNK))
+    for chunk in result.partitions():
+        readers.append(np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk)))
+        books.append(np.fromiter((row[1] for row in chunk), dtype=np.int64, count=len(chunk)))
+    if not readers:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    readers, books = np.concatenate(readers), np.concatenate(books)
+    items = np.searchsorted(book_ids, books)
+    known = (items < len(book_ids)) & (book_ids[np.minimum(items, len(book_ids) - 1)] == books)
+    return readers[known], items[known]
+
+
+def _terms(book):
+    _, title, author, description, category = book
+    words = set(TOKEN.findall(f'{title} {description or ""}'.lower())) - STOPWORDS
+    if author:
+        words.add(f'author:{author.lower()}')
+    if category:
+        words.add(f'category:{category.lower()}')
+    return words
+
+
+def _load_terms(np):
+    vocabulary = {}
+    ids, terms, items = [], [], []
+    result = db.session.execute(
+        db.select(Book.id, Book.title, Book.author, Book.description, Book.category)
+        .order_by(Book.id)
+        .execution_options(yield_per=LOAD_CHUNK))
+    for index, book in enumerate(result):
+        ids.append(book[0])
+        for word in _terms(book):
+            terms.append(vocabulary.setdefault(word, len(vocabulary)))
+            items.append(index)
+    return (np.array(ids, dtype=np.int64),
+            (np.array(terms, dtype=np.int64), np.array(items, dtype=np.int64)))
+
+
+def _write(np, book_ids, src, dst, score, rank):
+    db.session.execute(db.delete(BookNeighbor))
+    for lo in range(0, len(src), LOAD_CHUNK):
+        hi = lo + LOAD_CHUNK
+        db.session.execute(db.insert(BookNeighbor), [
+            {'book_id': int(b), 'rank': int(r), 'neighbor_id': int(n), 'score': float(s)}
+            for b, n, s, r in zip(book_ids[src[lo:hi]], book_ids[dst[lo:hi]], score[lo:hi], rank[lo:hi])
+        ])
+    # Readers keep seeing the previous table until this single commit
+    db.session.commit()
+
+
+def build_neighbors(k=DEFAULT_K, text_weight=TEXT_WEIGHT, max_basket=MAX_BASKET, report=None):
+    """Rebuild book_neighbors from the database. Returns {'books', 'rows', timings...}."""
+    np = _numpy()
+    report = report or (lambda *args: None)
+    timings = {}
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    book_ids, terms = _load_terms(np)
+    interactions = _load_interactions(np, book_ids)
+    timings['load'] = time.perf_counter() - start
+    report(f'Loaded {len(book_ids):,} books, {len(interactions[0]):,} interactions, '
+           f'{len(terms[0]):,} term links in {timings["load"]:.1f}s')
+
+    start = time.perf_counter()
+    src, dst, score, rank = compute_neighbors(np, len(book_ids), interactions, terms, k, text_weight, max_basket)
+    timings['compute'] = time.perf_counter() - start
+    report(f'Computed {len(src):,} neighbour rows in {timings["compute"]:.1f}s')
+
+    start = time.perf_counter()
+    _write(np, book_ids, src, dst, score, rank)
+    timings['write'] = time.perf_counter() - start
+    report(f'Wrote book_neighbors in {timings["write"]:.1f}s')
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'books': len(book_ids), 'rows': len(src), **timings,
+            'peak_mb': peak / 2**20, 'max_rss_mb': max_rss_mb()}
+
+
+def max_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def similar_books(book, limit=DEFAULT_K):
+    """Precomputed neighbours of `book`, best first: one indexed join."""
+    return list(db.session.scalars(
+        db.select(Book)
+        .join(BookNeighbor, BookNeighbor.neighbor_id == Book.id)
+        .where(BookNeighbor.book_id == book.id)
+        .order_by(BookNeighbor.rank)
+        .limit(limit)
+    ))
+
+
+@neighbors_cli.command('build')
+@click.option('--k', default=DEFAULT_K, show_default=True, help='Neighbours kept per book.')
+@click.option('--text-weight', default=TEXT_WEIGHT, show_default=True, help='0 = history only, 1 = text only.')
+@click.option('--max-basket', default=MAX_BASKET, show_default=True, help='Skip readers/terms with more books.')
+def build_command(k, text_weight, max_basket):
+    """Rebuild the similar-books table from loan/purchase history and book text."""
+    stats = build_neighbors(k, text_weight, max_basket, report=click.echo)
+    total = stats['load'] + stats['compute'] + stats['write']
+    click.echo(f'Done: {stats["rows"]:,} rows for {stats["books"]:,} books in {total:.1f}s, '
+               f'peak traced memory {stats["peak_mb"]:,.0f} MiB, max RSS {stats["max_rss_mb"]:,.0f} MiB')
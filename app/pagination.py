@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from flask import abort, current_app, request
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import tuple_
+
+from app import db
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+class KeysetPage:
+    """One page of keyset-paginated results plus opaque cursors for its neighbours."""
+
+    def __init__(self, items, next_cursor, prev_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='keyset-cursor')
+
+
+def _dump(value):
+    return {'dt': value.isoformat()} if isinstance(value, datetime) else value
+
+
+def _load(value):
+    return datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+
+
+def encode_cursor(values, direction):
+    return _serializer().dumps({'k': [_dump(v) for v in values], 'd': direction})
+
+
+def decode_cursor(cursor):
+    try:
+        data = _serializer().loads(cursor)
+        return [_load(v) for v in data['k']], data['d']
+    except (BadSignature, KeyError, TypeError, ValueError):
+        abort(400)
+
+
+def keyset_paginate(stmt, order_by, descending=False, cursor=None, per_page=None):
+    """Paginate `stmt` by the unique, indexed key columns in `order_by`.
+
+    Every page is a single `WHERE (k1, k2) > (:v1, :v2) ORDER BY k1, k2 LIMIT n`
+    query, so its cost does not depend on how deep the page is. The last column
+    must be unique (usually the primary key) to keep the ordering stable.
+    `cursor` and `per_page` default to the request's query-string values.
+    """
+    if cursor is None:
+        cursor = request.args.get('cursor')
+    if per_page is None:
+        per_page = request.args.get('per_page', DEFAULT_PER_PAGE, type=int)
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+
+    key = tuple_(*order_by)
+    direction = 'next'
+    if cursor:
+        values, direction = decode_cursor(cursor)
+        if len(values) != len(order_by):
+            abort(400)
+        # Walking backwards flips both the comparison and the sort order
+        forwards = (direction == 'next') != descending
+        stmt = stmt.where(key > tuple_(*values) if forwards else key < tuple_(*values))
+
+    backwards = direction == 'prev'
+    reverse = descending != backwards
+    stmt = stmt.order_by(*[c.desc() if reverse else c.asc() for c in order_by]).limit(per_page + 1)
+
+    rows = list(db.session.scalars(stmt))
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def key_of(row):
+        return [getattr(row, c.key) for c in order_by]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = encode_cursor(key_of(rows[-1]), 'next')
+        if cursor and (has_more or not backwards):
+            prev_cursor = encode_cursor(key_of(rows[0]), 'prev')
+    return KeysetPage(rows, next_cursor, prev_cursor, per_page)
@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request SQL profiler.
+#
+# Engine events time every statement; the request hooks turn that into a
+# Server-Timing header and per-endpoint rolling stats (shown on /admin/perf).
+# Statements slower than SLOW_QUERY_THRESHOLD_MS go to the slow-query log.
+# Stats live in each worker process and cover its last PROFILER_WINDOW requests.
+#
+# Bound parameters carry password hashes, e-mail addresses and the like, so the
+# log only shows their count and types; SLOW_QUERY_LOG_PARAMS adds the raw
+# values for local debugging. The per-request query count is kept even with
+# the profiler off, for the N+1 detector in app.eager.
+
+slow_query_log = logging.getLogger('smart_library.slow_queries')
+
+SLOWEST_PER_REQUEST = 3
+SLOWEST_PER_ENDPOINT = 5
+MAX_LOGGED_PARAMS = 500
+
+_settings = {'enabled': False, 'threshold': 200.0, 'window': 500, 'log_params': False}
+_lock = threading.Lock()
+_stats = {}
+
+
+class EndpointStats:
+    def __init__(self, window):
+        self.samples = deque(maxlen=window) # (total_ms, db_ms, queries)
+        self.requests = 0
+        self.slowest = [] # [(ms, statement)], slowest first
+
+    def add(self, total_ms, db_ms, queries, statements):
+        self.requests += 1
+        self.samples.append((total_ms, db_ms, queries))
+        merged = self.slowest + statements
+        merged.sort(key=lambda s: s[0], reverse=True)
+        self.slowest = merged[:SLOWEST_PER_ENDPOINT]
+
+    def summary(self):
+        totals = sorted(s[0] for s in self.samples)
+        n = len(self.samples)
+        return {
+            'requests': self.requests,
+            'p50': percentile(totals, 50),
+            'p95': percentile(totals, 95),
+            'p99': percentile(totals, 99),
+            'avg_db_ms': sum(s[1] for s in self.samples) / n if n else 0.0,
+            'avg_queries': sum(s[2] for s in self.samples) / n if n else 0.0,
+            'max_queries': max((s[2] for s in self.samples), default=0),
+            'slowest': list(self.slowest),
+        }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def endpoint_summaries():
+    with _lock:
+        return sorted(((name, s.summary()) for name, s in _stats.items()),
+                      key=lambda item: item[1]['p95'], reverse=True)
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+
+
+def slow_query_threshold():
+    return _settings['threshold']
+
+
+def request_query_count():
+    return g.get('sql_count', 0)
+
+
+def describe_params(parameters):
+    """Parameter count and types, without the values."""
+    if isinstance(parameters, list): # executemany: one set per row
+        first = describe_params(parameters[0]) if parameters else '0 params'
+        return f'{len(parameters)} rows of {first}'
+    values = list(parameters.values()) if isinstance(parameters, dict) else list(parameters or ())
+    return f"{len(values)} params ({', '.join(type(v).__name__ for v in values)})"
+
+
+def _raw_params(parameters):
+    params = repr(parameters)
+    if len(params) > MAX_LOGGED_PARAMS: # executemany batches carry every row
+        params = params[:MAX_LOGGED_PARAMS] + '...'
+    return params
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+    if _settings['enabled'] and context is not None:
+        # On the execution context rather than the pooled connection, so a statement
+        # that raises leaves nothing behind for the next one to pick up
+        context.profiler_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'profiler_start', None)
+    if not _settings['enabled'] or start is None:
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if has_request_context():
+        g.sql_ms = g.get('sql_ms', 0.0) + elapsed_ms
+        slowest = g.setdefault('sql_slowest', [])
+        slowest.append((elapsed_ms, statement))
+        slowest.sort(key=lambda s: s[0], reverse=True)
+        del slowest[SLOWEST_PER_REQUEST:]
+
+    if elapsed_ms >= _settings['threshold']:
+        where = request.endpoint if has_request_context() else 'cli'
+        params = _raw_params(parameters) if _settings['log_params'] else describe_params(parameters)
+        slow_query_log.warning('%.1f ms [%s] %s | params=%s', elapsed_ms, where, statement, params)
+
+
+def init_app(app):
+    _settings['enabled'] = app.config.get('SQL_PROFILER', True)
+    _settings['threshold'] = float(app.config.get('SLOW_QUERY_THRESHOLD_MS', 200))
+    _settings['window'] = int(app.config.get('PROFILER_WINDOW', 500))
+    _settings['log_params'] = app.config.get('SLOW_QUERY_LOG_PARAMS', False)
+    if not _settings['enabled']:
+        return
+
+    log_path = app.config.get('SLOW_QUERY_LOG')
+    if log_path and not slow_query_log.handlers:
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_log.addHandler(handler)
+        slow_query_log.setLevel(logging.WARNING)
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.get('request_start')
+        if start is None or request.endpoint in (None, 'static'):
+            return response
+        total_ms = (time.perf_counter() - start) * 1000
+        count, db_ms = g.get('sql_count', 0), g.get('sql_ms', 0.0)
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{count} queries"')
+        response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+        with _lock:
+            stats = _stats.get(request.endpoint)
+            if stats is None:
+                stats = _stats[request.endpoint] = EndpointStats(_settings['window'])
+            stats.add(total_ms, db_ms, count, g.get('sql_slowest', []))
+        return response
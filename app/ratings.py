@@ -0,0 +1,124 @@
+import click
+from flask.cli import AppGroup
+
+from app import db
+from app.models import Book, Review
+
+# Book.rating_sum / rating_count / average_rating kept in step with Review writes.
+#
+# rating_sum is the integer running sum, so every review write is one UPDATE
+# of the book row that adjusts the sum and count from their current values and
+# derives average_rating from them; nothing is carried over in floating point,
+# so the average never drifts. SET expressions always see the row's old values
+# and the UPDATE holds the row lock, so concurrent reviews never lose an update.
+# Edits and deletes go through update_review() / delete_review(): the review
+# row is written conditionally on the rating it was loaded with, and the book
+# only moves when that write hit the row, so a double-submitted delete or two
+# racing edits cannot move the aggregates twice or from a stale rating.
+# `flask reviews rebuild` recomputes the aggregates of reviewed books from the
+# review table; books nobody reviewed keep their catalogue rating.
+
+reviews_cli = AppGroup('reviews', help='Review rating aggregates.')
+
+MIN_RATING = 1
+MAX_RATING = 5
+
+
+def _average(total, count):
+    return db.case((count > 0, db.cast(total, db.Float) / count), else_=0.0)
+
+
+def _update_book(book_id, total, count):
+    db.session.execute(
+        db.update(Book)
+        .where(Book.id == book_id)
+        .values(rating_sum=total, rating_count=count, average_rating=_average(total, count))
+        .execution_options(synchronize_session=False)
+    )
+    # The cached top-rated shelf is not invalidated: it is rebuilt within CATALOG_LIVE_TTL
+
+
+def add_rating(book_id, rating):
+    count = db.func.coalesce(Book.rating_count, 0)
+    _update_book(book_id, Book.rating_sum + rating, count + 1)
+
+
+def change_rating(book_id, old, new):
+    count = db.func.coalesce(Book.rating_count, 0)
+    _update_book(book_id, db.case((count > 0, Book.rating_sum - old + new), else_=new),
+                 db.case((count > 0, count), else_=1))
+
+
+def remove_rating(book_id, rating):
+    count = db.func.coalesce(Book.rating_count, 0)
+    _update_book(book_id, db.case((count > 1, Book.rating_sum - rating), else_=0),
+                 db.case((count > 1, count - 1), else_=0))
+
+
+def _loaded_as(review):
+    # The review row still holds the rating this request read
+    return db.and_(Review.id == review.id, Review.rating.is_not_distinct_from(review.rating))
+
+
+def update_review(review, rating, comment):
+    """Give `review` a new rating and comment and move its book's aggregates, in the caller's transaction.
+
+    False (nothing written) if the review was changed or deleted since it was loaded.
+    """
+    result = db.session.execute(
+        db.update(Review).where(_loaded_as(review)).values(rating=rating, comment=comment)
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        return False
+    if review.rating is None:
+        add_rating(review.book_id, rating)
+    else:
+        change_rating(review.book_id, review.rating, rating)
+    db.session.expire(review, ['rating', 'comment'])
+    return True
+
+
+def delete_review(review):
+    """Delete `review` and take its rating off its book, in the caller's transaction.
+
+    False (nothing written) if the review was changed or deleted since it was loaded.
+    """
+    result = db.session.execute(
+        db.delete(Review).where(_loaded_as(review)).execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        return False
+    if review.rating is not None:
+        remove_rating(review.book_id, review.rating)
+    db.session.expunge(review)
+    return True
+
+
+def rebuild_ratings():
+    """Recompute the aggregates of every reviewed book from its reviews. Returns books updated.
+
+    Books without reviews keep their catalogue rating (seed data / imports).
+    """
+    reviews = (db.select(Review.book_id,
+                         db.func.sum(Review.rating).label('total'),
+                         db.func.count(Review.rating).label('count'))
+               .where(Review.rating.is_not(None))
+               .group_by(Review.book_id)
+               .subquery())
+    result = db.session.execute(
+        db.update(Book)
+        .where(Book.id == reviews.c.book_id)
+        .values(rating_sum=reviews.c.total, rating_count=reviews.c.count,
+                average_rating=_average(reviews.c.total, reviews.c.count))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.info['catalog_changed'] = True
+    db.session.commit()
+    return result.rowcount
+
+
+@reviews_cli.command('rebuild')
+def rebuild_command():
+    """Recompute rating_sum / rating_count / average_rating of reviewed books from the review table."""
+    click.echo(f'Rebuilt ratings of {rebuild_ratings()} books.')
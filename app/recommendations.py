@@ -0,0 +1,314 @@
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app import db
+from app.cache import cache
+from app.catalog import book_ids
+from app.models import Book, Reservation, Transaction, UserRecommendation
+from app.neighbors import max_rss_mb
+
+# Strategies behind the homepage "Recommended" shelf. Each one takes
+# (user, limit) and returns a list of Book; pick one with the
+# RECOMMENDER config key.
+#
+# 'personal' reads each reader's top-N from user_recommendations, which
+# `flask recommendations train` fills offline: implicit-feedback matrix
+# factorisation (alternating least squares, conjugate-gradient solves) over
+# loan, purchase and reservation history, in NumPy. NumPy is only needed by
+# the training job: `pip install -r requirements-jobs.txt` where it runs.
+_strategies = {}
+
+recommendations_cli = AppGroup('recommendations', help='Personal recommendations.')
+
+FACTORS = 32
+EPOCHS = 10
+REGULARIZATION = 0.1
+ALPHA = 10.0 # confidence gained per interaction (Hu, Koren & Volinsky)
+CG_STEPS = 3
+TOP_N = 20
+CANDIDATES = 100_000 # only the most interacted-with books are scored
+TRANSACTION_WEIGHT = 1.0
+RESERVATION_WEIGHT = 0.5
+POPULAR_WINDOW_DAYS = 30
+
+INTERACTIONS_PER_CHUNK = 500_000
+SCORE_CELLS = 20_000_000 # users * candidates scored per matrix product
+LOAD_CHUNK = 100_000
+
+
+def recommender(name):
+    def decorator(f):
+        _strategies[name] = f
+        return f
+    return decorator
+
+
+def recommended_books(user=None, limit=10):
+    strategy = _strategies[current_app.config.get('RECOMMENDER', 'random')]
+    return strategy(user, limit)
+
+
+def fetch_in_order(ids):
+    """Load the given Book ids with one query, keeping the order of `ids`."""
+    if not ids:
+        return []
+    books = {b.id: b for b in db.session.scalars(db.select(Book).where(Book.id.in_(ids)))}
+    return [books[i] for i in ids if i in books]
+
+
+def _ttl():
+    return current_app.config.get('RECOMMENDATION_CACHE_TTL', 900)
+
+
+@recommender('random')
+def random_books(user, limit):
+    # Sample from the cached id array, then load only the picked rows
+    ids = book_ids()
+    return fetch_in_order(random.sample(ids, min(len(ids), limit)))
+
+
+@recommender('popular')
+def popular_books(user, limit):
+    # Most borrowed/bought over the last month; random picks until there is any history
+    key = f'recommendations:popular:{limit}'
+    ids = cache.get(key)
+    if ids is None:
+        since = datetime.utcnow() - timedelta(days=POPULAR_WINDOW_DAYS)
+        ids = list(db.session.scalars(
+            db.select(Transaction.book_id)
+            .where(Transaction.issued_date >= since)
+            .group_by(Transaction.book_id)
+            .order_by(db.func.count().desc(), Transaction.book_id)
+            .limit(limit)
+        ))
+        cache.set(key, ids, ttl=_ttl())
+    return fetch_in_order(ids) or random_books(user, limit)
+
+
+@recommender('personal')
+def personal_books(user, limit):
+    # Anonymous and not-yet-trained readers get the popular shelf
+    if user is None:
+        return popular_books(user, limit)
+    key = f'recommendations:user:{user.id}:{limit}'
+    ids = cache.get(key)
+    if ids is None:
+        books = list(db.session.scalars(
+            db.select(Book)
+            .join(UserRecommendation, UserRecommendation.book_id == Book.id)
+            .where(UserRecommendation.user_id == user.id)
+            .order_by(UserRecommendation.rank)
+            .limit(limit)
+        ))
+        cache.set(key, [b.id for b in books], ttl=_ttl())
+    else:
+        books = fetch_in_order(ids)
+    return books or popular_books(user, limit)
+
+
+# --- Offline training ---
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise click.ClickException('Training recommendations requires NumPy (pip install -r requirements-jobs.txt)') from e
+    return numpy
+
+
+def _solve(np, rows, cols, conf, X, Y, reg, cg_steps):
+    """One ALS half-step: refit X against fixed Y, in place.
+
+    Minimises sum(c * (1 - x.y)^2) over observed (row, col) pairs plus
+    sum((x.y)^2) over all other pairs plus reg * |x|^2, with a few conjugate
+    gradient steps warm-started from the current X. Interactions must be
+    sorted by row; they are streamed in chunks, so the cost per step is
+    O(nnz * factors) with memory independent of nnz.
+    """
+    gram = Y.T @ Y + reg * np.eye(Y.shape[1], dtype=Y.dtype)
+    chunks = [(lo, min(lo + INTERACTIONS_PER_CHUNK, len(rows))) for lo in range(0, len(rows), INTERACTIONS_PER_CHUNK)]
+
+    def accumulate(values, lo, hi, out):
+        r = rows[lo:hi]
+        starts = np.flatnonzero(np.r_[True, r[1:] != r[:-1]])
+        out[r[starts]] += np.add.reduceat(values, starts, axis=0)
+
+    def apply(P):
+        # (Y^T C_r Y + reg I) p_r for every row at once
+        out = P @ gram
+        for lo, hi in chunks:
+            Yc = Y[cols[lo:hi]]
+            dots = np.einsum('nf,nf->n', Yc, P[rows[lo:hi]])
+            accumulate(((conf[lo:hi] - 1) * dots)[:, None] * Yc, lo, hi, out)
+        return out
+
+    target = np.zeros_like(X)
+    for lo, hi in chunks:
+        accumulate(conf[lo:hi, None] * Y[cols[lo:hi]], lo, hi, target)
+    residual = target - apply(X)
+    direction = residual.copy()
+    norm = np.einsum('nf,nf->n', residual, residual)
+    for _ in range(cg_steps):
+        step_dir = apply(direction)
+        step = norm / np.maximum(np.einsum('nf,nf->n', direction, step_dir), 1e-12)
+        X += step[:, None] * direction
+        residual -= step[:, None] * step_dir
+        new_norm = np.einsum('nf,nf->n', residual, residual)
+        direction = residual + (new_norm / np.maximum(norm, 1e-12))[:, None] * direction
+        norm = new_norm
+
+
+def factorize(np, rows, cols, conf, n_rows, n_cols, factors=FACTORS, epochs=EPOCHS, reg=REGULARIZATION,
+              cg_steps=CG_STEPS, seed=0, report=None):
+    """Implicit-feedback ALS. rows/cols/conf must be sorted by row. Returns (X, Y) float32 factors."""
+    rng = np.random.default_rng(seed)
+    X = (rng.standard_normal((n_rows, factors)) * 0.01).astype(np.float32)
+    Y = (rng.standard_normal((n_cols, factors)) * 0.01).astype(np.float32)
+    by_col = np.argsort(cols, kind='stable')
+    t_rows, t_cols, t_conf = cols[by_col], rows[by_col], conf[by_col]
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        _solve(np, rows, cols, conf, X, Y, reg, cg_steps)
+        _solve(np, t_rows, t_cols, t_conf, Y, X, reg, cg_steps)
+        if report:
+            report(f'  epoch {epoch + 1}/{epochs} in {time.perf_counter() - start:.1f}s')
+    return X, Y
+
+
+def top_items(np, X, Y, rows, cols, n=TOP_N, candidates=CANDIDATES):
+    """Best n unseen items for every row that has interactions.
+
+    Only the `candidates` most interacted-with items are scored. rows/cols are
+    the row-sorted interactions, used to skip what a reader already has.
+    Returns (row, item, score, rank) arrays.
+    """
+    counts = np.bincount(cols, minlength=len(Y))
+    pool = np.argsort(-counts, kind='stable')[:candidates]
+    pool = pool[counts[pool] > 0]
+    take = min(n, len(pool))
+    if not take:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32), empty
+    position = np.full(len(Y), -1)
+    position[pool] = np.arange(len(pool))
+    pool_factors = Y[pool].T.copy()
+
+    active = np.unique(rows)
+    batch = max(1, SCORE_CELLS // len(pool))
+    results = []
+    for lo in range(0, len(active), batch):
+        users = active[lo:lo + batch]
+        scores = X[users] @ pool_factors
+        a, b = np.searchsorted(rows, [users[0], users[-1] + 1])
+        seen_rows, seen_cols = np.searchsorted(users, rows[a:b]), position[cols[a:b]]
+        known = seen_cols >= 0
+        scores[seen_rows[known], seen_cols[known]] = -np.inf
+        best = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        valid = np.isfinite(best_scores)
+        results.append((np.repeat(users, take).reshape(-1, take)[valid], pool[best[valid]], best_scores[valid],
+                        np.broadcast_to(np.arange(take), best.shape)[valid]))
+    return tuple(np.concatenate(column) for column in zip(*results))
+
+
+def _load_history(np):
+    """Every (user_id, book_id, weight) from loans/purchases and non-cancelled reservations."""
+    sources = [
+        (db.select(Transaction.user_id, Transaction.book_id), TRANSACTION_WEIGHT),
+        (db.select(Reservation.user_id, Reservation.book_id).where(Reservation.status != 'cancelled'),
+         RESERVATION_WEIGHT),
+    ]
+    users, books, weights = [], [], []
+    for stmt, weight in sources:
+        for chunk in db.session.execute(stmt.execution_options(yield_per=LOAD_CHUNK)).partitions():
+            users.append(np.fromiter((row[0] for row in chunk), dtype=np.int64, count=len(chunk)))
+            books.append(np.fromiter((row[1] for row in chunk), dtype=np.int64, count=len(chunk)))
+            weights.append(np.full(len(chunk), weight, dtype=np.float32))
+    if not users:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+    return np.concatenate(users), np.concatenate(books), np.concatenate(weights)
+
+
+def interaction_matrix(np, users, books, weights, alpha=ALPHA):
+    """Collapse raw events into one (row, col, confidence) per user/book pair, sorted by row.
+
+    Returns (user_ids, book_ids, rows, cols, conf) where rows/cols index the id arrays.
+    """
+    user_ids, rows = np.unique(users, return_inverse=True)
+    item_ids, cols = np.unique(books, return_inverse=True)
+    keys, inverse = np.unique(rows.astype(np.int64) * len(item_ids) + cols, return_inverse=True)
+    totals = np.bincount(inverse, weights=weights)
+    conf = (1 + alpha * totals).astype(np.float32)
+    return user_ids, item_ids, keys // len(item_ids), keys % len(item_ids), conf
+
+
+def _write(np, user_ids, book_ids, rows, items, scores, ranks):
+    db.session.execute(db.delete(UserRecommendation))
+    for lo in range(0, len(rows), LOAD_CHUNK):
+        hi = lo + LOAD_CHUNK
+        db.session.execute(db.insert(UserRecommendation), [
+            {'user_id': int(u), 'rank': int(r), 'book_id': int(b), 'score': float(s)}
+            for u, b, s, r in zip(user_ids[rows[lo:hi]], book_ids[items[lo:hi]], scores[lo:hi], ranks[lo:hi])
+        ])
+    # Readers keep the previous lists until this single commit; cached copies expire by TTL
+    db.session.commit()
+
+
+def train_recommendations(factors=FACTORS, epochs=EPOCHS, reg=REGULARIZATION, alpha=ALPHA, top_n=TOP_N,
+                          candidates=CANDIDATES, report=None):
+    """Retrain the factorisation and rewrite user_recommendations. Returns counts, timings and memory."""
+    np = _numpy()
+    report = report or (lambda *args: None)
+    timings = {}
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    user_ids, item_ids, rows, cols, conf = interaction_matrix(np, *_load_history(np), alpha=alpha)
+    timings['load'] = time.perf_counter() - start
+    report(f'Loaded {len(rows):,} user/book pairs ({len(user_ids):,} users, {len(item_ids):,} books) '
+           f'in {timings["load"]:.1f}s')
+
+    start = time.perf_counter()
+    X, Y = factorize(np, rows, cols, conf, len(user_ids), len(item_ids), factors, epochs, reg, report=report)
+    timings['train'] = time.perf_counter() - start
+    report(f'Trained {factors} factors in {timings["train"]:.1f}s')
+
+    start = time.perf_counter()
+    picked = top_items(np, X, Y, rows, cols, top_n, candidates)
+    timings['score'] = time.perf_counter() - start
+    report(f'Picked {len(picked[0]):,} recommendations in {timings["score"]:.1f}s')
+
+    start = time.perf_counter()
+    _write(np, user_ids, item_ids, *picked)
+    timings['write'] = time.perf_counter() - start
+    report(f'Wrote user_recommendations in {timings["write"]:.1f}s')
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'users': len(user_ids), 'rows': len(picked[0]), **timings,
+            'peak_mb': peak / 2**20, 'max_rss_mb': max_rss_mb()}
+
+
+@recommendations_cli.command('train')
+@click.option('--factors', default=FACTORS, show_default=True)
+@click.option('--epochs', default=EPOCHS, show_default=True)
+@click.option('--reg', default=REGULARIZATION, show_default=True, help='L2 regularisation.')
+@click.option('--alpha', default=ALPHA, show_default=True, help='Confidence per interaction.')
+@click.option('--top-n', default=TOP_N, show_default=True, help='Books kept per reader.')
+@click.option('--candidates', default=CANDIDATES, show_default=True, help='Most popular books scored.')
+def train_command(factors, epochs, reg, alpha, top_n, candidates):
+    """Retrain personal recommendations from loan, purchase and reservation history."""
+    stats = train_recommendations(factors, epochs, reg, alpha, top_n, candidates, report=click.echo)
+    total = stats['load'] + stats['train'] + stats['score'] + stats['write']
+    click.echo(f'Done: {stats["rows"]:,} rows for {stats["users"]:,} readers in {total:.1f}s, '
+               f'peak traced memory {stats["peak_mb"]:,.0f} MiB, max RSS {stats["max_rss_mb"]:,.0f} MiB')
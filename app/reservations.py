@@ -0,0 +1,99 @@
+from app import db, inventory, stats
+from app.models import Reservation
+
+# Per-book reservation queues.
+#
+# Waiters are 'pending' reservations, served first come first served by
+# (created_at, id). Every queue operation is a range read on
+# ix_reservation_queue (book_id, status, created_at, id), so finding the next
+# waiter of a title with thousands of holds is one index seek.
+# A promoted waiter becomes 'approved' with copy_held set: the returned copy
+# is set aside for them instead of going back on the shelf, so a later reader
+# cannot reserve, borrow or buy it first. The librarian issues it from the
+# reservations page without touching the stock again; cancelling it hands the
+# copy to the next waiter.
+
+WAITING = 'pending'
+READY = 'approved'
+OPEN = (WAITING, READY)
+
+QUEUE_ORDER = [Reservation.created_at, Reservation.id]
+
+
+def queue_query(book_id):
+    """SELECT of a book's waiters in queue order (pass QUEUE_ORDER to keyset_paginate)."""
+    return db.select(Reservation).where(Reservation.book_id == book_id, Reservation.status == WAITING)
+
+
+def has_waiters(book_id):
+    return db.session.scalar(db.select(queue_query(book_id).exists()))
+
+
+def queue_length(book_id):
+    return db.session.scalar(
+        db.select(db.func.count())
+        .where(Reservation.book_id == book_id, Reservation.status == WAITING)
+    )
+
+
+def promote_next(book_id):
+    """Hold a copy of `book_id` for its oldest waiter, in the caller's transaction.
+
+    The copy must already be off the shelf (use release_copy() for one coming
+    back). On PostgreSQL the row is claimed with FOR UPDATE SKIP LOCKED, so
+    concurrent returns of the same title promote different waiters. Returns the
+    promoted reservation or None if nobody is waiting.
+    """
+    stmt = queue_query(book_id).order_by(*QUEUE_ORDER).limit(1).with_for_update(skip_locked=True)
+    reservation = db.session.scalars(stmt).first()
+    if reservation is not None:
+        reservation.status = READY
+        reservation.copy_held = True
+    return reservation
+
+
+def release_copy(book_id):
+    """A copy came back: hold it for the next waiter, or put it on the shelf if nobody waits.
+
+    Returns the promoted reservation or None.
+    """
+    reservation = promote_next(book_id)
+    if reservation is None:
+        inventory.return_copy(book_id)
+    return reservation
+
+
+def reserve_from_shelf(book_id, user_id):
+    """Approve a new reservation with a copy taken off the shelf, in the caller's transaction.
+
+    None (nothing written) when no copy is available.
+    """
+    if not inventory.take_copy(book_id):
+        return None
+    reservation = Reservation(user_id=user_id, book_id=book_id, status=READY, copy_held=True)
+    db.session.add(reservation)
+    return reservation
+
+
+def close(reservation, status):
+    """Move an open reservation to 'fulfilled' or 'cancelled', in the caller's transaction.
+
+    A conditional UPDATE on the state it was loaded in, so a reservation is only
+    issued or cancelled once when two librarians act on it together. Returns
+    False if it had changed; a copy it held is the caller's to pass on.
+    """
+    if reservation.status not in OPEN:
+        return False
+    result = db.session.execute(
+        db.update(Reservation)
+        .where(Reservation.id == reservation.id, Reservation.status == reservation.status,
+               Reservation.copy_held == reservation.copy_held)
+        .values(status=status, copy_held=False)
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        return False
+    # Bulk UPDATE: the flush hooks do not see it
+    stats.adjust(f'{reservation.status}_reservations', -1)
+    db.session.expire(reservation, ['status', 'copy_held'])
+    return True
@@ -0,0 +1,152 @@
+import logging
+import random
+import time
+
+import click
+from flask import current_app, g, has_request_context, request, session
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, exc
+
+from app.engine import init_replica
+
+# Read-replica routing. With DATABASE_REPLICA_URLS set, every replica gets its
+# own engine (app.extensions['replicas']: replica0, replica1, ...) and db.session
+# picks an engine per statement:
+#
+#   - read-only requests (GET/HEAD, or views marked @read_only, see
+#     app/decorators.py) read from one healthy replica, chosen per request
+#   - writes, SELECT ... FOR UPDATE and bare session.connection() calls go to
+#     the primary, and so does the rest of that request (read-your-writes)
+#   - views marked @uses_primary (GET links that change data) never use a replica
+#   - a client that wrote is pinned to the primary for REPLICA_PIN_SECONDS
+#     through its session cookie, so the page it is redirected to shows the write
+#   - a replica that cannot be reached is skipped for REPLICA_RETRY_SECONDS and
+#     the request falls back to the primary. There is no separate health check:
+#     the session's own checkout of the replica (with pool_pre_ping) is the
+#     test, and the connection it gets serves the request's reads.
+#
+# The replica engines are deliberately not SQLALCHEMY_BINDS: binds would take
+# part in db.create_all()/drop_all() and Flask-Migrate, and replicas only ever
+# receive their schema through replication.
+#
+# Without replicas configured none of this runs and db.session behaves as before.
+
+logger = logging.getLogger('smart_library.replicas')
+
+replicas_cli = AppGroup('replicas', help='Read replica health.')
+
+READ_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+PIN_KEY = 'db_primary_until'
+
+# Bind key -> time.monotonic() after which a failed replica is tried again (per worker)
+_retry_at = {}
+
+
+def _is_read(session, clause):
+    return (not session._flushing and clause is not None and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None)
+
+
+class RoutingSession(Session):
+    """db.session class sending the reads of read-only requests to a replica engine."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and 'db_route' in g:
+            if not _is_read(self, clause):
+                g.db_route = 'primary'
+                g.db_wrote = True
+            elif g.db_route == 'replica':
+                replica = _request_replica(self)
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _request_replica(session):
+    # One replica per request, so its reads see a single consistent snapshot
+    if 'db_replica' not in g:
+        g.db_replica = connect_replica(session, current_app.extensions['replicas'])
+    return g.db_replica
+
+
+def connect_replica(session, engines):
+    """Connect `session` to a random reachable engine from {key: engine}; None when all of them are down."""
+    now = time.monotonic()
+    candidates = [key for key in engines if _retry_at.get(key, 0) <= now]
+    random.shuffle(candidates)
+    for key in candidates:
+        try:
+            # The session keeps this connection for its transaction; pool_pre_ping
+            # replaces connections the replica dropped
+            session.connection(bind_arguments={'bind': engines[key]})
+        except exc.DBAPIError as e:
+            retry = current_app.config.get('REPLICA_RETRY_SECONDS', 30)
+            _retry_at[key] = now + retry
+            logger.warning('Replica %s unavailable, reading from the primary for %ss: %s', key, retry, e.orig)
+            continue
+        _retry_at.pop(key, None)
+        return engines[key]
+    return None
+
+
+def _route_request():
+    view = current_app.view_functions.get(request.endpoint)
+    route = getattr(view, 'db_route', None)
+    if route is None:
+        route = 'replica' if request.method in READ_METHODS else 'primary'
+    if route == 'replica' and session.get(PIN_KEY, 0) > time.time():
+        route = 'primary'
+    g.db_route = route
+
+
+def _pin_writer(response):
+    if g.get('db_wrote'):
+        session[PIN_KEY] = time.time() + current_app.config.get('REPLICA_PIN_SECONDS', 5)
+    return response
+
+
+def init_app(app):
+    """Create the replica engines with the primary's pool settings and connection setup.
+
+    Runs after engine.init_app(app).
+    """
+    # Failover happens at checkout, so connections a replica dropped must be noticed there
+    options = {**app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}), 'pool_pre_ping': True}
+    app.extensions['replicas'] = {f'replica{i}': create_engine(url, **options)
+                                  for i, url in enumerate(app.config.get('REPLICA_URLS') or ())}
+    if not app.extensions['replicas']:
+        return
+    for replica in app.extensions['replicas'].values():
+        init_replica(app, replica)
+    app.before_request(_route_request)
+    app.after_request(_pin_writer)
+
+
+def _describe(engine):
+    return engine.url.render_as_string(hide_password=True)
+
+
+@replicas_cli.command('check')
+def check_command():
+    """Ping every replica and compare its latest transaction with the primary's."""
+    from app import db
+    from app.models import Transaction
+
+    latest = db.select(db.func.max(Transaction.id))
+    with db.engine.connect() as conn:
+        primary = conn.scalar(latest) or 0
+    click.echo(f'primary   {_describe(db.engine)}: latest transaction {primary}')
+    replicas = current_app.extensions['replicas']
+    if not replicas:
+        click.echo('No replicas configured (DATABASE_REPLICA_URLS).')
+    for key, engine in replicas.items():
+        start = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                replica = conn.scalar(latest) or 0
+        except exc.DBAPIError as e:
+            click.echo(f'{key:<9} {_describe(engine)}: DOWN ({e.orig})')
+            continue
+        ms = (time.perf_counter() - start) * 1000
+        click.echo(f'{key:<9} {_describe(engine)}: {ms:.1f} ms, {primary - replica} transactions behind')
@@ -0,0 +1,118 @@
+import re
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import column, event, literal_column, table, text
+
+from app import db
+from app.models import Book
+
+# Full-text search over Book.title / Book.author.
+#
+# SQLite:     external-content FTS5 table `book_fts`, kept in sync by triggers.
+# PostgreSQL: GIN expression index on to_tsvector(title || author), which the
+#             database maintains by itself on every insert/update/delete.
+# Anything else falls back to the old LIKE scan.
+
+FTS_TABLE = 'book_fts'
+PG_INDEX = 'ix_book_search'
+PG_VECTOR = "to_tsvector('simple', coalesce(book.title, '') || ' ' || coalesce(book.author, ''))"
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"title, author, content='book', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+    f"CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); END",
+    f"CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF title, author ON book BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author) VALUES ('delete', old.id, old.title, old.author); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, author) VALUES (new.id, new.title, new.author); END",
+]
+
+PG_DDL = [
+    f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON book USING gin ({PG_VECTOR})",
+]
+
+book_fts = table(FTS_TABLE, column('rowid'))
+
+search_cli = AppGroup('search', help='Manage the book full-text search index.')
+
+
+def _tokens(q):
+    return re.findall(r'\w+', q.lower())
+
+
+def create_search_index(connection):
+    """Create the dialect's search index if missing (idempotent)."""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}
+        ).first()
+        for stmt in SQLITE_DDL:
+            connection.execute(text(stmt))
+        if not exists:
+            # Table was just created next to existing rows: index them once
+            connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for stmt in PG_DDL:
+            connection.execute(text(stmt))
+
+
+def rebuild_search_index(connection):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        create_search_index(connection)
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        connection.execute(text(f"DROP INDEX IF EXISTS {PG_INDEX}"))
+        create_search_index(connection)
+
+
+@event.listens_for(Book.__table__, 'after_create')
+def _book_table_created(target, connection, **kw):
+    create_search_index(connection)
+
+
+def search_query(q, category=None):
+    """Return a ranked select() of books matching `q` (prefix match on every word)."""
+    stmt = db.select(Book)
+    words = _tokens(q)
+    dialect = db.engine.dialect.name
+
+    if words and dialect == 'sqlite':
+        match = ' '.join(f'"{w}"*' for w in words)
+        stmt = (stmt.join(book_fts, book_fts.c.rowid == Book.id)
+                .where(text(f'{FTS_TABLE} MATCH :match').bindparams(match=match))
+                .order_by(db.func.bm25(literal_column(FTS_TABLE)), Book.id))
+    elif words and dialect == 'postgresql':
+        tsquery = db.func.to_tsquery('simple', ' & '.join(f'{w}:*' for w in words))
+        vector = literal_column(PG_VECTOR)
+        stmt = (stmt.where(vector.op('@@')(tsquery))
+                .order_by(db.func.ts_rank(vector, tsquery).desc(), Book.id))
+    elif q:
+        stmt = stmt.where(Book.title.contains(q) | Book.author.contains(q)).order_by(Book.id)
+    else:
+        stmt = stmt.order_by(Book.id)
+
+    if category:
+        stmt = stmt.where(Book.category == category)
+    return stmt
+
+
+@search_cli.command('init')
+def init_command():
+    """Create the search index if it does not exist yet."""
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+    click.echo('Search index ready.')
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Drop and rebuild the search index from the book table."""
+    with db.engine.begin() as connection:
+        rebuild_search_index(connection)
+    click.echo('Search index rebuilt.')
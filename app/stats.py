@@ -0,0 +1,182 @@
+from collections import Counter
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Book, LibraryStat, Reservation, Transaction, User
+
+# Denormalised dashboard counters.
+#
+# Every flush works out how the rows it writes move the counters (a new book,
+# a reservation going pending -> fulfilled, a loan issued -> returned, ...)
+# and applies that as `UPDATE library_stat SET value = value + :delta` in the
+# same transaction, so the dashboards read them with one query.
+# Bulk UPDATE/DELETE statements bypass the ORM and must call adjust() themselves;
+# `flask stats rebuild` recomputes everything from scratch.
+
+LOW_STOCK_THRESHOLD = 2
+
+COUNTERS = (
+    'total_books', 'low_stock_books', 'total_users',
+    'pending_reservations', 'approved_reservations',
+    'issued_transactions', 'overdue_transactions',
+)
+
+stats_cli = AppGroup('stats', help='Dashboard counter maintenance.')
+
+
+def _book_counters(available_count):
+    counters = ['total_books']
+    if available_count is not None and available_count < LOW_STOCK_THRESHOLD:
+        counters.append('low_stock_books')
+    return counters
+
+
+def _user_counters(role):
+    return [] if role == 'admin' else ['total_users']
+
+
+def _reservation_counters(status):
+    return [f'{status}_reservations'] if status in ('pending', 'approved') else []
+
+
+def _transaction_counters(status):
+    return [f'{status}_transactions'] if status in ('issued', 'overdue') else []
+
+
+# model -> (attribute the counters depend on, attribute value -> counters)
+TRACKED = {
+    Book: ('available_count', _book_counters),
+    User: ('role', _user_counters),
+    Reservation: ('status', _reservation_counters),
+    Transaction: ('status', _transaction_counters),
+}
+
+
+def _value(obj, attr):
+    # Pending inserts have not had their column defaults applied yet
+    value = getattr(obj, attr)
+    if value is None:
+        default = obj.__table__.c[attr].default
+        value = default.arg if default is not None and default.is_scalar else None
+    return value
+
+
+def _committed_value(session, obj, attr):
+    state = inspect(obj)
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    # Attribute was expired when it got overwritten: read the stored value
+    column = obj.__table__.c[attr]
+    return session.connection().scalar(
+        db.select(column).where(obj.__table__.c.id == state.identity[0])
+    )
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_deltas(session, flush_context, instances):
+    deltas = session.info.setdefault('stat_deltas', Counter())
+    for obj in session.new:
+        if type(obj) in TRACKED:
+            attr, counters = TRACKED[type(obj)]
+            deltas.update(counters(_value(obj, attr)))
+    for obj in session.deleted:
+        if type(obj) in TRACKED:
+            attr, counters = TRACKED[type(obj)]
+            deltas.subtract(counters(_committed_value(session, obj, attr)))
+    for obj in session.dirty:
+        if type(obj) in TRACKED:
+            attr, counters = TRACKED[type(obj)]
+            history = inspect(obj).attrs[attr].history
+            if history.added:
+                deltas.subtract(counters(_committed_value(session, obj, attr)))
+                deltas.update(counters(history.added[0]))
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_deltas(session, flush_context):
+    deltas = session.info.pop('stat_deltas', None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_deltas(session):
+    session.info.pop('stat_deltas', None)
+
+
+def apply_deltas(connection, deltas):
+    for name, delta in deltas.items():
+        if delta:
+            connection.execute(
+                db.update(LibraryStat).where(LibraryStat.name == name).values(value=LibraryStat.value + delta)
+            )
+
+
+def adjust(name, delta):
+    """Move one counter by `delta` in the current transaction (for bulk SQL writes)."""
+    apply_deltas(db.session.connection(), {name: delta})
+
+
+def compute_stats():
+    """Every counter computed from the source tables."""
+    def count(model, *criteria):
+        return db.session.scalar(db.select(db.func.count()).select_from(model).where(*criteria))
+
+    return {
+        'total_books': count(Book),
+        'low_stock_books': count(Book, Book.available_count < LOW_STOCK_THRESHOLD),
+        'total_users': count(User, User.role != 'admin'),
+        'pending_reservations': count(Reservation, Reservation.status == 'pending'),
+        'approved_reservations': count(Reservation, Reservation.status == 'approved'),
+        'issued_transactions': count(Transaction, Transaction.status == 'issued'),
+        'overdue_transactions': count(Transaction, Transaction.status == 'overdue'),
+    }
+
+
+def rebuild_stats():
+    values = compute_stats()
+    db.session.execute(db.delete(LibraryStat))
+    db.session.execute(db.insert(LibraryStat), [{'name': k, 'value': v} for k, v in values.items()])
+    db.session.commit()
+    return values
+
+
+def _read_stats():
+    return dict(db.session.execute(db.select(LibraryStat.name, LibraryStat.value)).all())
+
+
+def seed_stats():
+    """Insert the missing counters (INSERT ... ON CONFLICT DO NOTHING) and read them back.
+
+    Workers starting together may all seed: the rows written first win.
+    """
+    values = compute_stats()
+    insert = postgresql.insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    db.session.execute(insert(LibraryStat).on_conflict_do_nothing(index_elements=['name']),
+                       [{'name': k, 'value': v} for k, v in values.items()])
+    db.session.commit()
+    return _read_stats()
+
+
+def get_stats():
+    """All dashboard counters with a single primary-key table read."""
+    values = _read_stats()
+    if any(name not in values for name in COUNTERS):
+        # First use (or a wiped table): seed the counters from the source tables
+        values = seed_stats()
+    return values
+
+
+@stats_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the dashboard counters from scratch."""
+    for name, value in rebuild_stats().items():
+        click.echo(f'{name}: {value}')
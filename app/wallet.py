@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm.util import identity_key
+
+from app import db
+from app.models import User, WalletAccount, WalletEntry
+
+# Seller wallets as an append-only ledger, in integer cents.
+#
+# Every credit is a WalletEntry row; WalletAccount.balance_cents is the
+# cached balance, moved in the same transaction with one atomic increment, so
+# reads never sum the ledger. `flask wallet snapshot` folds entries into the
+# account's snapshot (snapshot_cents up to snapshot_entry_id), which lets
+# `flask wallet verify` recompute balances from the recent entries only.
+
+wallet_cli = AppGroup('wallet', help='Wallet ledger maintenance.')
+
+# Entries younger than this stay out of snapshots: on PostgreSQL a lower id
+# can still belong to a transaction that has not committed yet.
+SNAPSHOT_LAG = timedelta(minutes=5)
+
+
+def to_cents(amount):
+    """Dollars (float/str/Decimal) to integer cents, rounding half up."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def _increment_account(user_id, cents):
+    # INSERT ... ON CONFLICT: the account row is created by the first entry
+    insert = postgresql.insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    stmt = insert(WalletAccount).values(user_id=user_id, balance_cents=cents, snapshot_cents=0, snapshot_entry_id=0)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={'balance_cents': WalletAccount.balance_cents + stmt.excluded.balance_cents},
+    ))
+
+
+def _balance_changed(user_id):
+    # Cached login snapshots carry the balance: drop them on commit like ORM writes do
+    db.session.info.setdefault('changed_users', set()).add(user_id)
+    account = db.session.identity_map.get(identity_key(WalletAccount, user_id))
+    if account is not None:
+        db.session.expire(account, ['balance_cents'])
+
+
+def post_entry(user_id, cents, kind, transaction=None):
+    """Append a ledger entry and move the cached balance. Runs inside the caller's transaction."""
+    db.session.add(WalletEntry(user_id=user_id, amount_cents=cents, kind=kind, transaction=transaction))
+    _increment_account(user_id, cents)
+    _balance_changed(user_id)
+
+
+def credit(user_id, amount, kind='sale', transaction=None):
+    post_entry(user_id, to_cents(amount), kind, transaction)
+
+
+def _recent_sum(upto=None):
+    """Correlated SUM of an account's entries after its snapshot (and up to entry `upto`)."""
+    criteria = [WalletEntry.user_id == WalletAccount.user_id, WalletEntry.id > WalletAccount.snapshot_entry_id]
+    if upto is not None:
+        criteria.append(WalletEntry.id <= upto)
+    return (db.select(db.func.coalesce(db.func.sum(WalletEntry.amount_cents), 0))
+            .where(*criteria)
+            .scalar_subquery())
+
+
+def recomputed_balance():
+    """SQL expression: an account's balance from its snapshot plus the entries since."""
+    return WalletAccount.snapshot_cents + _recent_sum()
+
+
+def open_accounts():
+    """Create accounts for users without one, carrying over the legacy Float balance. Idempotent."""
+    no_account = ~db.select(WalletAccount.user_id).where(WalletAccount.user_id == User.id).exists()
+    opening = db.cast(db.func.round(db.func.coalesce(User.legacy_wallet_balance, 0) * 100), db.BigInteger)
+    now = datetime.utcnow()
+    db.session.execute(db.insert(WalletEntry).from_select(
+        ['user_id', 'amount_cents', 'kind', 'created_at'],
+        db.select(User.id, opening, db.literal('opening'), db.literal(now)).where(no_account, opening != 0),
+    ))
+    result = db.session.execute(db.insert(WalletAccount).from_select(
+        ['user_id', 'balance_cents', 'snapshot_cents', 'snapshot_entry_id'],
+        db.select(User.id, opening, db.literal(0), db.literal(0)).where(no_account),
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+def snapshot_accounts(lag=SNAPSHOT_LAG):
+    """Fold entries older than `lag` into the account snapshots. Returns accounts updated."""
+    upto = db.session.scalar(
+        db.select(db.func.max(WalletEntry.id)).where(WalletEntry.created_at < datetime.utcnow() - lag)
+    )
+    if upto is None:
+        return 0
+    result = db.session.execute(
+        db.update(WalletAccount)
+        .where(WalletAccount.snapshot_entry_id < upto)
+        .values(snapshot_cents=WalletAccount.snapshot_cents + _recent_sum(upto),
+                snapshot_entry_id=upto, snapshot_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def drifted_accounts():
+    """(user_id, cached, recomputed) for accounts whose cached balance disagrees with the ledger."""
+    recomputed = recomputed_balance()
+    return db.session.execute(
+        db.select(WalletAccount.user_id, WalletAccount.balance_cents, recomputed)
+        .where(WalletAccount.balance_cents != recomputed)
+    ).all()
+
+
+@wallet_cli.command('init')
+def init_command():
+    """Open wallet accounts for existing users (legacy balances become opening entries)."""
+    click.echo(f'Opened {open_accounts()} wallet accounts.')
+
+
+@wallet_cli.command('snapshot')
+def snapshot_command():
+    """Compact the ledger into per-account snapshots."""
+    click.echo(f'Snapshotted {snapshot_accounts()} accounts.')
+
+
+@wallet_cli.command('verify')
+@click.option('--fix', is_flag=True, help='Reset drifted cached balances to the ledger value.')
+def verify_command(fix):
+    """Check cached balances against snapshot + recent ledger entries."""
+    drifted = drifted_accounts()
+    for user_id, cached, recomputed in drifted:
+        click.echo(f'user {user_id}: cached {cached} != ledger {recomputed}')
+    if drifted and fix:
+        db.session.execute(
+            db.update(WalletAccount)
+            .where(WalletAccount.user_id.in_([row.user_id for row in drifted]))
+            .values(balance_cents=recomputed_balance())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        click.echo(f'Fixed {len(drifted)} accounts.')
+    elif not drifted:
+        click.echo('All wallet balances match the ledger.')
@@ -0,0 +1,139 @@
+"""Compare DB_PROFILE engine profiles under a mixed read/write workload.
+
+    python benchmarks/engine_profiles.py                                   # SQLite, 100k preset
+    python benchmarks/engine_profiles.py --workers 4 --threads 4 --duration 30
+    python benchmarks/engine_profiles.py --db postgresql://localhost/bench --profiles basic pooled
+
+Like Gunicorn, --workers processes each build their own app (and engine pool)
+and serve --threads concurrent clients. Every client logs in as a reader and
+loops over a weighted mix of routes, about 80% page views and 20% writes
+(reviews, reservations, purchases), through the Flask test client for
+--duration seconds. For SQLite each profile gets a fresh copy of one
+generated database; on other databases all profiles share --db, which is
+filled once by scale_data.py.
+
+Prints throughput, latency percentiles and server errors per profile. With
+the default journal, SQLite writers block readers and concurrent writers
+fail with "database is locked"; WAL plus busy_timeout should remove the
+errors and raise throughput.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, make_url, text  # noqa: E402
+
+# Route weights for each client loop (load_test scenario names)
+MIX = {
+    'user.book_details': 35,
+    'main.index (reader)': 15,
+    'user.search_books (query)': 15,
+    'user.dashboard': 15,
+    'user.review_book': 8,
+    'user.reserve_book': 6,
+    'user.buy_book': 6,
+}
+
+
+def serve(profile, url, threads, duration, seed, results):
+    """One worker process: own app and pool, `threads` clients looping until the deadline."""
+    os.environ.update(DATABASE_URL=url, DB_PROFILE=profile, GUNICORN_THREADS=str(threads))
+    from config import Config
+    from app import create_app
+    from load_test import Driver, ClientSession, sample_pools, scenarios
+
+    class ProfileConfig(Config):
+        SQL_PROFILER = False
+
+    app = create_app(ProfileConfig)
+    pools, max_book = sample_pools(url, 1000)
+    by_name = {s[0]: s for s in scenarios(pools, max_book)}
+    mix = [by_name[name] for name, weight in MIX.items() for _ in range(weight)]
+    driver = Driver(lambda: ClientSession(app), 'bench', pools['readers'])
+    samples = []
+
+    def client(n):
+        rng = random.Random(seed * 1000 + n)
+        driver.session('user', rng) # log in before the clock starts
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            try:
+                _, status, ms, _ = driver.run(rng.choice(mix), rng.randrange(2**31))
+            except Exception as e: # e.g. the pool timing out
+                status, ms = 599, 0.0
+                print(f'[{profile}] {type(e).__name__}: {e}', file=sys.stderr)
+            samples.append((status, ms))
+
+    clients = [threading.Thread(target=client, args=(n,)) for n in range(threads)]
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    results.put(samples)
+
+
+def run_profile(profile, url, workers, threads, duration, seed):
+    # Spawned, not forked: Config reads DATABASE_URL / DB_PROFILE when the worker first imports it
+    spawn = multiprocessing.get_context('spawn')
+    results = spawn.Queue()
+    procs = [spawn.Process(target=serve, args=(profile, url, threads, duration, seed + w, results))
+             for w in range(workers)]
+    for p in procs:
+        p.start()
+    samples = [s for _ in procs for s in results.get()]
+    for p in procs:
+        p.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='database URL (default: generate a temporary SQLite file)')
+    parser.add_argument('--scale', default='100k', help='scale_data.py preset for the generated SQLite file')
+    parser.add_argument('--profiles', nargs='+', default=['basic', 'sqlite-wal'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from app.profiler import percentile
+
+    template = None
+    if args.db is None:
+        template = os.path.join(tempfile.mkdtemp(), 'template.sqlite')
+        print(f'Generating the {args.scale} preset into {template}')
+        subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scale_data.py'),
+                        '--db', f'sqlite:///{template}', '--scale', args.scale], check=True, stdout=subprocess.DEVNULL)
+    elif make_url(args.db).get_backend_name() == 'sqlite':
+        template = make_url(args.db).database
+
+    print(f'{args.workers} workers x {args.threads} threads, {args.duration:.0f}s per profile\n')
+    print(f'{"profile":<12} {"requests":>9} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for profile in args.profiles:
+        url = args.db
+        if template:
+            # Fresh copy in rollback-journal mode, so every profile starts from the same file
+            copy = os.path.join(tempfile.mkdtemp(), f'{profile}.sqlite')
+            shutil.copy(template, copy)
+            url = f'sqlite:///{copy}'
+            with create_engine(url).connect() as conn:
+                conn.execute(text('PRAGMA journal_mode=DELETE'))
+        samples = run_profile(profile, url, args.workers, args.threads, args.duration, args.seed)
+        times = sorted(ms for status, ms in samples if status < 500)
+        errors = sum(status >= 500 for status, _ in samples)
+        print(f'{profile:<12} {len(samples):>9,} {len(samples) / args.duration:>8.1f} {percentile(times, 50):>8.1f} '
+              f'{percentile(times, 95):>8.1f} {percentile(times, 99):>8.1f} {errors:>7,}')
+
+
+if __name__ == '__main__':
+    main()
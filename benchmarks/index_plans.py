@@ -0,0 +1,117 @@
+"""Seed a large synthetic library and check the hot queries use the new indexes.
+
+    python benchmarks/index_plans.py                              # temp SQLite file, 1M loans
+    python benchmarks/index_plans.py --db postgresql://localhost/bench --transactions 5000000
+
+Rows are generated inside the database (recursive CTE on SQLite, generate_series on
+PostgreSQL), so seeding millions of rows takes seconds. For each query the script
+prints its EXPLAIN plan and run time, and exits non-zero if a plan does not use the
+expected index.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db  # noqa: E402
+import app.models  # noqa: E402,F401  (registers the tables on db.metadata)
+from scale_data import minutes_after, series  # noqa: E402
+
+# (label, expected index, SQL)
+QUERIES = [
+    ('user active loans', 'ix_transaction_user_status',
+     "SELECT id FROM \"transaction\" WHERE user_id = 4242 AND status = 'issued'"),
+    ('loans by status', 'ix_transaction_status_issued',
+     "SELECT count(*) FROM \"transaction\" WHERE status = 'returned'"),
+    ('sales report page', 'ix_transaction_type_status_issued',
+     "SELECT id FROM \"transaction\" WHERE transaction_type = 'purchase' AND status = 'completed' "
+     "ORDER BY issued_date DESC, id DESC LIMIT 50"),
+    ('recent transactions', 'ix_transaction_issued_date',
+     "SELECT id FROM \"transaction\" ORDER BY issued_date DESC LIMIT 5"),
+    ('overdue scan (partial)', 'ix_transaction_active_due',
+     "SELECT id FROM \"transaction\" WHERE status = 'issued' AND due_date < '2020-03-01'"),
+    ('pending reservations', 'ix_reservation_status_created',
+     "SELECT id FROM reservation WHERE status = 'pending' ORDER BY created_at LIMIT 50"),
+    ('duplicate reservation check', 'ix_reservation_user_book_status',
+     "SELECT id FROM reservation WHERE user_id = 17 AND book_id = 99 AND status = 'pending'"),
+    ('book holds', 'ix_reservation_queue',
+     "SELECT count(*) FROM reservation WHERE book_id = 99 AND status = 'pending'"),
+    ('next in queue', 'ix_reservation_queue',
+     "SELECT id FROM reservation WHERE book_id = 99 AND status = 'pending' ORDER BY created_at, id LIMIT 1"),
+]
+
+
+def seed(engine, users, books, transactions, reservations):
+    d = engine.dialect.name
+    issued = minutes_after(d, '2020-01-01', 'i % 1000000')
+    due = minutes_after(d, '2020-01-01', 'i % 1000000 + 20160')
+    statements = [
+        f"INSERT INTO \"user\" (id, username, email, role, wallet_balance) "
+        f"SELECT i, 'user' || i, 'user' || i || '@example.com', 'user', 0 FROM {series(d, users)}",
+        f"INSERT INTO book (id, title, author, isbn, category, quantity, available_count, price, average_rating, rating_count) "
+        f"SELECT i, 'Book ' || i, 'Author ' || (i % 5000), 'isbn' || i, 'Category ' || (i % 200), 5, i % 6, 9.99, 0, 0 "
+        f"FROM {series(d, books)}",
+        # 5% open loans, 5% purchases, the rest returned
+        f"INSERT INTO \"transaction\" (id, user_id, book_id, issued_date, due_date, status, transaction_type, amount, fine_amount) "
+        f"SELECT i, (i * 7919) % {users} + 1, (i * 104729) % {books} + 1, {issued}, {due}, "
+        f"CASE i % 20 WHEN 0 THEN 'issued' WHEN 1 THEN 'completed' ELSE 'returned' END, "
+        f"CASE i % 20 WHEN 1 THEN 'purchase' ELSE 'borrow' END, 9.99, 0 FROM {series(d, transactions)}",
+        f"INSERT INTO reservation (id, user_id, book_id, status, created_at) "
+        f"SELECT i, (i * 31) % {users} + 1, (i * 131) % {books} + 1, "
+        f"CASE i % 4 WHEN 0 THEN 'pending' WHEN 1 THEN 'approved' ELSE 'fulfilled' END, {issued} "
+        f"FROM {series(d, reservations)}",
+    ]
+    with engine.begin() as conn:
+        for stmt in statements:
+            conn.execute(text(stmt))
+        conn.execute(text('ANALYZE'))
+
+
+def explain(conn, sql):
+    if conn.dialect.name == 'sqlite':
+        rows = conn.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+        return '\n'.join(row[-1] for row in rows)
+    return '\n'.join(row[0] for row in conn.execute(text('EXPLAIN ' + sql)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='database URL (default: a temporary SQLite file)')
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--books', type=int, default=200_000)
+    parser.add_argument('--transactions', type=int, default=1_000_000)
+    parser.add_argument('--reservations', type=int, default=500_000)
+    args = parser.parse_args()
+
+    url = args.db or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite')
+    engine = create_engine(url)
+    print(f'Database: {engine.url.render_as_string(hide_password=True)}')
+
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    start = time.perf_counter()
+    seed(engine, args.users, args.books, args.transactions, args.reservations)
+    print(f'Seeded {args.transactions:,} transactions / {args.reservations:,} reservations '
+          f'in {time.perf_counter() - start:.1f}s\n')
+
+    failures = 0
+    with engine.connect() as conn:
+        for label, index, sql in QUERIES:
+            plan = explain(conn, sql)
+            start = time.perf_counter()
+            conn.execute(text(sql)).all()
+            elapsed = (time.perf_counter() - start) * 1000
+            ok = index in plan
+            failures += not ok
+            print(f"[{'ok' if ok else 'NO INDEX'}] {label}: {elapsed:.2f} ms (expects {index})")
+            print('    ' + plan.replace('\n', '\n    '))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
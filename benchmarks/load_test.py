@@ -0,0 +1,325 @@
+"""Drive every route of the app and check per-endpoint query and latency budgets.
+
+    python benchmarks/scale_data.py --db sqlite:////tmp/bench.sqlite --scale 100k
+    python benchmarks/load_test.py --db sqlite:////tmp/bench.sqlite                  # in-process test client
+    python benchmarks/load_test.py --db sqlite:////tmp/bench.sqlite --url http://127.0.0.1:8000 --concurrency 8
+
+Expects a database filled by scale_data.py (its logins and id layout). Each
+scenario below is one route of the main/auth/user/librarian/admin blueprints;
+mutating ones take their targets from pools sampled up front, so every request
+does real work. Requests go through the Flask test client in this process, or
+over HTTP to a running server (e.g. `gunicorn -w 4 run:app` on the same
+database) with --url. Redirects are not followed: a POST is timed up to its
+redirect.
+
+Reports p50/p95/p99 latency, throughput and SQL queries per request (read
+from the profiler's Server-Timing header, so SQL_PROFILER must be on) for
+every scenario, then compares them with budgets.json and exits non-zero when
+a scenario goes over its query budget or its p95 budget. Latency budgets
+depend on the machine: skip them with --no-latency-budgets, or re-baseline
+with --write-budgets (measured values plus headroom).
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+
+BUDGETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'budgets.json')
+CSRF = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+QUERIES = re.compile(r'desc="(\d+) queries"')
+SEARCH_TERMS = ['history', 'fiction', 'poetry', 'travel', 'author 42', 'book 1234']
+QUERY_HEADROOM = 2 # extra queries allowed by --write-budgets
+LATENCY_HEADROOM = 3.0 # p95 multiplier used by --write-budgets
+
+
+def scenarios(pools, max_book):
+    """(name, role, method, path, form) for every route. `path`/`form` take the thread's RNG."""
+    def book(rng):
+        return rng.randint(1, max_book)
+
+    def take(name):
+        def f(rng):
+            try:
+                return pools[name].pop()
+            except IndexError:
+                return 0 # pool used up: the route answers 404
+        return f
+
+    def a_reader(rng):
+        return pools['readers'][rng.randrange(len(pools['readers']))]
+
+    return [
+        ('main.index', 'anon', 'GET', lambda r: '/', None),
+        ('main.index (reader)', 'user', 'GET', lambda r: '/', None),
+        ('auth.login', 'anon', 'GET', lambda r: '/auth/login', None),
+        ('auth.register', 'anon', 'GET', lambda r: '/auth/register', None),
+        ('auth.logout', 'fresh', 'GET', lambda r: '/auth/logout', None),
+        ('user.dashboard', 'user', 'GET', lambda r: '/user/dashboard', None),
+        ('user.search_books', 'user', 'GET', lambda r: '/user/books', None),
+        ('user.search_books (query)', 'user', 'GET', lambda r: f'/user/books?q={r.choice(SEARCH_TERMS)}', None),
+        ('user.book_details', 'user', 'GET', lambda r: f'/user/book/{book(r)}', None),
+        ('user.review_book', 'user', 'POST', lambda r: f'/user/book/{book(r)}/review',
+         lambda r: {'rating': r.randint(1, 5), 'comment': 'load test'}),
+        ('user.delete_review', 'librarian', 'POST', lambda r: f'/user/review/{take("reviews")(r)}/delete', None),
+        ('user.reserve_book', 'user', 'POST', lambda r: f'/user/book/{book(r)}/reserve', None),
+        ('user.buy_book', 'user', 'POST', lambda r: f'/user/book/{book(r)}/buy', None),
+        ('user.sell_book', 'user', 'GET', lambda r: '/user/sell', None),
+        ('user.my_listings', 'user', 'GET', lambda r: '/user/my-listings', None),
+        ('librarian.dashboard', 'librarian', 'GET', lambda r: '/librarian/dashboard', None),
+        ('librarian.manage_books', 'librarian', 'GET', lambda r: '/librarian/books', None),
+        ('librarian.add_book', 'librarian', 'GET', lambda r: '/librarian/books/add', None), # POSTed by scratch_books
+        ('librarian.edit_book', 'librarian', 'GET', lambda r: f'/librarian/books/edit/{book(r)}', None),
+        ('librarian.delete_book', 'librarian', 'GET', lambda r: f'/librarian/books/delete/{take("scratch_books")(r)}',
+         None),
+        ('librarian.manage_reservations', 'librarian', 'GET', lambda r: '/librarian/reservations', None),
+        ('librarian.book_queue', 'librarian', 'GET', lambda r: f'/librarian/reservations/book/{book(r)}', None),
+        ('librarian.issue_book', 'librarian', 'GET', lambda r: f'/librarian/issue/{take("issue")(r)}', None),
+        ('librarian.cancel_reservation', 'librarian', 'GET',
+         lambda r: f'/librarian/cancel_reservation/{take("cancel")(r)}', None),
+        ('librarian.return_book', 'librarian', 'GET', lambda r: '/librarian/return', None),
+        ('librarian.return_book (lookup)', 'librarian', 'POST', lambda r: '/librarian/return',
+         lambda r: {'username': f'user{a_reader(r)}', 'isbn': ''}),
+        ('librarian.confirm_return', 'librarian', 'GET', lambda r: f'/librarian/return_confirm/{take("loans")(r)}',
+         None),
+        ('admin.dashboard', 'admin', 'GET', lambda r: '/admin/dashboard', None),
+        ('admin.manage_users', 'admin', 'GET', lambda r: '/admin/users', None),
+        ('admin.promote_user', 'admin', 'GET', lambda r: f'/admin/users/promote/{a_reader(r)}', None),
+        ('admin.sales_report', 'admin', 'GET', lambda r: '/admin/sales', None),
+        ('admin.sales_analytics', 'admin', 'GET', lambda r: f'/admin/sales/analytics?by={r.choice(["day", "week", "category", "seller"])}', None),
+        ('admin.export', 'admin', 'GET', lambda r: '/admin/export/reservations.csv?start=2000-01-01&end=2000-01-02',
+         None),
+        ('admin.perf', 'admin', 'GET', lambda r: '/admin/perf', None),
+        ('admin.reset_perf', 'admin', 'GET', lambda r: '/admin/perf/reset', None),
+    ]
+
+
+def sample_pools(url, count):
+    """Random ids for the scenarios that need an existing row."""
+    engine = create_engine(url)
+
+    def ids(sql):
+        with engine.connect() as conn:
+            return list(conn.execute(text(sql + f' ORDER BY random() LIMIT {count}')).scalars())
+
+    with engine.connect() as conn:
+        max_book = conn.execute(text('SELECT max(id) FROM book')).scalar() or 1
+    pools = {
+        'reviews': ids('SELECT id FROM review'),
+        'issue': ids("SELECT id FROM reservation WHERE status = 'approved'"),
+        'cancel': ids("SELECT id FROM reservation WHERE status = 'pending'"),
+        'loans': ids("SELECT id FROM \"transaction\" WHERE status = 'issued'"),
+        'readers': ids("SELECT id FROM \"user\" WHERE role = 'user'"),
+    }
+    return pools, max_book
+
+
+def scratch_books(driver, url, count, rng):
+    """Add `count` books through the librarian form for delete_book to remove. Returns their ids."""
+    session = driver.session('librarian', rng)
+    prefix = f'9{rng.randrange(10**5):05d}'
+    for i in range(count):
+        session.request('POST', '/librarian/books/add', {
+            'title': 'Load test scratch', 'author': 'Nobody', 'isbn': f'{prefix}{i:06d}', 'category': 'Scratch',
+            'quantity': 1, 'description': '', 'csrf_token': session.csrf})
+    with create_engine(url).connect() as conn:
+        return list(conn.execute(text('SELECT id FROM book WHERE isbn LIKE :prefix'), {'prefix': prefix + '%'}).scalars())
+
+
+class ClientSession:
+    """Requests through the Flask test client of an in-process app."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        body = response.get_data(as_text=True)
+        return response.status_code, response.headers.getlist('Server-Timing'), body
+
+
+class HttpSession:
+    """Requests over HTTP to a running server, one keep-alive session per thread and role."""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None):
+        response = self.session.request(method, self.base_url + path, data=data, allow_redirects=False)
+        return response.status_code, response.headers.get('Server-Timing', '').split(','), response.text
+
+
+class Driver:
+    def __init__(self, make_session, password, readers):
+        self.make_session = make_session
+        self.password = password
+        self.readers = readers
+        self.local = threading.local()
+
+    def login(self, email=None):
+        """New session holding a CSRF token, logged in as `email` unless it is None."""
+        session = self.make_session()
+        _, _, page = session.request('GET', '/auth/login')
+        token = CSRF.search(page)
+        session.csrf = token.group(1) if token else None
+        if email is None:
+            return session
+        status, _, _ = session.request('POST', '/auth/login',
+                                       {'email': email, 'password': self.password, 'csrf_token': session.csrf})
+        if status != 302:
+            raise SystemExit(f'login as {email} failed ({status}); was the database made by scale_data.py?')
+        return session
+
+    def session(self, role, rng):
+        reader = f'user{rng.choice(self.readers)}@example.com'
+        if role == 'fresh': # logout ends the session, so it gets a new one every time
+            return self.login(reader)
+        sessions = getattr(self.local, 'sessions', None)
+        if sessions is None:
+            sessions = self.local.sessions = {}
+        if role not in sessions:
+            emails = {'admin': 'user1@example.com', 'librarian': 'user2@example.com', 'user': reader}
+            sessions[role] = self.login(emails.get(role))
+        return sessions[role]
+
+    def run(self, scenario, seed):
+        name, role, method, path, form = scenario
+        rng = random.Random(seed)
+        session = self.session(role, rng)
+        data = None
+        if method == 'POST':
+            data = dict(form(rng)) if form else {}
+            data['csrf_token'] = session.csrf
+        url = path(rng)
+        start = time.perf_counter()
+        status, timing, _ = session.request(method, url, data)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        queries = next((int(m.group(1)) for t in timing if (m := QUERIES.search(t))), None)
+        return name, status, elapsed_ms, queries
+
+
+def summarize(results):
+    from app.profiler import percentile
+
+    by_name = defaultdict(list)
+    for name, status, ms, queries in results:
+        by_name[name].append((status, ms, queries))
+    summary = {}
+    for name, rows in by_name.items():
+        times = sorted(ms for _, ms, _ in rows)
+        counts = [q for _, _, q in rows if q is not None]
+        summary[name] = {
+            'requests': len(rows),
+            'errors': sum(status >= 500 for status, _, _ in rows),
+            'p50': percentile(times, 50), 'p95': percentile(times, 95), 'p99': percentile(times, 99),
+            'avg_queries': sum(counts) / len(counts) if counts else None,
+            'max_queries': max(counts) if counts else None,
+        }
+    return summary
+
+
+def check(summary, budgets, latency):
+    """Budget violations as readable lines."""
+    problems = []
+    for name, stats in summary.items():
+        if stats['errors']:
+            problems.append(f'{name}: {stats["errors"]} server errors')
+        budget = budgets.get(name)
+        if budget is None:
+            problems.append(f'{name}: no budget in budgets.json (run with --write-budgets)')
+            continue
+        if stats['max_queries'] is not None and stats['max_queries'] > budget['max_queries']:
+            problems.append(f'{name}: {stats["max_queries"]} queries > budget {budget["max_queries"]}')
+        if latency and stats['p95'] > budget['p95_ms']:
+            problems.append(f'{name}: p95 {stats["p95"]:.1f} ms > budget {budget["p95_ms"]} ms')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', required=True, help='database URL made by scale_data.py')
+    parser.add_argument('--url', help='base URL of a running server (default: in-process test client)')
+    parser.add_argument('--requests', type=int, default=50, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--password', default='bench')
+    parser.add_argument('--only', help='run only scenarios whose name contains this')
+    parser.add_argument('--budgets', default=BUDGETS)
+    parser.add_argument('--no-latency-budgets', action='store_true', help='check query budgets only')
+    parser.add_argument('--write-budgets', action='store_true', help='save measured values + headroom as budgets')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    pools, max_book = sample_pools(args.db, args.requests)
+    if args.url:
+        def make_session():
+            return HttpSession(args.url)
+    else:
+        # Config reads DATABASE_URL when it is first imported
+        os.environ['DATABASE_URL'] = args.db
+        from config import Config
+        from app import create_app
+
+        class LoadConfig(Config):
+            SQL_PROFILER = True
+            SLOW_QUERY_THRESHOLD_MS = 10 ** 9 # timings are reported here instead
+            GUNICORN_THREADS = args.concurrency # pool sized like one worker with that many threads
+
+        app = create_app(LoadConfig)
+
+        def make_session():
+            return ClientSession(app)
+
+    driver = Driver(make_session, args.password, pools['readers'])
+    pools['scratch_books'] = scratch_books(driver, args.db, args.requests, random.Random(args.seed))
+    plan = [s for s in scenarios(pools, max_book) if not args.only or args.only in s[0]]
+    jobs = [(scenario, args.seed * 1_000_003 + n * 7919 + i) for n, scenario in enumerate(plan)
+            for i in range(args.requests)]
+    random.Random(args.seed).shuffle(jobs)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(lambda job: driver.run(*job), jobs))
+    wall = time.perf_counter() - start
+    summary = summarize(results)
+
+    print(f'{"scenario":<34} {"reqs":>5} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"max":>4}')
+    for name, stats in sorted(summary.items(), key=lambda item: item[1]['p95'], reverse=True):
+        queries = '-' if stats['avg_queries'] is None else f'{stats["avg_queries"]:.1f}'
+        print(f'{name:<34} {stats["requests"]:>5} {stats["p50"]:>8.1f} {stats["p95"]:>8.1f} {stats["p99"]:>8.1f} '
+              f'{queries:>8} {stats["max_queries"] if stats["max_queries"] is not None else "-":>4}')
+    print(f'\n{len(results):,} requests in {wall:.1f}s: {len(results) / wall:.1f} req/s '
+          f'with {args.concurrency} threads')
+
+    if args.write_budgets:
+        budgets = {name: {'max_queries': (stats['max_queries'] or 0) + QUERY_HEADROOM,
+                          'p95_ms': round(max(stats['p95'] * LATENCY_HEADROOM, 50))}
+                   for name, stats in sorted(summary.items())}
+        with open(args.budgets, 'w') as f:
+            json.dump(budgets, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {args.budgets}')
+        return
+
+    with open(args.budgets) as f:
+        budgets = json.load(f)
+    problems = check(summary, budgets, latency=not args.no_latency_budgets)
+    for line in problems:
+        print('OVER BUDGET', line)
+    if problems:
+        sys.exit(1)
+    print('All scenarios within budget.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Time the similar-books build at catalogue scale and report its memory use.
+
+    python benchmarks/neighbors_scale.py                       # 1M books, 5M loans
+    python benchmarks/neighbors_scale.py --books 100000 --readers 50000 --loans 500000
+
+Generates a synthetic catalogue in memory (Zipf-popular books, readers with a
+long-tailed number of loans, a few text terms per book drawn from a skewed
+vocabulary) and runs app.neighbors.compute_neighbors on it, the same code path
+`flask neighbors build` uses once the rows are loaded. The database load and
+write are linear in the number of rows and are not part of this measurement.
+Needs NumPy: pip install -r requirements-jobs.txt
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.neighbors import DEFAULT_K, MAX_BASKET, TEXT_WEIGHT, compute_neighbors, max_rss_mb
+
+
+def synthetic(books, readers, loans, vocabulary, terms_per_book, seed):
+    rng = np.random.default_rng(seed)
+    # Popular titles are borrowed far more often than the long tail
+    popularity = rng.zipf(1.3, loans) % books
+    borrowers = (rng.zipf(1.5, loans) * 7919 + rng.integers(0, readers, loans)) % readers
+    term_ids = rng.zipf(1.2, books * terms_per_book) % vocabulary
+    term_items = np.repeat(np.arange(books), terms_per_book)
+    return (borrowers.astype(np.int64), popularity.astype(np.int64)), (term_ids.astype(np.int64), term_items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--books', type=int, default=1_000_000)
+    parser.add_argument('--readers', type=int, default=200_000)
+    parser.add_argument('--loans', type=int, default=5_000_000)
+    parser.add_argument('--vocabulary', type=int, default=200_000)
+    parser.add_argument('--terms-per-book', type=int, default=8)
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--max-basket', type=int, default=MAX_BASKET)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    interactions, terms = synthetic(args.books, args.readers, args.loans, args.vocabulary,
+                                    args.terms_per_book, args.seed)
+    print(f'generated {args.books:,} books, {len(interactions[0]):,} loans, '
+          f'{len(terms[0]):,} term links in {time.perf_counter() - start:.1f}s')
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    src, dst, score, rank = compute_neighbors(np, args.books, interactions, terms, args.k, TEXT_WEIGHT,
+                                              args.max_basket)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    covered = len(np.unique(src))
+    print(f'computed {len(src):,} neighbour rows ({covered:,} books covered, '
+          f'{covered / args.books:.0%}) in {elapsed:.1f}s')
+    print(f'peak traced memory {peak / 2**20:,.0f} MiB, max RSS {max_rss_mb():,.0f} MiB')
+
+
+if __name__ == '__main__':
+    main()
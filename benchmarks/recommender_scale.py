@@ -0,0 +1,88 @@
+"""Time recommendation training at scale and report its memory use.
+
+    python benchmarks/recommender_scale.py                        # 200k readers, 1M books, 5M events
+    python benchmarks/recommender_scale.py --users 20000 --books 100000 --events 500000 --epochs 5
+
+Generates synthetic history in memory (Zipf-popular books, readers with a
+long-tailed number of loans, a hidden taste per reader so there is structure
+to learn) and runs the same functions as `flask recommendations train`:
+interaction_matrix, factorize and top_items. One random loan per active reader
+is held out and hit rate @ top-n is printed, so a change that breaks the model
+shows up as well as one that makes it slower.
+Needs NumPy: pip install -r requirements-jobs.txt
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.neighbors import max_rss_mb
+from app.recommendations import (ALPHA, CANDIDATES, EPOCHS, FACTORS, REGULARIZATION, TOP_N, factorize,
+                                 interaction_matrix, top_items)
+
+TASTES = 50
+
+
+def synthetic(users, books, events, seed):
+    rng = np.random.default_rng(seed)
+    readers = (rng.zipf(1.5, events) * 7919 + rng.integers(0, users, events)) % users
+    # Each reader mostly borrows from one of TASTES slices of the catalogue
+    taste = rng.integers(0, TASTES, users)
+    popular = rng.zipf(1.3, events) % (books // TASTES)
+    on_taste = rng.random(events) < 0.8
+    titles = np.where(on_taste, taste[readers] + popular * TASTES, rng.zipf(1.3, events) % books)
+    return readers.astype(np.int64), titles.astype(np.int64), np.ones(events, dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--books', type=int, default=1_000_000)
+    parser.add_argument('--events', type=int, default=5_000_000)
+    parser.add_argument('--factors', type=int, default=FACTORS)
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--top-n', type=int, default=TOP_N)
+    parser.add_argument('--candidates', type=int, default=CANDIDATES)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    users, books, weights = synthetic(args.users, args.books, args.events, args.seed)
+    tracemalloc.start()
+    user_ids, item_ids, rows, cols, conf = interaction_matrix(np, users, books, weights, ALPHA)
+
+    # Hold out one pair of every reader with at least three
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    sizes = np.diff(np.r_[starts, len(rows)])
+    rng = np.random.default_rng(args.seed)
+    eligible = sizes >= 3
+    held = starts[eligible] + (rng.random(eligible.sum()) * sizes[eligible]).astype(np.int64)
+    keep = np.ones(len(rows), dtype=bool)
+    keep[held] = False
+    print(f'prepared {len(rows):,} pairs ({len(user_ids):,} readers, {len(item_ids):,} books, '
+          f'{len(held):,} held out) in {time.perf_counter() - start:.1f}s')
+
+    start = time.perf_counter()
+    X, Y = factorize(np, rows[keep], cols[keep], conf[keep], len(user_ids), len(item_ids), args.factors,
+                     args.epochs, REGULARIZATION, report=print)
+    trained = time.perf_counter() - start
+    start = time.perf_counter()
+    picked_rows, picked_items, _, _ = top_items(np, X, Y, rows[keep], cols[keep], args.top_n, args.candidates)
+    scored = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    picked = set(zip(picked_rows.tolist(), picked_items.tolist()))
+    hits = sum((r, c) in picked for r, c in zip(rows[held].tolist(), cols[held].tolist()))
+    print(f'trained in {trained:.1f}s, scored {len(picked_rows):,} recommendations in {scored:.1f}s')
+    print(f'hit rate @ {args.top_n}: {hits / max(len(held), 1):.1%}')
+    print(f'peak traced memory {peak / 2**20:,.0f} MiB, max RSS {max_rss_mb():,.0f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Fill a database with a synthetic library at a chosen scale.
+
+    python benchmarks/scale_data.py --db sqlite:////tmp/bench.sqlite --scale 100k
+    python benchmarks/scale_data.py --db postgresql://localhost/bench --scale 10m
+    python benchmarks/scale_data.py --db sqlite:////tmp/bench.sqlite --scale 1m --reviews 0
+
+WIPES the target database (drop_all / create_all); refuses to touch one that
+already has users unless --force is given. Rows are generated inside the
+database with one INSERT ... SELECT per table over a number series (recursive
+CTE on SQLite, generate_series on PostgreSQL), so millions of rows take
+seconds. Derived state (counters, sales rollup, ratings, wallets, search
+index) is then rebuilt with the app's own rebuild functions, so the result
+behaves like a real deployment.
+
+Logins: user1@example.com is the admin, user2@example.com a librarian, every
+other userN@example.com a reader; all use the --password (default 'bench').
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, make_url, text  # noqa: E402
+
+# Presets, roughly 1k / 100k / 1M / 10M rows in total
+SCALES = {
+    '1k': dict(users=50, books=200, transactions=500, reservations=150, reviews=100),
+    '100k': dict(users=2_000, books=20_000, transactions=50_000, reservations=15_000, reviews=13_000),
+    '1m': dict(users=20_000, books=200_000, transactions=500_000, reservations=150_000, reviews=130_000),
+    '10m': dict(users=200_000, books=2_000_000, transactions=5_000_000, reservations=1_500_000, reviews=1_300_000),
+}
+CATEGORIES = ['Fiction', 'Science Fiction', 'Business', 'Technology', 'Biography', 'History', 'Comics',
+              'Poetry', 'Travel', 'Cooking']
+HISTORY_DAYS = 365
+
+
+def series(dialect, n):
+    """FROM-clause producing integers 1..n as column i."""
+    if dialect == 'sqlite':
+        return f'(WITH RECURSIVE s(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM s WHERE i < {n}) SELECT i FROM s) AS s'
+    return f'generate_series(1, {n}) AS s(i)'
+
+
+def minutes_after(dialect, start, expr):
+    """Timestamp `expr` minutes after `start` ('YYYY-MM-DD[ HH:MM:SS]')."""
+    if dialect == 'sqlite':
+        return f"datetime('{start}', '+' || ({expr}) || ' minutes')"
+    return f"(timestamp '{start}' + ({expr}) * interval '1 minute')"
+
+
+def pick(expr, values):
+    """SQL CASE choosing values[expr % len(values)]."""
+    whens = ' '.join(f"WHEN {i} THEN '{v}'" for i, v in enumerate(values))
+    return f'(CASE ({expr}) % {len(values)} {whens} END)'
+
+
+def insert_statements(dialect, users, books, transactions, reservations, reviews):
+    """INSERT ... SELECT statements for every table, spreading activity over the last HISTORY_DAYS."""
+    start = (datetime.utcnow() - timedelta(days=HISTORY_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    span = HISTORY_DAYS * 24 * 60
+    when = minutes_after(dialect, start, f'(i * 7) % {span}')
+    due = minutes_after(dialect, start, f'(i * 7) % {span} + 20160')
+    readers = max(users - 2, 1)
+    reader = f'(i * 7919) % {readers} + 3' # ids 1 and 2 are staff
+    statements = [
+        ('user',
+         f"INSERT INTO \"user\" (id, username, email, password_hash, role, wallet_balance, created_at) "
+         f"SELECT i, 'user' || i, 'user' || i || '@example.com', :password_hash, "
+         f"CASE i WHEN 1 THEN 'admin' WHEN 2 THEN 'librarian' ELSE 'user' END, 0, {when} FROM {series(dialect, users)}"),
+        # Every tenth book is listed by a reader, the rest belong to the library
+        ('book',
+         f"INSERT INTO book (id, title, author, isbn, category, description, quantity, available_count, price, "
+         f"pages, average_rating, rating_count, seller_id, created_at) "
+         f"SELECT i, 'The ' || {pick('i', CATEGORIES)} || ' Book ' || i, 'Author ' || (i % 5000), 'isbn' || i, "
+         f"{pick('i / 7', CATEGORIES)}, 'Synthetic title number ' || i, 5, i % 6, 5 + i % 20, 100 + i % 400, 0, 0, "
+         f"CASE WHEN i % 10 = 0 THEN {reader} END, {when} FROM {series(dialect, books)}"),
+        # 5% open loans, 5% purchases, the rest returned
+        ('transaction',
+         f"INSERT INTO \"transaction\" (id, user_id, book_id, issued_date, due_date, return_date, status, "
+         f"transaction_type, amount, fine_amount) "
+         f"SELECT i, {reader}, (i * 104729) % {books} + 1, {when}, "
+         f"CASE WHEN i % 20 = 1 THEN NULL ELSE {due} END, CASE WHEN i % 20 > 1 THEN {due} END, "
+         f"CASE i % 20 WHEN 0 THEN 'issued' WHEN 1 THEN 'completed' ELSE 'returned' END, "
+         f"CASE i % 20 WHEN 1 THEN 'purchase' ELSE 'borrow' END, "
+         f"CASE i % 20 WHEN 1 THEN 5 + i % 20 ELSE 0 END, 0 FROM {series(dialect, transactions)}"),
+        ('reservation',
+         f"INSERT INTO reservation (id, user_id, book_id, status, created_at) "
+         f"SELECT i, (i * 31) % {readers} + 3, (i * 131) % {books} + 1, "
+         f"{pick('i', ['pending', 'approved', 'fulfilled', 'fulfilled', 'cancelled'])}, {when} "
+         f"FROM {series(dialect, reservations)}"),
+        # Reader r reviews consecutive books starting at r * 7, so (user, book) stays unique
+        ('review',
+         f"INSERT INTO review (id, user_id, book_id, rating, comment, created_at) "
+         f"SELECT i, (i - 1) % {readers} + 3, ((i - 1) / {readers} + ((i - 1) % {readers}) * 7) % {books} + 1, "
+         f"i % 5 + 1, 'Synthetic review ' || i, {when} FROM {series(dialect, min(reviews, readers * books))}"),
+    ]
+    counts = {'user': users, 'book': books, 'transaction': transactions, 'reservation': reservations,
+              'review': reviews}
+    return [(table, counts[table], sql) for table, sql in statements if counts[table]]
+
+
+def generate(app, sizes, password='bench', report=print):
+    """Recreate the schema in app's database and fill it. Returns seconds per table."""
+    from werkzeug.security import generate_password_hash
+
+    from app import db
+    from app.analytics import rebuild_rollup
+    from app.ratings import rebuild_ratings
+    from app.search import rebuild_search_index
+    from app.stats import rebuild_stats
+    from app.wallet import open_accounts
+
+    timings = {}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        dialect = db.engine.dialect.name
+        password_hash = generate_password_hash(password)
+        for table, rows, sql in insert_statements(dialect, **sizes):
+            start = time.perf_counter()
+            with db.engine.begin() as conn:
+                conn.execute(text(sql), {'password_hash': password_hash})
+                if dialect == 'postgresql':
+                    # Explicit ids leave the serial sequence behind
+                    conn.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                                      f"(SELECT max(id) FROM \"{table}\"))"))
+            timings[table] = time.perf_counter() - start
+            report(f'  {table:<12} {rows:>12,} rows in {timings[table]:.1f}s')
+
+        start = time.perf_counter()
+        rebuild_stats()
+        rebuild_rollup()
+        rebuild_ratings()
+        open_accounts()
+        with db.engine.begin() as conn:
+            rebuild_search_index(conn)
+            conn.execute(text('ANALYZE'))
+        timings['derived'] = time.perf_counter() - start
+        report(f'  derived state (counters, rollup, ratings, wallets, search) in {timings["derived"]:.1f}s')
+    return timings
+
+
+def make_app(url):
+    # Config reads DATABASE_URL when it is first imported
+    os.environ['DATABASE_URL'] = url
+    from config import Config
+    from app import create_app
+
+    class BenchConfig(Config):
+        SQL_PROFILER = False
+
+    return create_app(BenchConfig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', required=True, help='database URL to (re)create')
+    parser.add_argument('--scale', choices=SCALES, default='100k')
+    for table in ('users', 'books', 'transactions', 'reservations', 'reviews'):
+        parser.add_argument(f'--{table}', type=int, help=f'override the preset number of {table}')
+    parser.add_argument('--password', default='bench')
+    parser.add_argument('--force', action='store_true', help='wipe a database that already has data')
+    args = parser.parse_args()
+
+    sizes = {name: getattr(args, name) if getattr(args, name) is not None else count
+             for name, count in SCALES[args.scale].items()}
+    sizes['users'] = max(sizes['users'], 3)
+    app = make_app(args.db)
+
+    from app import db
+    with app.app_context():
+        if inspect(db.engine).has_table('user') and not args.force:
+            if db.session.scalar(text('SELECT count(*) FROM "user"')):
+                parser.error('database already has users; pass --force to wipe it')
+
+    print(f'Generating {sum(sizes.values()):,} rows ({args.scale} preset) into '
+          f'{make_url(args.db).render_as_string(hide_password=True)}')
+    start = time.perf_counter()
+    generate(app, sizes, args.password)
+    print(f'Done in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""Hammer buy_book and issue_book from many processes and check nothing was oversold.
+
+    python benchmarks/stress_checkout.py                                  # temp SQLite file
+    python benchmarks/stress_checkout.py --db postgresql://localhost/stress --workers 16 --buys 500
+
+Every worker process builds its own app and logs in its own buyer, then all of them
+start together and buy from a few hot books (stock smaller than the demand) through
+the real routes. Librarian workers meanwhile issue pending reservations of a book
+with fewer copies than holds. Afterwards the script checks the invariants and exits
+non-zero if any is broken:
+
+- stock never goes negative and sold + remaining == initial stock
+- one completed purchase per copy sold, and the seller wallet (cached balance and
+  ledger) and sales rollup all add up to exactly what was paid
+- loans issued + copies left on the shelf == initial copies
+- the dashboard counters match a recount of the tables
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HOT_BOOKS = 3
+PRICE = 7.5
+
+
+def make_app():
+    # Imported late: Config reads DATABASE_URL when it is first imported
+    from config import Config
+    from app import create_app
+
+    class StressConfig(Config):
+        WTF_CSRF_ENABLED = False
+        SQL_PROFILER = False
+
+    return create_app(StressConfig)
+
+
+def seed(workers, stock, holds):
+    from app import db
+    from app.models import Book, Reservation, User
+    from app.analytics import rebuild_rollup
+    from app.stats import rebuild_stats
+
+    app = make_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seller = User(username='seller', email='seller@example.com', role='user')
+        librarian = User(username='librarian', email='librarian@example.com', role='librarian')
+        buyers = [User(username=f'buyer{i}', email=f'buyer{i}@example.com', role='user') for i in range(workers)]
+        for user in [seller, librarian, *buyers]:
+            user.set_password('pw')
+        db.session.add_all([seller, librarian, *buyers])
+        db.session.flush()
+        for i in range(HOT_BOOKS):
+            db.session.add(Book(title=f'Hot {i}', author='Stress', isbn=f'97800000000{i:02d}', quantity=stock,
+                                available_count=stock, price=PRICE, seller_id=seller.id))
+        loan_book = Book(title='On hold', author='Stress', isbn='9781111111111', quantity=stock // 4 or 1,
+                         available_count=stock // 4 or 1, price=PRICE)
+        db.session.add(loan_book)
+        db.session.flush()
+        db.session.add_all(Reservation(user_id=buyers[i % workers].id, book_id=loan_book.id) for i in range(holds))
+        db.session.commit()
+        rebuild_rollup()
+        rebuild_stats()
+        return seller.id, loan_book.id, loan_book.quantity
+
+
+def _login(client, email):
+    response = client.post('/auth/login', data={'email': email, 'password': 'pw'})
+    assert response.status_code == 302, f'login failed for {email}'
+
+
+def buyer(index, buys, start):
+    app = make_app()
+    client = app.test_client()
+    _login(client, f'buyer{index}@example.com')
+    with app.app_context():
+        from app import db
+        from app.models import Book
+        book_ids = db.session.scalars(db.select(Book.id).where(Book.title.like('Hot %')).order_by(Book.id)).all()
+    start.wait()
+    errors = 0
+    for n in range(buys):
+        response = client.post(f'/user/book/{book_ids[(index + n) % len(book_ids)]}/buy')
+        errors += response.status_code != 302
+    return errors
+
+
+def librarian(index, count, start, reservation_ids):
+    app = make_app()
+    client = app.test_client()
+    _login(client, 'librarian@example.com')
+    start.wait()
+    errors = 0
+    for reservation_id in reservation_ids[index::count]:
+        errors += client.get(f'/librarian/issue/{reservation_id}').status_code != 302
+    return errors
+
+
+def check(seller_id, loan_book_id, loan_copies, stock):
+    from app import db
+    from app.models import Book, SalesRollup, Transaction, WalletAccount, WalletEntry
+    from app.stats import compute_stats, get_stats
+    from app.wallet import to_cents
+
+    app = make_app()
+    failures = []
+    with app.app_context():
+        hot = db.session.scalars(db.select(Book).where(Book.title.like('Hot %'))).all()
+        sold_total = 0
+        for book in hot:
+            sold = db.session.scalar(db.select(db.func.count()).where(
+                Transaction.book_id == book.id, Transaction.transaction_type == 'purchase'))
+            sold_total += sold
+            if book.quantity < 0 or book.available_count < 0:
+                failures.append(f'{book.title}: negative stock ({book.quantity}/{book.available_count})')
+            if sold + book.quantity != stock or book.available_count != book.quantity:
+                failures.append(f'{book.title}: {sold} sold + {book.quantity} left != {stock}')
+        paid = sold_total * to_cents(PRICE)
+        cached = db.session.get(WalletAccount, seller_id).balance_cents
+        ledger = db.session.scalar(db.select(db.func.sum(WalletEntry.amount_cents)).where(WalletEntry.user_id == seller_id))
+        if cached != paid or ledger != paid:
+            failures.append(f'seller wallet: cached {cached} / ledger {ledger} cents != {paid}')
+        rollup = db.session.scalar(db.select(db.func.coalesce(db.func.sum(SalesRollup.revenue), 0)))
+        if abs(rollup - sold_total * PRICE) > 1e-6:
+            failures.append(f'sales rollup {rollup} != {sold_total} x {PRICE}')
+
+        loans = db.session.scalar(db.select(db.func.count()).where(
+            Transaction.book_id == loan_book_id, Transaction.status == 'issued'))
+        shelf = db.session.get(Book, loan_book_id).available_count
+        if shelf < 0 or loans + shelf != loan_copies:
+            failures.append(f'loan book: {loans} issued + {shelf} on shelf != {loan_copies}')
+
+        counters, recount = get_stats(), compute_stats()
+        if counters != recount:
+            failures.append(f'dashboard counters {counters} != recount {recount}')
+    return sold_total, loans, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='Database URL (default: a temporary SQLite file)')
+    parser.add_argument('--workers', type=int, default=8, help='Buyer processes')
+    parser.add_argument('--buys', type=int, default=250, help='Purchases attempted per buyer')
+    parser.add_argument('--stock', type=int, help='Copies of each hot book (default: a third of the demand)')
+    parser.add_argument('--librarians', type=int, default=2)
+    parser.add_argument('--holds', type=int, default=200, help='Pending reservations to issue')
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ['DATABASE_URL'] = args.db
+    else:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.sqlite')
+    stock = args.stock or max(1, args.workers * args.buys // HOT_BOOKS // 3)
+
+    seller_id, loan_book_id, loan_copies = seed(args.workers, stock, args.holds)
+    from app import db
+    from app.models import Reservation
+    with make_app().app_context():
+        reservation_ids = db.session.scalars(db.select(Reservation.id).order_by(Reservation.id)).all()
+
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager:
+        start = manager.Event()
+        with context.Pool(args.workers + args.librarians) as pool:
+            jobs = [pool.apply_async(buyer, (i, args.buys, start)) for i in range(args.workers)]
+            jobs += [pool.apply_async(librarian, (i, args.librarians, start, reservation_ids))
+                     for i in range(args.librarians)]
+            time.sleep(3) # let every worker build its app and log in
+            began = time.perf_counter()
+            start.set()
+            errors = sum(job.get() for job in jobs)
+            elapsed = time.perf_counter() - began
+
+    requests = args.workers * args.buys + len(reservation_ids)
+    sold, loans, failures = check(seller_id, loan_book_id, loan_copies, stock)
+    print(f'{requests} requests in {elapsed:.1f}s ({requests / elapsed:,.0f}/s), {errors} failed responses')
+    print(f'sold {sold} of {stock * HOT_BOOKS} copies, issued {loans} of {loan_copies} loan copies')
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures or errors:
+        sys.exit(1)
+    print('all invariants hold')
+
+
+if __name__ == '__main__':
+    main()
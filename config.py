@@ -8,3 +8,77 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = uri or 'sqlite:///library.sqlite'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Engine profile (see app/engine.py): auto, pooled, sqlite-wal or basic. Pools are sized
+    # per worker from GUNICORN_THREADS, which gunicorn.conf.py reads too.
+    DB_PROFILE = os.environ.get('DB_PROFILE') or 'auto'
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS') or 1)
+    DB_POOL_SIZE = int(os.environ['DB_POOL_SIZE']) if os.environ.get('DB_POOL_SIZE') else None
+    DB_MAX_OVERFLOW = int(os.environ['DB_MAX_OVERFLOW']) if os.environ.get('DB_MAX_OVERFLOW') else None
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 10)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 2**20)
+
+    # Read replicas (see app/routing.py): comma-separated URLs. GET requests read from a healthy
+    # replica; a client stays on the primary for REPLICA_PIN_SECONDS after it writes, and a replica
+    # that fails a health check is skipped for REPLICA_RETRY_SECONDS. Point SQLite replicas at a
+    # read-only URI, e.g. sqlite:///file:/srv/replica.sqlite?mode=ro&uri=true
+    REPLICA_URLS = [url.strip().replace('postgres://', 'postgresql://', 1)
+                    for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url.strip()]
+    REPLICA_PIN_SECONDS = float(os.environ.get('REPLICA_PIN_SECONDS') or 5)
+    REPLICA_RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS') or 30)
+
+    # Cover images (see app/covers.py): originals and WebP/JPEG variants under COVER_DIR (default
+    # instance/covers), served with COVER_MAX_AGE. COVER_WORKER_THREADS background threads per worker
+    # render new covers; with 0 they wait for `flask covers work`.
+    COVER_DIR = os.environ.get('COVER_DIR')
+    COVER_MAX_AGE = int(os.environ.get('COVER_MAX_AGE') or 30 * 86400)
+    COVER_WORKER_THREADS = int(os.environ.get('COVER_WORKER_THREADS', 1))
+    COVER_FETCH_TIMEOUT = float(os.environ.get('COVER_FETCH_TIMEOUT') or 10)
+    COVER_MAX_BYTES = int(os.environ.get('COVER_MAX_BYTES') or 10 * 2**20)
+
+    # Static assets (see app/assets.py): fingerprinted URLs with immutable caching, files
+    # precompressed into ASSET_BUILD_DIR (default instance/assets). HTML and JSON responses of at
+    # least COMPRESS_MIN_BYTES are gzip/brotli compressed when COMPRESS_RESPONSES is on.
+    ASSET_FINGERPRINTS = os.environ.get('ASSET_FINGERPRINTS', '1') != '0'
+    ASSET_BUILD_DIR = os.environ.get('ASSET_BUILD_DIR')
+    COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', '1') != '0'
+    COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES') or 500)
+
+    # Late fee charged per day overdue (confirm_return and the nightly 'flask loans mark-overdue' job)
+    FINE_PER_DAY = float(os.environ.get('FINE_PER_DAY') or 1.0)
+
+    # Cache backend: 'memory' (per-worker LRU), 'sqlite' (shared by workers on one host)
+    # or 'redis' (shared everywhere, needs the redis package). CACHE_URL is the file path / redis URL.
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or 'memory'
+    CACHE_URL = os.environ.get('CACHE_URL')
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL') or 300)
+    # Seconds the homepage collections and category shelves may show stale stock counts and
+    # ratings (see app/catalog.py); other catalogue edits invalidate them right away
+    CATALOG_LIVE_TTL = int(os.environ.get('CATALOG_LIVE_TTL') or 30)
+
+    # SQL profiler: per-endpoint stats on /admin/perf, statements slower than the
+    # threshold are logged to 'smart_library.slow_queries' (and SLOW_QUERY_LOG if set)
+    SQL_PROFILER = os.environ.get('SQL_PROFILER', '1') != '0'
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS') or 200)
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')
+    # Log raw bound values (password hashes, e-mails...) instead of their count and types.
+    # Local debugging only.
+    SLOW_QUERY_LOG_PARAMS = os.environ.get('SLOW_QUERY_LOG_PARAMS') == '1'
+    PROFILER_WINDOW = 500
+
+    # N+1 detector: 'warn' logs lazy loads fired from templates, 'raise' fails the request.
+    # Defaults to 'warn' in debug mode.
+    DETECT_LAZY_LOADS = os.environ.get('DETECT_LAZY_LOADS')
+    QUERY_COUNT_WARN = 20
+
+    # Seconds a logged-in user's snapshot (id, username, role, wallet) is cached in each worker by
+    # the user_loader. Changes reach every worker at once with a shared CACHE_BACKEND (sqlite/redis),
+    # within this many seconds with 'memory'.
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 30)
+
+    # Homepage "Recommended" shelf strategy (see app/recommendations.py): personal, popular or random.
+    # Personal and popular lists are cached for RECOMMENDATION_CACHE_TTL seconds.
+    RECOMMENDER = os.environ.get('RECOMMENDER') or 'personal'
+    RECOMMENDATION_CACHE_TTL = int(os.environ.get('RECOMMENDATION_CACHE_TTL') or 900)
@@ -0,0 +1,7 @@
+import os
+
+# Loaded automatically by `gunicorn run:app` from the project directory.
+# GUNICORN_THREADS also sizes each worker's database pool (DB_PROFILE, app/engine.py),
+# so keep workers * (threads * 2) under the database's connection limit.
+workers = int(os.environ.get('WEB_CONCURRENCY') or 1)
+threads = int(os.environ.get('GUNICORN_THREADS') or 1)
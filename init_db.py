@@ -1,10 +1,24 @@
 from app import create_app, db
+from app.search import create_search_index
+from app.analytics import rebuild_rollup
+from app.models import SalesRollup
+from app.wallet import open_accounts
+from app.covers import register_all
 
 def init_db():
     app = create_app()
     with app.app_context():
         try:
             db.create_all()
+            with db.engine.begin() as connection:
+                create_search_index(connection)
+            # First run after adding the sales rollup: backfill it from past sales
+            if not SalesRollup.query.first():
+                rebuild_rollup()
+            # Wallet ledger: open accounts for users that predate it (no-op afterwards)
+            open_accounts()
+            # Cover images: queue sources of books that predate the cover table
+            register_all()
             print("✅ Database tables created successfully.")
         except Exception as e:
             print(f"❌ Error creating database tables: {e}")
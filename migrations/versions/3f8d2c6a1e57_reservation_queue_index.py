@@ -0,0 +1,28 @@
+"""per-book reservation queue index (book_id, status, created_at, id)
+
+Revision ID: 3f8d2c6a1e57
+Revises: 7c1e4a9b2d30
+Create Date: 2026-10-18 19:20:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8d2c6a1e57'
+down_revision = '7c1e4a9b2d30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Supersedes ix_reservation_book_status, which is a prefix of it
+    op.create_index('ix_reservation_queue', 'reservation', ['book_id', 'status', 'created_at', 'id'],
+                    if_not_exists=True)
+    op.drop_index('ix_reservation_book_status', table_name='reservation', if_exists=True)
+
+
+def downgrade():
+    op.create_index('ix_reservation_book_status', 'reservation', ['book_id', 'status'], if_not_exists=True)
+    op.drop_index('ix_reservation_queue', table_name='reservation', if_exists=True)
@@ -0,0 +1,50 @@
+"""composite and partial indexes for status-filtered transaction/reservation queries
+
+Revision ID: 7c1e4a9b2d30
+Revises: e5f77f4cab02
+Create Date: 2026-10-18 11:02:17.530144
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4a9b2d30'
+down_revision = 'e5f77f4cab02'
+branch_labels = None
+depends_on = None
+
+ACTIVE_LOAN = sa.text("status = 'issued'")
+
+TRANSACTION_INDEXES = [
+    ('ix_transaction_user_status', ['user_id', 'status']),
+    ('ix_transaction_book_status', ['book_id', 'status']),
+    ('ix_transaction_status_issued', ['status', 'issued_date']),
+    ('ix_transaction_type_status_issued', ['transaction_type', 'status', 'issued_date', 'id']),
+    ('ix_transaction_issued_date', ['issued_date']),
+]
+
+RESERVATION_INDEXES = [
+    ('ix_reservation_status_created', ['status', 'created_at']),
+    ('ix_reservation_user_book_status', ['user_id', 'book_id', 'status']),
+    ('ix_reservation_book_status', ['book_id', 'status']),
+]
+
+
+def upgrade():
+    # if_not_exists: databases built with db.create_all() already have them
+    for name, columns in TRANSACTION_INDEXES:
+        op.create_index(name, 'transaction', columns, if_not_exists=True)
+    op.create_index('ix_transaction_active_due', 'transaction', ['due_date'], if_not_exists=True,
+                    sqlite_where=ACTIVE_LOAN, postgresql_where=ACTIVE_LOAN)
+    for name, columns in RESERVATION_INDEXES:
+        op.create_index(name, 'reservation', columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, _ in reversed(RESERVATION_INDEXES):
+        op.drop_index(name, table_name='reservation', if_exists=True)
+    op.drop_index('ix_transaction_active_due', table_name='transaction', if_exists=True)
+    for name, _ in reversed(TRANSACTION_INDEXES):
+        op.drop_index(name, table_name='transaction', if_exists=True)
@@ -0,0 +1,26 @@
+"""review indexes: one review per reader and book, per-book listing
+
+Revision ID: 9a4e7b1c5d82
+Revises: 3f8d2c6a1e57
+Create Date: 2026-10-18 19:41:09.502716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4e7b1c5d82'
+down_revision = '3f8d2c6a1e57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('uq_review_user_book', 'review', ['user_id', 'book_id'], unique=True, if_not_exists=True)
+    op.create_index('ix_review_book_created', 'review', ['book_id', 'created_at', 'id'], if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_review_book_created', table_name='review', if_exists=True)
+    op.drop_index('uq_review_user_book', table_name='review', if_exists=True)
@@ -0,0 +1,33 @@
+"""user_recommendations: precomputed personal top-N
+
+Revision ID: a5c2e7f90d36
+Revises: f3a8d5e6b412
+Create Date: 2026-10-19 11:37:02.551890
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5c2e7f90d36'
+down_revision = 'f3a8d5e6b412'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # if_not_exists: databases built with db.create_all() already have it.
+    # Filled by `flask recommendations train`; until then the 'personal' recommender shows the popular shelf.
+    op.create_table('user_recommendations',
+    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'rank', name=op.f('pk_user_recommendations')),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('user_recommendations', if_exists=True)
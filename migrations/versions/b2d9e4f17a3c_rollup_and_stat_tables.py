@@ -0,0 +1,70 @@
+"""sales_rollup and library_stat tables
+
+Revision ID: b2d9e4f17a3c
+Revises: 9a4e7b1c5d82
+Create Date: 2026-10-19 09:14:52.307118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d9e4f17a3c'
+down_revision = '9a4e7b1c5d82'
+branch_labels = None
+depends_on = None
+
+
+sales_rollup = sa.table('sales_rollup', sa.column('day', sa.Date), sa.column('category', sa.String),
+                        sa.column('seller_id', sa.Integer), sa.column('sales_count', sa.Integer),
+                        sa.column('revenue', sa.Float))
+transaction = sa.table('transaction', sa.column('id', sa.Integer), sa.column('book_id', sa.Integer),
+                       sa.column('amount', sa.Float), sa.column('issued_date', sa.DateTime),
+                       sa.column('transaction_type', sa.String), sa.column('status', sa.String))
+book = sa.table('book', sa.column('id', sa.Integer), sa.column('category', sa.String),
+                sa.column('seller_id', sa.Integer))
+
+
+def upgrade():
+    # if_not_exists: databases built with db.create_all() already have them.
+    # library_stat is seeded by the first get_stats() call (or `flask stats rebuild`).
+    op.create_table('sales_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('category', sa.String(length=50), nullable=False),
+    sa.Column('seller_id', sa.Integer(), nullable=False),
+    sa.Column('sales_count', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_sales_rollup')),
+    sa.UniqueConstraint('day', 'category', 'seller_id', name='uq_sales_rollup_bucket'),
+    if_not_exists=True
+    )
+    op.create_table('library_stat',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name', name=op.f('pk_library_stat')),
+    if_not_exists=True
+    )
+
+    # Past sales into the rollup, as `flask sales rebuild` does; whatever the table
+    # held (buckets buy_book added since create_all) is recomputed with them
+    if op.get_bind().dialect.name == 'sqlite':
+        day = sa.func.date(transaction.c.issued_date)
+    else:
+        day = sa.cast(transaction.c.issued_date, sa.Date)
+    category = sa.func.coalesce(book.c.category, '')
+    seller = sa.func.coalesce(book.c.seller_id, 0)
+    op.execute(sales_rollup.delete())
+    op.execute(sales_rollup.insert().from_select(
+        ['day', 'category', 'seller_id', 'sales_count', 'revenue'],
+        sa.select(day, category, seller, sa.func.count(transaction.c.id), sa.func.sum(transaction.c.amount))
+        .select_from(transaction.join(book, book.c.id == transaction.c.book_id))
+        .where(transaction.c.transaction_type == 'purchase', transaction.c.status == 'completed')
+        .group_by(day, category, seller),
+    ))
+
+
+def downgrade():
+    op.drop_table('library_stat', if_exists=True)
+    op.drop_table('sales_rollup', if_exists=True)
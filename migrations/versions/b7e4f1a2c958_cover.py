@@ -0,0 +1,35 @@
+"""cover: local copies of book cover images
+
+Revision ID: b7e4f1a2c958
+Revises: a5c2e7f90d36
+Create Date: 2026-10-19 11:52:26.731604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4f1a2c958'
+down_revision = 'a5c2e7f90d36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # if_not_exists: databases built with db.create_all() already have it.
+    # `flask covers warm` then queues the covers of existing books.
+    op.create_table('cover',
+    sa.Column('key', sa.String(length=32), nullable=False),
+    sa.Column('source', sa.String(length=500), nullable=False),
+    sa.Column('digest', sa.String(length=64), nullable=True),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('error', sa.String(length=200), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key', name=op.f('pk_cover')),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('cover', if_exists=True)
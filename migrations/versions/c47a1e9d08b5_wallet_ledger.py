@@ -0,0 +1,76 @@
+"""wallet ledger: wallet_entry and wallet_account, opened from user.wallet_balance
+
+Revision ID: c47a1e9d08b5
+Revises: b2d9e4f17a3c
+Create Date: 2026-10-19 09:31:07.640251
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a1e9d08b5'
+down_revision = 'b2d9e4f17a3c'
+branch_labels = None
+depends_on = None
+
+
+user = sa.table('user', sa.column('id', sa.Integer), sa.column('wallet_balance', sa.Float))
+wallet_entry = sa.table('wallet_entry', sa.column('user_id', sa.Integer), sa.column('amount_cents', sa.BigInteger),
+                        sa.column('kind', sa.String), sa.column('created_at', sa.DateTime))
+wallet_account = sa.table('wallet_account', sa.column('user_id', sa.Integer), sa.column('balance_cents', sa.BigInteger),
+                          sa.column('snapshot_cents', sa.BigInteger), sa.column('snapshot_entry_id', sa.Integer))
+
+
+def upgrade():
+    # if_not_exists: databases built with db.create_all() already have them
+    op.create_table('wallet_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('amount_cents', sa.BigInteger(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('transaction_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['transaction_id'], ['transaction.id'], name=op.f('fk_wallet_entry_transaction_id_transaction')),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_wallet_entry_user_id_user')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_wallet_entry')),
+    if_not_exists=True
+    )
+    op.create_index('ix_wallet_entry_user_id', 'wallet_entry', ['user_id', 'id'], if_not_exists=True)
+    op.create_table('wallet_account',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('balance_cents', sa.BigInteger(), nullable=False),
+    sa.Column('snapshot_cents', sa.BigInteger(), nullable=False),
+    sa.Column('snapshot_entry_id', sa.Integer(), nullable=False),
+    sa.Column('snapshot_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_wallet_account_user_id_user')),
+    sa.PrimaryKeyConstraint('user_id', name=op.f('pk_wallet_account')),
+    if_not_exists=True
+    )
+
+    # Legacy Float balances become opening entries, as `flask wallet init` does; users
+    # who already have an account are skipped, so running both is harmless
+    no_account = ~sa.select(wallet_account.c.user_id).where(wallet_account.c.user_id == user.c.id).exists()
+    opening = sa.cast(sa.func.round(sa.func.coalesce(user.c.wallet_balance, 0) * 100), sa.BigInteger)
+    op.execute(wallet_entry.insert().from_select(
+        ['user_id', 'amount_cents', 'kind', 'created_at'],
+        sa.select(user.c.id, opening, sa.literal('opening'), sa.literal(datetime.utcnow())).where(no_account, opening != 0),
+    ))
+    op.execute(wallet_account.insert().from_select(
+        ['user_id', 'balance_cents', 'snapshot_cents', 'snapshot_entry_id'],
+        sa.select(user.c.id, opening, sa.literal(0), sa.literal(0)).where(no_account),
+    ))
+
+
+def downgrade():
+    # Carry the ledger balances back to the legacy column before dropping the ledger
+    op.execute(user.update().values(wallet_balance=sa.func.coalesce(
+        sa.select(wallet_account.c.balance_cents).where(wallet_account.c.user_id == user.c.id).scalar_subquery() / 100.0,
+        user.c.wallet_balance,
+    )))
+    op.drop_table('wallet_account', if_exists=True)
+    op.drop_index('ix_wallet_entry_user_id', table_name='wallet_entry', if_exists=True)
+    op.drop_table('wallet_entry', if_exists=True)
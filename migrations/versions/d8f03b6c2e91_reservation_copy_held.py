@@ -0,0 +1,34 @@
+"""reservation.copy_held: copies set aside for approved reservations
+
+Revision ID: d8f03b6c2e91
+Revises: c47a1e9d08b5
+Create Date: 2026-10-19 10:02:38.911462
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f03b6c2e91'
+down_revision = 'c47a1e9d08b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing approved reservations keep their old meaning (false): issuing them takes a copy off the shelf
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('copy_held', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    # Held copies go back on the shelf, where the old code expects them
+    reservation = sa.table('reservation', sa.column('book_id', sa.Integer), sa.column('copy_held', sa.Boolean))
+    book = sa.table('book', sa.column('id', sa.Integer), sa.column('available_count', sa.Integer))
+    held = (sa.select(sa.func.count()).select_from(reservation)
+            .where(reservation.c.book_id == book.c.id, reservation.c.copy_held == sa.true())
+            .scalar_subquery())
+    op.execute(book.update().values(available_count=book.c.available_count + held))
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.drop_column('copy_held')
@@ -0,0 +1,33 @@
+"""book.rating_sum: integer running sum of review ratings
+
+Revision ID: e1b6c94a7f20
+Revises: d8f03b6c2e91
+Create Date: 2026-10-19 10:48:15.270934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b6c94a7f20'
+down_revision = 'd8f03b6c2e91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+
+    # Ratings are whole numbers, so rounding average * count recovers the sum;
+    # `flask reviews rebuild` recomputes it exactly from the review table
+    book = sa.table('book', sa.column('average_rating', sa.Float), sa.column('rating_count', sa.Integer),
+                    sa.column('rating_sum', sa.Integer))
+    op.execute(book.update().where(book.c.rating_count > 0).values(
+        rating_sum=sa.cast(sa.func.round(sa.func.coalesce(book.c.average_rating, 0) * book.c.rating_count), sa.Integer)))
+
+
+def downgrade():
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.drop_column('rating_sum')
@@ -0,0 +1,117 @@
+"""initial schema
+
+Revision ID: e5f77f4cab02
+Revises: 
+Create Date: 2026-01-28 10:12:44.118905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5f77f4cab02'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=64), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=False),
+    sa.Column('password_hash', sa.String(length=128), nullable=True),
+    sa.Column('role', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('full_name', sa.String(length=100), nullable=True),
+    sa.Column('contact_number', sa.String(length=20), nullable=True),
+    sa.Column('wallet_balance', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_user'))
+    )
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_email'), ['email'], unique=True)
+        batch_op.create_index(batch_op.f('ix_user_username'), ['username'], unique=True)
+
+    op.create_table('book',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('author', sa.String(length=100), nullable=False),
+    sa.Column('isbn', sa.String(length=20), nullable=True),
+    sa.Column('category', sa.String(length=50), nullable=True),
+    sa.Column('language', sa.String(length=30), nullable=True),
+    sa.Column('publication_year', sa.Integer(), nullable=True),
+    sa.Column('publisher', sa.String(length=100), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('cover_image', sa.String(length=200), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=True),
+    sa.Column('available_count', sa.Integer(), nullable=True),
+    sa.Column('price', sa.Float(), nullable=True),
+    sa.Column('pages', sa.Integer(), nullable=True),
+    sa.Column('average_rating', sa.Float(), nullable=True),
+    sa.Column('rating_count', sa.Integer(), nullable=True),
+    sa.Column('seller_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['seller_id'], ['user.id'], name=op.f('fk_book_seller_id_user')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_book'))
+    )
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_book_author'), ['author'], unique=False)
+        batch_op.create_index(batch_op.f('ix_book_category'), ['category'], unique=False)
+        batch_op.create_index(batch_op.f('ix_book_isbn'), ['isbn'], unique=True)
+        batch_op.create_index(batch_op.f('ix_book_title'), ['title'], unique=False)
+
+    op.create_table('reservation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], name=op.f('fk_reservation_book_id_book')),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_reservation_user_id_user')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_reservation'))
+    )
+    op.create_table('review',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('rating', sa.Integer(), nullable=True),
+    sa.Column('comment', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], name=op.f('fk_review_book_id_book')),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_review_user_id_user')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_review'))
+    )
+    op.create_table('transaction',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('issued_date', sa.DateTime(), nullable=True),
+    sa.Column('due_date', sa.DateTime(), nullable=True),
+    sa.Column('return_date', sa.DateTime(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('fine_amount', sa.Float(), nullable=True),
+    sa.Column('transaction_type', sa.String(length=20), nullable=True),
+    sa.Column('amount', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['book.id'], name=op.f('fk_transaction_book_id_book')),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_transaction_user_id_user')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_transaction'))
+    )
+
+
+def downgrade():
+    op.drop_table('transaction')
+    op.drop_table('review')
+    op.drop_table('reservation')
+    with op.batch_alter_table('book', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_book_title'))
+        batch_op.drop_index(batch_op.f('ix_book_isbn'))
+        batch_op.drop_index(batch_op.f('ix_book_category'))
+        batch_op.drop_index(batch_op.f('ix_book_author'))
+
+    op.drop_table('book')
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_username'))
+        batch_op.drop_index(batch_op.f('ix_user_email'))
+
+    op.drop_table('user')
@@ -0,0 +1,33 @@
+"""book_neighbors: precomputed similar books
+
+Revision ID: f3a8d5e6b412
+Revises: e1b6c94a7f20
+Create Date: 2026-10-19 11:20:44.085317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8d5e6b412'
+down_revision = 'e1b6c94a7f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # if_not_exists: databases built with db.create_all() already have it.
+    # Filled by `flask neighbors build`; until then book_details falls back to same-category books.
+    op.create_table('book_neighbors',
+    sa.Column('book_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('neighbor_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('book_id', 'rank', name=op.f('pk_book_neighbors')),
+    if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_table('book_neighbors', if_exists=True)
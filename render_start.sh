@@ -4,10 +4,19 @@
 echo "Initializing Database..."
 python -c "from app import create_app, db; app=create_app(); app.app_context().push(); db.create_all()"
 
+# Full-text search index (no-op if it already exists)
+flask --app run search init
+
+# Wallet accounts for users without one (no-op if all exist)
+flask --app run wallet init
+
 # Seed Data (Add books if empty)
 echo "Seeding Data..."
 python seed_data.py
 
+# Fingerprint and precompress static files once, before the workers start
+flask --app run assets build > /dev/null
+
 # Start Application
 echo "Starting Gunicorn..."
 gunicorn run:app
@@ -79,8 +79,10 @@ def seed_data():
                 existing_book.price = b_data['price'] # Ensure price is set
                 existing_book.pages = b_data['pages']
                 existing_book.average_rating = b_data['rating']
+                existing_book.rating_sum = round(b_data['rating'] * (existing_book.rating_count or 0))
             else:
                 print(f"Adding {b_data['title']}...")
+                rating_count = random.randint(10, 500)
                 book = Book(
                     title=b_data['title'],
                     author=b_data['author'],
@@ -90,7 +92,8 @@ def seed_data():
                     price=b_data['price'],
                     pages=b_data['pages'],
                     average_rating=b_data['rating'],
-                    rating_count=random.randint(10, 500),
+                    rating_count=rating_count,
+                    rating_sum=round(b_data['rating'] * rating_count),
                     quantity=random.randint(1, 10),
                     available_count=random.randint(1, 10),
                     description=f"A fantastic book about {b_data['category']}. Must read!",
@@ -0,0 +1,37 @@
+import pytest
+
+from app import create_app, db
+from app.models import User
+from config import Config
+
+
+def make_config(tmp_path, **overrides):
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "test.sqlite"}'
+        ASSET_FINGERPRINTS = False
+        COVER_WORKER_THREADS = 0
+
+    for name, value in overrides.items():
+        setattr(TestConfig, name, value)
+    return TestConfig
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(make_config(tmp_path))
+    with app.app_context():
+        db.create_all()
+        for name, role in [('lib', 'librarian'), ('a', 'user'), ('b', 'user'), ('c', 'user')]:
+            user = User(username=name, email=f'{name}@example.com', role=role)
+            user.set_password('pw')
+            db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def login(app, name):
+    client = app.test_client()
+    assert client.post('/auth/login', data={'email': f'{name}@example.com', 'password': 'pw'}).status_code == 302
+    return client
@@ -0,0 +1,91 @@
+import io
+import threading
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+from PIL import Image
+
+from app import covers, create_app, db
+from app.models import Book, Cover
+from conftest import make_config
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """Stub cover origin serving tmp_path/origin over HTTP on a free port."""
+    root = tmp_path / 'origin'
+    root.mkdir()
+    Image.new('RGB', (1200, 1800), (200, 40, 40)).save(root / 'cover.jpg', 'JPEG')
+    handler = partial(SimpleHTTPRequestHandler, directory=str(root))
+    handler.log_message = lambda *args: None
+    server = HTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(make_config(tmp_path, COVER_DIR=str(tmp_path / 'covers')))
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def add_book(source):
+    db.session.add(Book(title='Covered', author='A', isbn='9780000000004', cover_image=source))
+    db.session.commit()
+    return covers.cover_key(source)
+
+
+def test_cover_is_redirected_until_rendered_then_served_locally(app, origin):
+    source = f'{origin}/cover.jpg'
+    with app.app_context():
+        key = add_book(source)
+    client = app.test_client()
+
+    response = client.get(f'/covers/{key}/card')
+    assert response.status_code == 302 and response.location == source
+
+    with app.app_context():
+        assert covers.process_cover(key) == covers.READY
+
+    webp = client.get(f'/covers/{key}/card', headers={'Accept': 'image/webp,*/*'})
+    assert webp.status_code == 200 and webp.mimetype == 'image/webp'
+    assert webp.cache_control.max_age == 30 * 86400
+    assert 'Accept' in webp.vary
+    with Image.open(io.BytesIO(webp.data)) as image:
+        assert image.size[0] <= covers.SIZES['card'][0] and image.size[1] <= covers.SIZES['card'][1]
+
+    jpeg = client.get(f'/covers/{key}/large', headers={'Accept': 'image/jpeg'})
+    assert jpeg.status_code == 200 and jpeg.mimetype == 'image/jpeg'
+
+    cached = client.get(f'/covers/{key}/card', headers={'Accept': 'image/webp', 'If-None-Match': webp.headers['ETag']})
+    assert cached.status_code == 304
+
+
+def test_failed_fetch_keeps_redirecting(app, origin):
+    source = f'{origin}/missing.jpg'
+    with app.app_context():
+        key = add_book(source)
+        assert covers.process_cover(key) == covers.FAILED
+        assert 'HTTPError' in db.session.get(Cover, key).error
+    response = app.test_client().get(f'/covers/{key}/card')
+    assert response.status_code == 302 and response.location == source
+
+
+def test_work_skips_covers_deleted_meanwhile(app, origin, monkeypatch):
+    with app.app_context():
+        key = add_book(f'{origin}/cover.jpg')
+    process_cover = covers.process_cover
+
+    def delete_first(key):
+        db.session.execute(db.delete(Cover).where(Cover.key == key))
+        db.session.commit()
+        return process_cover(key)
+
+    monkeypatch.setattr(covers, 'process_cover', delete_first)
+    result = app.test_cli_runner().invoke(args=['covers', 'work'])
+    assert result.exit_code == 0, result.output
+    assert '0 covers ready, 0 failed.' in result.output
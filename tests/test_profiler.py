@@ -0,0 +1,25 @@
+import logging
+
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db, profiler
+
+
+def test_failed_statement_does_not_skew_the_next_timing(app):
+    with app.test_request_context('/'), db.engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text('SELECT * FROM no_such_table'))
+        conn.execute(text('SELECT 1'))
+        assert g.sql_count == 2
+        assert not conn.info.get('query_start')
+
+
+def test_slow_query_log_leaves_out_bound_values(app, monkeypatch, caplog):
+    monkeypatch.setitem(profiler._settings, 'threshold', 0.0)
+    with app.app_context(), caplog.at_level(logging.WARNING, logger=profiler.slow_query_log.name):
+        db.session.execute(text('SELECT :email, :n'), {'email': 'a@example.com', 'n': 1})
+    assert 'params=2 params (str, int)' in caplog.text
+    assert 'a@example.com' not in caplog.text
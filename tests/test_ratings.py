@@ -0,0 +1,55 @@
+import pytest
+
+from app import db, ratings
+from app.models import Book, Review, User
+from conftest import login
+
+
+@pytest.fixture
+def book_id(app):
+    with app.app_context():
+        book = Book(title='Rated', author='A', isbn='9780000000002', average_rating=4.5, rating_count=2, rating_sum=9)
+        db.session.add(book)
+        db.session.commit()
+        return book.id
+
+
+def aggregates(book_id):
+    book = db.session.get(Book, book_id)
+    return book.rating_sum, book.rating_count, book.average_rating
+
+
+def test_review_writes_move_the_aggregates_once(app, book_id):
+    a = login(app, 'a')
+    a.post(f'/user/book/{book_id}/review', data={'rating': 3})
+    a.post(f'/user/book/{book_id}/review', data={'rating': 5})
+    with app.app_context():
+        assert aggregates(book_id) == (14, 3, 14 / 3)
+        review = db.session.scalar(db.select(Review))
+        stale = Review(id=review.id, book_id=book_id, rating=3)
+
+        # A second edit that read the rating before the first one went through
+        assert not ratings.update_review(stale, 1, None)
+        assert ratings.delete_review(review)
+        db.session.commit()
+        # A double-submitted delete finds the row gone
+        assert not ratings.delete_review(stale)
+        db.session.commit()
+        assert aggregates(book_id) == (9, 2, 4.5)
+
+    response = a.post(f'/user/review/{review.id}/delete', follow_redirects=True)
+    assert response.status_code == 404
+
+
+def test_rebuild_keeps_catalogue_ratings_of_unreviewed_books(app, book_id):
+    with app.app_context():
+        reviewed = Book(title='Reviewed', author='A', isbn='9780000000003')
+        db.session.add(reviewed)
+        db.session.flush()
+        user_id = db.session.scalar(db.select(User.id).where(User.username == 'a'))
+        db.session.add(Review(user_id=user_id, book_id=reviewed.id, rating=4))
+        db.session.commit()
+
+        assert ratings.rebuild_ratings() == 1
+        assert aggregates(reviewed.id) == (4, 1, 4.0)
+        assert aggregates(book_id) == (9, 2, 4.5)
@@ -0,0 +1,76 @@
+import pytest
+
+from app import db
+from app.models import Book, Reservation, Transaction, User
+from app.stats import compute_stats, get_stats
+from conftest import login
+
+
+@pytest.fixture(autouse=True)
+def hot_book(app):
+    with app.app_context():
+        db.session.add(Book(title='Hot', author='A', isbn='9780000000001', quantity=1, available_count=1))
+        db.session.commit()
+
+
+def reservation_of(name):
+    return db.session.scalars(db.select(Reservation).join(User).where(User.username == name)).one()
+
+
+def test_returned_copy_is_held_for_next_waiter(app):
+    lib, a, b, c = (login(app, name) for name in ('lib', 'a', 'b', 'c'))
+    with app.app_context():
+        book_id = db.session.scalar(db.select(Book.id))
+
+    # a gets the only copy, b has to wait
+    a.post(f'/user/book/{book_id}/reserve')
+    b.post(f'/user/book/{book_id}/reserve')
+    with app.app_context():
+        assert reservation_of('a').status == 'approved' and reservation_of('b').status == 'pending'
+        assert db.session.get(Book, book_id).available_count == 0
+        assert get_stats() == compute_stats()
+        a_reservation = reservation_of('a').id
+    lib.get(f'/librarian/issue/{a_reservation}')
+
+    # a returns it: the copy goes to b, not back on the shelf
+    with app.app_context():
+        loan = db.session.scalar(db.select(Transaction.id))
+    lib.get(f'/librarian/return_confirm/{loan}')
+    with app.app_context():
+        assert reservation_of('b').status == 'approved' and reservation_of('b').copy_held
+        assert db.session.get(Book, book_id).available_count == 0
+        assert get_stats() == compute_stats()
+        b_reservation = reservation_of('b').id
+
+    # c comes later and must queue behind b instead of being approved
+    c.post(f'/user/book/{book_id}/reserve')
+    with app.app_context():
+        assert reservation_of('c').status == 'pending'
+
+    response = lib.get(f'/librarian/issue/{b_reservation}', follow_redirects=True)
+    assert b'Book issued to b' in response.data
+    with app.app_context():
+        assert reservation_of('b').status == 'fulfilled'
+        assert db.session.get(Book, book_id).available_count == 0
+        assert db.session.scalar(db.select(db.func.count()).select_from(Transaction)
+                                 .where(Transaction.status == 'issued')) == 1
+        assert get_stats() == compute_stats()
+
+
+def test_cancelled_hold_passes_copy_on(app):
+    lib, a, b = (login(app, name) for name in ('lib', 'a', 'b'))
+    with app.app_context():
+        book_id = db.session.scalar(db.select(Book.id))
+    a.post(f'/user/book/{book_id}/reserve')
+    b.post(f'/user/book/{book_id}/reserve')
+    with app.app_context():
+        a_reservation = reservation_of('a').id
+
+    lib.get(f'/librarian/cancel_reservation/{a_reservation}')
+    # Cancelling twice must not hand out a second copy
+    lib.get(f'/librarian/cancel_reservation/{a_reservation}')
+    with app.app_context():
+        assert reservation_of('a').status == 'cancelled' and not reservation_of('a').copy_held
+        assert reservation_of('b').status == 'approved' and reservation_of('b').copy_held
+        assert db.session.get(Book, book_id).available_count == 0
+        assert get_stats() == compute_stats()
@@ -0,0 +1,66 @@
+import shutil
+
+import pytest
+from sqlalchemy import text
+
+from app import create_app, db, routing
+from app.models import Book
+from conftest import make_config
+
+MMAP_SIZE = 4 * 2**20
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """App whose replicas are copies of the primary file, with 'Replica' books only they have."""
+    monkeypatch.setattr(routing, '_retry_at', {})
+    primary = tmp_path / 'test.sqlite'
+    app = create_app(make_config(tmp_path))
+    with app.app_context():
+        db.create_all()
+        db.session.add(Book(title='Primary', author='A', isbn='9780000000005'))
+        db.session.commit()
+        db.engine.dispose()
+    replica = tmp_path / 'replica.sqlite'
+    shutil.copy(primary, replica)
+    with db.create_engine(f'sqlite:///{replica}').begin() as conn:
+        conn.execute(db.update(Book).values(title='Replica'))
+
+    def make_app(*urls):
+        urls = [f'sqlite:///file:{replica}?mode=ro&uri=true' if url == 'up' else url for url in urls]
+        return create_app(make_config(tmp_path, REPLICA_URLS=urls, REPLICA_PIN_SECONDS=0,
+                                      SQLITE_MMAP_SIZE=MMAP_SIZE))
+    return make_app
+
+
+DOWN = 'sqlite:///file:/nonexistent/replica.sqlite?mode=ro&uri=true'
+
+
+def read_title(app, method='GET'):
+    with app.test_request_context('/', method=method):
+        app.preprocess_request()
+        return db.session.scalar(db.select(Book.title))
+
+
+def test_reads_of_get_requests_go_to_the_replica(make_app):
+    app = make_app('up')
+    assert read_title(app) == 'Replica'
+    assert read_title(app, 'POST') == 'Primary'
+
+
+def test_unreachable_replica_is_skipped(make_app):
+    app = make_app('up', DOWN)
+    assert {read_title(app) for _ in range(20)} == {'Replica'}
+    assert set(routing._retry_at) == {'replica1'}
+
+
+def test_all_replicas_down_falls_back_to_primary(make_app):
+    app = make_app(DOWN)
+    assert read_title(app) == 'Primary'
+    assert 'replica0' in routing._retry_at
+
+
+def test_replica_connections_get_the_sqlite_pragmas(make_app):
+    app = make_app('up')
+    with app.app_context(), app.extensions['replicas']['replica0'].connect() as conn:
+        assert conn.scalar(text('PRAGMA mmap_size')) == MMAP_SIZE